@@ -0,0 +1,120 @@
+"""
+Micro-benchmark AddressFormatter against the original str.replace implementation.
+
+Generates VISTA style residence addresses, checks both formatters produce identical output
+and reports records per second for each.
+
+python benchmark/formatter_benchmark.py --records 200000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from geocode_gcs_csv import AddressFormatter  # noqa: E402
+
+STREET_NAMES = ('MAIN', 'STATE', 'CENTER', 'REDWOOD', 'BANGERTER', 'HIGHLAND', 'VAN WINKLE', 'FORT UNION',
+                'O\'BRIEN', 'ST. MARY\'S', 'CAÑON', 'EL MONTE')
+STREET_TYPES = ('ST', 'RD', 'AVE', 'DR', 'LN', 'CIR', 'WAY', 'BLVD', 'HWY', '')
+DIRECTIONS = ('N', 'S', 'E', 'W', '')
+UNITS = ('', '', '', ' #{}', ' # {}', ' APT {}', ' UNIT {}', ' #{}B', ' SP {}')
+ZONES = ('SALT LAKE CITY', 'WEST VALLEY CITY', 'SANDY', 'MURRAY', 'S. SALT LAKE', 'HOLLADAY', 'TAYLORSVILLE',
+         '84101', '84047', '84121-1234', ' 84070 ', 'COTTONWOOD HTS.')
+
+
+def legacy_format_address(inAddr):
+    """AddressFormatter._formatAddress before the translation table."""
+    addrString = str(inAddr)
+
+    formattedAddr = AddressFormatter.spaceReplaceMatcher.sub(" ", addrString)
+
+    for c in range(0, 31):
+        formattedAddr = formattedAddr.replace(chr(c), " ")
+    for c in range(33, 37):
+        formattedAddr = formattedAddr.replace(chr(c), " ")
+
+    formattedAddr = formattedAddr.replace(chr(38), "and")
+
+    for c in range(39, 47):
+        formattedAddr = formattedAddr.replace(chr(c), " ")
+    for c in range(58, 64):
+        formattedAddr = formattedAddr.replace(chr(c), " ")
+    for c in range(91, 96):
+        formattedAddr = formattedAddr.replace(chr(c), " ")
+    for c in range(123, 255):
+        formattedAddr = formattedAddr.replace(chr(c), " ")
+
+    return formattedAddr
+
+
+def iter_vista_records(count, seed=0):
+    """Generate (id, address, zone) tuples that look like VISTA residence addresses."""
+    rand = random.Random(seed)
+    for residence_id in range(count):
+        house = rand.choice(('{}', '{} 1/2', '{}-A', '{}')).format(rand.randint(1, 14000))
+        street = ' '.join(part for part in (rand.choice(DIRECTIONS),
+                                            str(rand.randint(1, 13000)) + ' ' + rand.choice(DIRECTIONS)
+                                            if rand.random() < 0.6 else rand.choice(STREET_NAMES),
+                                            rand.choice(STREET_TYPES)) if part)
+        address = '{} {}{}'.format(house, street, rand.choice(UNITS).format(rand.randint(1, 400)))
+        noise = rand.random()
+        if noise < 0.02:
+            address = address.replace(' ', '\t', 1)
+        elif noise < 0.04:
+            address = address + ' & ' + rand.choice(STREET_NAMES)
+        elif noise < 0.05:
+            address = address + '?%'
+        yield residence_id, address, rand.choice(ZONES)
+
+
+def vista_records(count, seed=0):
+    """List of count generated VISTA records."""
+    return list(iter_vista_records(count, seed))
+
+
+def time_records_per_second(format_function, records, repeat):
+    """Best records per second over repeat runs."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        format_function(records)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return len(records) / best
+
+
+def legacy_format_records(records):
+    return [legacy_format_address(address) for _, address, _ in records]
+
+
+def translate_format_records(records):
+    formatter = AddressFormatter.__new__(AddressFormatter)
+    return [formatter._formatAddress(address) for _, address, _ in records]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark address formatting')
+    parser.add_argument('--records', action='store', dest='records', type=int, default=100000,
+                        help='Number of synthetic addresses.')
+    parser.add_argument('--repeat', action='store', dest='repeat', type=int, default=3,
+                        help='Runs per formatter. The best run is reported.')
+    args = parser.parse_args()
+
+    records = vista_records(args.records)
+    mismatches = sum(1 for legacy, fast in zip(legacy_format_records(records), translate_format_records(records))
+                     if legacy != fast)
+    if mismatches:
+        print('{} addresses differ from the legacy formatter'.format(mismatches))
+        sys.exit(1)
+
+    legacy_rate = time_records_per_second(legacy_format_records, records, args.repeat)
+    translate_rate = time_records_per_second(translate_format_records, records, args.repeat)
+    batch_rate = time_records_per_second(AddressFormatter.formatRecords, records, args.repeat)
+    print('records               {}'.format(len(records)))
+    print('legacy _formatAddress {:,.0f} records/sec'.format(legacy_rate))
+    print('translate table       {:,.0f} records/sec ({:.1f}x)'.format(translate_rate, translate_rate / legacy_rate))
+    print('formatRecords         {:,.0f} records/sec (address and zone)'.format(batch_rate))
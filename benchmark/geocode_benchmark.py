@@ -0,0 +1,232 @@
+"""
+End to end throughput benchmark for TableGeocoder against the local stub api.
+
+Starts benchmark/stub_api.py in its own process, generates synthetic VISTA CSVs and geocodes each one in a
+fresh process so peak RSS is per run. Reports rows/sec, request latency percentiles and peak RSS and appends
+every run to a json lines file so runs can be compared.
+
+python benchmark/geocode_benchmark.py --rows 10000 100000 --workers 8 --label workers-8
+python benchmark/geocode_benchmark.py --compare
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, '..'))
+sys.path.insert(0, BENCHMARK_DIR)
+
+from formatter_benchmark import iter_vista_records  # noqa: E402
+from stub_api import add_stub_arguments  # noqa: E402
+
+ID_FIELD = 'UNIQUE_ID'
+ADDRESS_FIELD = 'VISTA_ADDRESS'
+ZONE_FIELD = 'VISTA_CITY'
+
+
+def percentile(sorted_values, percent):
+    """Nearest rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, int(round(percent / 100.0 * len(sorted_values))) - 1)
+
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def synthetic_csv(data_dir, rows, seed=0):
+    """Path to a generated input CSV with rows addresses, created if it does not exist."""
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+    path = os.path.join(data_dir, 'vista_{}_{}.csv'.format(rows, seed))
+    if not os.path.exists(path):
+        with open(path + '.tmp', 'w', newline='') as out_csv:
+            writer = csv.writer(out_csv)
+            writer.writerow((ID_FIELD, ADDRESS_FIELD, ZONE_FIELD))
+            writer.writerows(iter_vista_records(rows, seed))
+        os.rename(path + '.tmp', path)
+
+    return path
+
+
+def free_port():
+    """Find an unused local port for the stub api."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_stub(args):
+    """Run the stub api in its own process so it does not share the geocoder's GIL."""
+    port = free_port()
+    command = [sys.executable, os.path.join(BENCHMARK_DIR, 'stub_api.py'), '--port', str(port),
+               '--latency', args.latency,
+               '--not_found_rate', str(args.not_found_rate),
+               '--error_rate', str(args.error_rate),
+               '--burst_every', str(args.burst_every),
+               '--burst_seconds', str(args.burst_seconds),
+               '--zone_warmup', str(args.zone_warmup),
+               '--zone_cache', str(args.zone_cache)]
+    stub = subprocess.Popen(command, stdout=subprocess.PIPE, universal_newlines=True)
+    stub.stdout.readline()
+
+    return stub, 'http://127.0.0.1:{}/'.format(port)
+
+
+def run_geocode(options, results):
+    """Geocode one input CSV. Runs in a child process and puts a result dict on the results queue."""
+    import logging
+    import geocode_gcs_csv
+
+    latencies = []
+
+    class RecordingRateLimiter(geocode_gcs_csv.RateLimiter):
+        """Rate limiter that also keeps every request latency."""
+
+        def report(self, latency, status):
+            latencies.append(latency)
+            super(RecordingRateLimiter, self).report(latency, status)
+
+    geocode_gcs_csv.GEOCODE_HOST = options['host']
+    geocode_gcs_csv.RateLimiter = RecordingRateLimiter
+    logging.getLogger('geocoder').addHandler(logging.NullHandler())
+
+    output_dir = options['output_dir']
+    output_name = 'bench_{}.csv'.format(os.getpid())
+    tool = geocode_gcs_csv.TableGeocoder('benchmark', options['input'], ID_FIELD, ADDRESS_FIELD, ZONE_FIELD,
+                                         'all', 26912, output_dir, output_name, None,
+                                         workers=options['workers'],
+                                         batchSize=options['batch_size'],
+                                         cacheSize=options['cache_size'],
+                                         formatProcesses=options['format_processes'],
+                                         zoneWindow=options['zone_window'],
+                                         initialRate=options['initial_rate'],
+                                         maxRate=options['max_rate'])
+    start = time.perf_counter()
+    completed = tool.start()
+    seconds = time.perf_counter() - start
+    if os.path.exists(os.path.join(output_dir, output_name)):
+        os.remove(os.path.join(output_dir, output_name))
+
+    latencies.sort()
+    results.put({'completed': bool(completed),
+                 'seconds': round(seconds, 3),
+                 'rows_per_sec': round(options['rows'] / seconds, 1),
+                 'requests': len(latencies),
+                 'latency_p50_ms': round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+                 'latency_p95_ms': round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+                 'latency_p99_ms': round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+                 'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)})
+
+
+def git_commit():
+    """Short hash of the checked out commit or None."""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARK_DIR,
+                                       stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results_path):
+    """Print every stored run grouped by row count."""
+    with open(results_path) as results_file:
+        runs = [json.loads(line) for line in results_file if line.strip()]
+    #: runs stored before incomplete runs were skipped
+    runs = [run for run in runs if run.get('completed', True)]
+    columns = ('label', 'commit', 'workers', 'batch_size', 'zone_window', 'latency', 'rows_per_sec',
+               'latency_p50_ms', 'latency_p95_ms', 'latency_p99_ms', 'peak_rss_mb')
+    for rows in sorted(set(run['rows'] for run in runs)):
+        print('\n{:,} rows'.format(rows))
+        print('  '.join('{:>14}'.format(column) for column in columns))
+        for run in runs:
+            if run['rows'] == rows:
+                print('  '.join('{:>14}'.format(str(run.get(column))) for column in columns))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark TableGeocoder against the stub api')
+    parser.add_argument('--rows', action='store', dest='rows', type=int, nargs='+', default=[10000],
+                        help='Input sizes to benchmark.')
+    parser.add_argument('--label', action='store', dest='label', default='',
+                        help='Name stored with the results to tell runs apart.')
+    parser.add_argument('--results', action='store', dest='results', default='benchmark_results.jsonl',
+                        help='Json lines file results are appended to.')
+    parser.add_argument('--data_dir', action='store', dest='data_dir', default=os.path.join('tmp', 'benchmark'),
+                        help='Directory for generated input CSVs and output.')
+    parser.add_argument('--compare', action='store_true', dest='compare',
+                        help='Print the stored results instead of running.')
+    parser.add_argument('--workers', action='store', dest='workers', type=int, default=1)
+    parser.add_argument('--batch_size', action='store', dest='batch_size', type=int, default=1)
+    parser.add_argument('--cache_size', action='store', dest='cache_size', type=int, default=0)
+    parser.add_argument('--zone_window', action='store', dest='zone_window', type=int, default=0)
+    parser.add_argument('--format_processes', action='store', dest='format_processes', type=int, default=0)
+    parser.add_argument('--initial_rate', action='store', dest='initial_rate', type=float, default=40)
+    parser.add_argument('--max_rate', action='store', dest='max_rate', type=float, default=None,
+                        help='Rate limiter ceiling. No ceiling by default.')
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.results)
+        sys.exit(0)
+
+    stub, host = start_stub(args)
+    context = multiprocessing.get_context('spawn')
+    try:
+        for rows in args.rows:
+            options = {'host': host,
+                       'input': synthetic_csv(args.data_dir, rows),
+                       'output_dir': args.data_dir,
+                       'rows': rows,
+                       'workers': args.workers,
+                       'batch_size': args.batch_size,
+                       'cache_size': args.cache_size,
+                       'format_processes': args.format_processes,
+                       'zone_window': args.zone_window,
+                       'initial_rate': args.initial_rate,
+                       'max_rate': args.max_rate}
+            results = context.Queue()
+            child = context.Process(target=run_geocode, args=(options, results))
+            child.start()
+            child.join()
+            if results.empty():
+                print('{:,} rows failed, see the output above'.format(rows))
+                continue
+            result = results.get()
+            if not result['completed']:
+                print('{:,} rows did not complete, the run is not recorded'.format(rows))
+                continue
+
+            run = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'label': args.label,
+                   'commit': git_commit(),
+                   'rows': rows,
+                   'workers': args.workers,
+                   'batch_size': args.batch_size,
+                   'cache_size': args.cache_size,
+                   'format_processes': args.format_processes,
+                   'initial_rate': args.initial_rate,
+                   'max_rate': args.max_rate,
+                   'latency': args.latency,
+                   'not_found_rate': args.not_found_rate,
+                   'error_rate': args.error_rate,
+                   'burst_every': args.burst_every,
+                   'burst_seconds': args.burst_seconds,
+                   'zone_window': args.zone_window,
+                   'zone_warmup': args.zone_warmup,
+                   'zone_cache': args.zone_cache}
+            run.update(result)
+            with open(args.results, 'a') as results_file:
+                results_file.write(json.dumps(run) + '\n')
+            print('{rows:>9,} rows  {rows_per_sec:>9,.1f} rows/sec  p50 {latency_p50_ms} ms  p95 {latency_p95_ms} ms  '
+                  'p99 {latency_p99_ms} ms  peak rss {peak_rss_mb} MB'.format(**run))
+    finally:
+        stub.terminate()
+        stub.wait()
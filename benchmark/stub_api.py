@@ -0,0 +1,251 @@
+"""
+Local stand-in for the geocoding web API.
+
+Serves api/v1/geocode/{street}/{zone} and the api/v1/geocode/multiple batch endpoint with
+configurable latency, not found rate, random 5xx errors and periodic 5xx bursts.
+A per zone warm up cost models the api's locator lookups: a zone that is not one of the
+zone_cache most recently requested zones adds zone_warmup seconds to the request.
+
+python benchmark/stub_api.py --port 8080 --latency lognormal:0.03,0.5 --not_found_rate 0.05
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib import parse
+
+NOT_FOUND_MESSAGE = 'No address candidates found with a score of 70 or better.'
+#: address Geocoder.isApiKeyValid checks, always answered so a benchmark run is not aborted at the start
+API_KEY_CHECK_ADDRESS = ('270 E CENTER ST', 'LINDON')
+
+
+class LatencyDistribution(object):
+    """
+    Response latency in seconds parsed from a spec string.
+
+    fixed:SECONDS, uniform:LOW,HIGH, exponential:MEAN or lognormal:MEDIAN,SIGMA
+    """
+
+    def __init__(self, spec):
+        """ctor."""
+        self.spec = spec
+        kind, _, values = spec.partition(':')
+        self._kind = kind
+        self._values = [float(v) for v in values.split(',') if v]
+        if kind not in ('fixed', 'uniform', 'exponential', 'lognormal'):
+            raise ValueError('Unknown latency distribution {}'.format(spec))
+
+    def sample(self, rand):
+        """Draw a latency."""
+        if self._kind == 'fixed':
+            return self._values[0]
+        elif self._kind == 'uniform':
+            return rand.uniform(self._values[0], self._values[1])
+        elif self._kind == 'exponential':
+            return rand.expovariate(1 / self._values[0])
+
+        return rand.lognormvariate(math.log(self._values[0]), self._values[1])
+
+
+class StubConfig(object):
+    """Behaviour of the stub api."""
+
+    def __init__(self, latency='fixed:0.02', not_found_rate=0.05, error_rate=0.0, burst_every=0, burst_seconds=0,
+                 seed=0, zone_warmup=0.0, zone_cache=4):
+        """ctor."""
+        self.latency = LatencyDistribution(latency)
+        self.not_found_rate = not_found_rate
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_seconds = burst_seconds
+        self.seed = seed
+        self.zone_warmup = zone_warmup
+        self.zone_cache = zone_cache
+
+
+class StubGeocodeServer(ThreadingMixIn, HTTPServer):
+    """Threaded http server holding the stub config and request counters."""
+
+    daemon_threads = True
+
+    def __init__(self, address, config):
+        """ctor."""
+        HTTPServer.__init__(self, address, StubGeocodeHandler)
+        self.config = config
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.cold_zones = 0
+        self._warm_zones = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def random(self):
+        """Per thread random generator so handlers do not contend on a lock."""
+        rand = getattr(self._local, 'rand', None)
+        if rand is None:
+            rand = self._local.rand = random.Random(self.config.seed + threading.get_ident())
+
+        return rand
+
+    def count(self, error=False):
+        """Count a request."""
+        with self._lock:
+            self.requests += 1
+            if error:
+                self.errors += 1
+
+    def warmup(self, zones):
+        """Seconds spent warming up the zones of a request that are not in the warm zone cache."""
+        if self.config.zone_warmup <= 0:
+            return 0
+        cold = 0
+        with self._lock:
+            for zone in set(zones):
+                if zone in self._warm_zones:
+                    self._warm_zones.move_to_end(zone)
+                    continue
+                cold += 1
+                self._warm_zones[zone] = True
+                while len(self._warm_zones) > self.config.zone_cache:
+                    self._warm_zones.popitem(last=False)
+            self.cold_zones += cold
+
+        return cold * self.config.zone_warmup
+
+    def in_burst(self):
+        """True while a 5xx burst is in progress."""
+        config = self.config
+        if config.burst_every <= 0:
+            return False
+
+        return (time.time() - self.started) % config.burst_every < config.burst_seconds
+
+
+class StubGeocodeHandler(BaseHTTPRequestHandler):
+    """Geocode request handler."""
+
+    protocol_version = 'HTTP/1.1'
+    #: buffer writes so headers and body go out together and are not held back by Nagle
+    wbufsize = -1
+
+    def log_message(self, format, *args):
+        """Silence per request logging."""
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        self.wfile.flush()
+
+    def _fail(self, rand, zones):
+        """Sleep for the modeled latency. Returns True if the request should fail with a 5xx."""
+        time.sleep(self.server.config.latency.sample(rand) + self.server.warmup(zones))
+        failed = self.server.in_burst() or rand.random() < self.server.config.error_rate
+        self.server.count(failed)
+        if failed:
+            self._send(503, {'status': 503, 'message': 'Service unavailable'})
+
+        return failed
+
+    def _geocode(self, street, zone, rand):
+        """Result for a single address or None when it is not found. Without rand the address is always found."""
+        if street == '' or (rand is not None and rand.random() < self.server.config.not_found_rate):
+            return None
+        digest = hash((street, zone))
+
+        return {'location': {'x': 420000 + digest % 20000 + 0.5, 'y': 4500000 + (digest >> 16) % 20000 + 0.25},
+                'score': 100 if digest % 5 else 88.5,
+                'locator': 'AddressPoints.AddressGrid' if digest % 3 else 'Centerlines.StatewideRoads',
+                'matchAddress': '{}, {}'.format(street, zone),
+                'inputAddress': '{}, {}'.format(street, zone),
+                'addressGrid': zone}
+
+    def do_GET(self):
+        """Single address geocode."""
+        rand = self.server.random()
+        parts = parse.urlsplit(self.path).path.split('/')
+        street, zone = parse.unquote(parts[-2]), parse.unquote(parts[-1])
+        if (street, zone) == API_KEY_CHECK_ADDRESS:
+            self._send(200, {'status': 200, 'result': self._geocode(street, zone, None)})
+            return
+        if self._fail(rand, [zone]):
+            return
+        result = self._geocode(street, zone, rand)
+        if result is None:
+            self._send(404, {'status': 404, 'message': NOT_FOUND_MESSAGE})
+        else:
+            self._send(200, {'status': 200, 'result': result})
+
+    def do_POST(self):
+        """Multiple address geocode."""
+        length = int(self.headers['Content-Length'])
+        body = json.loads(self.rfile.read(length).decode('utf-8'))
+        rand = self.server.random()
+        if self._fail(rand, [address['zone'] for address in body['addresses']]):
+            return
+        addresses = []
+        for address in body['addresses']:
+            result = self._geocode(address['street'], address['zone'], rand)
+            if result is None:
+                result = {'errorMessage': NOT_FOUND_MESSAGE}
+            result['id'] = address['id']
+            addresses.append(result)
+        self._send(200, {'status': 200, 'result': {'addresses': addresses}})
+
+
+def serve(config, host='127.0.0.1', port=0):
+    """Start the stub api on a background thread and return the server."""
+    server = StubGeocodeServer((host, port), config)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    return server
+
+
+def add_stub_arguments(parser):
+    """Add stub config options to an argument parser."""
+    parser.add_argument('--latency', action='store', dest='latency', default='fixed:0.02',
+                        help='Latency distribution. fixed:S, uniform:LOW,HIGH, exponential:MEAN, lognormal:MEDIAN,SIGMA')
+    parser.add_argument('--not_found_rate', action='store', dest='not_found_rate', type=float, default=0.05,
+                        help='Fraction of addresses answered with a 404.')
+    parser.add_argument('--error_rate', action='store', dest='error_rate', type=float, default=0.0,
+                        help='Fraction of requests answered with a 503.')
+    parser.add_argument('--burst_every', action='store', dest='burst_every', type=float, default=0,
+                        help='Seconds between 5xx bursts. 0 disables bursts.')
+    parser.add_argument('--burst_seconds', action='store', dest='burst_seconds', type=float, default=0,
+                        help='Length of each 5xx burst in seconds.')
+    parser.add_argument('--zone_warmup', action='store', dest='zone_warmup', type=float, default=0.0,
+                        help='Seconds added to a request for each zone that is not warm. 0 disables the model.')
+    parser.add_argument('--zone_cache', action='store', dest='zone_cache', type=int, default=4,
+                        help='Number of most recently requested zones that are warm.')
+
+
+def config_from_args(args):
+    """Build a StubConfig from parsed stub arguments."""
+    return StubConfig(args.latency, args.not_found_rate, args.error_rate, args.burst_every, args.burst_seconds,
+                      zone_warmup=args.zone_warmup, zone_cache=args.zone_cache)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stub geocoding web API')
+    parser.add_argument('--host', action='store', dest='host', default='127.0.0.1')
+    parser.add_argument('--port', action='store', dest='port', type=int, default=8080)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    server = StubGeocodeServer((args.host, args.port), config_from_args(args))
+    print('Stub geocode api listening on http://{}:{}/'.format(*server.server_address), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -1,14 +1,29 @@
 """
 Script tool for ArcGIS which geocodes a table of addresses and produces a new table of the results.
 """
-from urllib import parse, request, error
+from urllib import parse, request
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from array import array
 import csv
+import gzip
+import http.client
+import http.server
+import io
+import itertools
 import json
+import math
+import multiprocessing
 import os
+import queue
+import shutil
+import socket
+import threading
 import time
 import random
 import re
-from google.cloud import storage
+import sqlite3
+import uuid
 import logging
 import sys
 import argparse
@@ -16,10 +31,226 @@ import argparse
 VERSION_NUMBER = "4.0.0"
 BRANCH = "pro-python-3"
 VERSION_CHECK_URL = "https://raw.githubusercontent.com/agrc/geocoding-toolbox/{}/tool-version.json".format(BRANCH)
-RATE_LIMIT_SECONDS = (0.015, 0.03)
+VERSION_CHECK_TIMEOUT_SECONDS = 5
+INITIAL_RATE_PER_SECOND = 40
+MAX_RATE_PER_SECOND = None
+MIN_RATE_PER_SECOND = 1
+RATE_ADJUST_SECONDS = 1
+RATE_INCREASE_PER_SECOND = 5
+RATE_SLOW_START_FACTOR = 2.0
+RATE_UTILIZATION_THRESHOLD = 0.5
+RATE_DECREASE_FACTOR = 0.7
+RATE_LATENCY_TOLERANCE = 2.0
+RATE_ERROR_THRESHOLD = 0.05
+RATE_BASELINE_DECAY = 0.1
+DISPATCH_WINDOW_PER_WORKER = 4
+READ_CHUNK_ROWS = 1000
+READ_AHEAD_CHUNKS = 8
+FORMAT_WINDOW_PER_PROCESS = 2
+POOL_SIZE = 10
+POOL_IDLE_TIMEOUT_SECONDS = 30
+REQUEST_TIMEOUT_SECONDS = 30
+MAX_BATCH_SIZE = 100
+FLUSH_ROWS = 1000
+FLUSH_SECONDS = 5
+WRITE_BUFFER_BYTES = 1024 * 1024
+CACHE_SIZE = 10000
+RESULT_STORE_TTL_DAYS = 90
+RESULT_STORE_MAX_ENTRIES = 5000000
+RESULT_STORE_COMMIT_ROWS = 1000
+RESULT_STORE_UPLOAD_ATTEMPTS = 10
+CHECKPOINT_ROWS = 50000
+PARQUET_ROW_GROUP_ROWS = 100000
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+STREAM_CHUNK_BYTES = 8 * 1024 * 1024
+STREAM_READ_AHEAD_CHUNKS = 4
+STREAM_CHUNK_RETRIES = 3
+LOCAL_BUCKET_DIR = None
+UPLOAD_PART_BYTES = 32 * 1024 * 1024
+SHARD_SCAN_BYTES = 64 * 1024
+LEASE_CHUNK_BYTES = 4 * 1024 * 1024
+LEASE_SECONDS = 300
+COORDINATOR_PORT = 8000
+COORDINATOR_POLL_SECONDS = 5
+COORDINATOR_LOG_SECONDS = 30
+COORDINATOR_LINGER_SECONDS = 60
+COORDINATOR_TIMEOUT_SECONDS = 10
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+WAIT_BUCKETS = (0,) + LATENCY_BUCKETS
+FAST_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1)
+MAX_COMPOSE_SOURCES = 32
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_OPEN_SECONDS = 2
+CIRCUIT_MAX_OPEN_SECONDS = 60
+MAX_OUTAGE_SECONDS = 900
+RETRY_BUDGET_RATIO = 0.1
+RETRY_BUDGET_MIN = 100
+DEFERRED_RETRY_PASSES = 3
 UNIQUE_RUN = time.strftime("%Y%m%d%H%M%S")
 GEOCODE_HOST = 'http://webapi-api/'
 
+log = logging.getLogger('geocoder')
+
+
+class Histogram(object):
+    """Cumulative bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets):
+        """ctor."""
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """Add a value."""
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding quantile q, None above the last bucket."""
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+
+        return None
+
+
+class Metrics(object):
+    """
+    Counters, gauges and histograms for the geocoding hot path.
+
+    Recorded from any thread. Exposed as Prometheus text by prometheus and as a json friendly dict by summary.
+    """
+
+    def __init__(self):
+        """ctor."""
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Clear every metric."""
+        with self._lock:
+            self._counters = OrderedDict()
+            self._gauges = OrderedDict()
+            self._histograms = OrderedDict()
+            self._started = time.time()
+
+    @staticmethod
+    def _key(name, labels):
+        if not labels:
+            return name
+        return "{}{{{}}}".format(name, ",".join('{}="{}"'.format(k, v) for k, v in sorted(labels.items())))
+
+    def increment(self, name, value=1, **labels):
+        """Add to a counter."""
+        key = Metrics._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """Set a gauge."""
+        key = Metrics._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS):
+        """Add a value to a histogram."""
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram(buckets)
+            histogram.observe(value)
+
+    def counter(self, name, **labels):
+        """Current value of a counter."""
+        with self._lock:
+            return self._counters.get(Metrics._key(name, labels), 0)
+
+    def seconds(self):
+        """Seconds since the metrics were reset."""
+        return time.time() - self._started
+
+    def prometheus(self):
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for kind, values in (("counter", self._counters), ("gauge", self._gauges)):
+                typed = set()
+                for key, value in sorted(values.items()):
+                    name = key.split("{")[0]
+                    if name not in typed:
+                        lines.append("# TYPE {} {}".format(name, kind))
+                        typed.add(name)
+                    lines.append("{} {}".format(key, value))
+            for name, histogram in self._histograms.items():
+                lines.append("# TYPE {} histogram".format(name))
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append('{}_bucket{{le="{}"}} {}'.format(name, bound, cumulative))
+                lines.append('{}_bucket{{le="+Inf"}} {}'.format(name, histogram.count))
+                lines.append("{}_sum {}".format(name, histogram.sum))
+                lines.append("{}_count {}".format(name, histogram.count))
+
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Every metric as a dict, with approximate quantiles for histograms."""
+        with self._lock:
+            histograms = OrderedDict()
+            for name, histogram in self._histograms.items():
+                histograms[name] = {"count": histogram.count,
+                                    "sum": round(histogram.sum, 6),
+                                    "mean": round(histogram.sum / histogram.count, 6) if histogram.count else None,
+                                    "p50": histogram.quantile(0.5),
+                                    "p95": histogram.quantile(0.95),
+                                    "p99": histogram.quantile(0.99)}
+
+            return {"seconds": round(self.seconds(), 3),
+                    "counters": OrderedDict(self._counters),
+                    "gauges": OrderedDict(self._gauges),
+                    "histograms": histograms}
+
+
+metrics = Metrics()
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """Serve metrics in the Prometheus text format."""
+
+    def do_GET(self):
+        """Metrics endpoint."""
+        data = metrics.prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        """Do not log scrapes."""
+        pass
+
+
+def serve_metrics(port):
+    """Serve /metrics on a daemon thread."""
+    server = http.server.HTTPServer(("", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
 
 def api_retry(api_call):
     """Retry and api call if calling method returns None."""
@@ -27,6 +258,7 @@ def api_retry(api_call):
         response = api_call(*args, **kwargs)
         back_off = 1
         while response is None and back_off <= 8:
+            metrics.increment("api_retries_total", call=api_call.__name__)
             time.sleep(back_off + random.random())
             response = api_call(*args, **kwargs)
             back_off += back_off
@@ -38,7 +270,7 @@ def api_retry(api_call):
 def get_version(check_url):
     """Get current version number."""
     try:
-        r = request.urlopen(check_url)
+        r = request.urlopen(check_url, timeout=VERSION_CHECK_TIMEOUT_SECONDS)
         response = json.load(r)
     except:
         return None
@@ -49,6 +281,217 @@ def get_version(check_url):
         return None
 
 
+def log_version_check(check_url):
+    """Log when a newer version is available."""
+    currentVersion = get_version(check_url)
+    if currentVersion and VERSION_NUMBER != currentVersion:
+        log.info('Current version is: {}'.format(currentVersion))
+        log.info('Please download at: https://github.com/agrc/geocoding-toolbox/raw/{}/AGRC Geocode Tools.tbx'.format(BRANCH))
+
+
+def _copyFuture(source, target):
+    """Copy the outcome of a finished future onto another future."""
+    if target.done():
+        return
+    elif source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+def check_api_key(apiKey):
+    """Check an api key on a background thread. Returns a Future of the isApiKeyValid message."""
+    future = Future()
+
+    def check():
+        connectionPool = ConnectionPool(1)
+        try:
+            future.set_result(Geocoder(apiKey, None, None, connectionPool).isApiKeyValid())
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            connectionPool.close()
+
+    threading.Thread(target=check, daemon=True).start()
+
+    return future
+
+
+class PhaseTimer(object):
+    """Log the seconds spent in each startup phase."""
+
+    def __init__(self):
+        """ctor."""
+        self._last = time.time()
+
+    def lap(self, phase):
+        """End a phase."""
+        now = time.time()
+        log.info('Startup %s %.3f seconds', phase, now - self._last)
+        metrics.set('startup_phase_seconds', round(now - self._last, 3), phase=phase)
+        self._last = now
+
+
+class StageProfiler(object):
+    """
+    Wall and CPU seconds spent in each stage of a geocoding run, and an optional cProfile of the main thread.
+
+    Stage times are exclusive. A stage called from inside another stage on the same thread, like json parse inside
+    geocode, is subtracted from the outer stage. CPU seconds are for the calling thread, so the gap between wall
+    and CPU seconds is time spent waiting on the api, the input or the other stages.
+    A stage's times are summed over the threads that ran it, so with several workers they are thread-seconds and
+    can be longer than the run. Its utilisation is those seconds over the run wall time times its threads.
+    With sampleBlocks the main thread is profiled for one block of 1000 rows out of every sampleBlocks blocks.
+    """
+
+    def __init__(self, sampleBlocks=0):
+        """ctor."""
+        self._sampleBlocks = sampleBlocks
+        self._profile = None
+        if sampleBlocks > 0:
+            import cProfile
+
+            self._profile = cProfile.Profile()
+        self._sampling = False
+        self.sampledBlocks = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        #: stage totals of each thread, merged in summary
+        self._threadTotals = []
+        self._started = None
+        self._wall = 0
+        self._cpu = 0
+
+    def _totals(self):
+        totals = getattr(self._local, "totals", None)
+        if totals is None:
+            totals = self._local.totals = {}
+            self._local.children = []
+            with self._lock:
+                self._threadTotals.append(totals)
+
+        return totals
+
+    def wrap(self, stage, function):
+        """Wrap function so each call is timed as stage."""
+        def profiled(*args, **kwargs):
+            totals = self._totals()
+            children = self._local.children
+            children.append([0.0, 0.0])
+            wall = time.perf_counter()
+            cpu = time.thread_time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                wall = time.perf_counter() - wall
+                cpu = time.thread_time() - cpu
+                childWall, childCpu = children.pop()
+                if children:
+                    children[-1][0] += wall
+                    children[-1][1] += cpu
+                stageTotals = totals.get(stage)
+                if stageTotals is None:
+                    stageTotals = totals[stage] = [0, 0.0, 0.0]
+                stageTotals[0] += 1
+                stageTotals[1] += wall - childWall
+                stageTotals[2] += cpu - childCpu
+
+        return profiled
+
+    def iterate(self, stage, iterable):
+        """Yield from iterable, timing each item as stage."""
+        nextItem = self.wrap(stage, next)
+        iterator = iter(iterable)
+        while True:
+            try:
+                item = nextItem(iterator)
+            except StopIteration:
+                return
+            yield item
+
+    def start(self):
+        """Start timing the run."""
+        self._started = (time.perf_counter(), time.process_time())
+        self.sample(0)
+
+    def sample(self, block):
+        """Turn the cProfile on or off for a block of rows. Called on the main thread."""
+        if self._profile is None:
+            return
+        sampling = block % self._sampleBlocks == 0
+        if sampling and not self._sampling:
+            self._profile.enable()
+            self.sampledBlocks += 1
+        elif not sampling and self._sampling:
+            self._profile.disable()
+        self._sampling = sampling
+
+    def stop(self):
+        """Stop timing the run."""
+        if self._sampling:
+            self._profile.disable()
+            self._sampling = False
+        if self._started is not None:
+            self._wall += time.perf_counter() - self._started[0]
+            self._cpu += time.process_time() - self._started[1]
+            self._started = None
+
+    def summary(self):
+        """Run and stage totals as a dict for json."""
+        stages = OrderedDict()
+        for totals in list(self._threadTotals):
+            for stage, (calls, wall, cpu) in list(totals.items()):
+                merged = stages.setdefault(stage, {"calls": 0, "threads": 0, "thread_seconds": 0.0,
+                                                   "thread_cpu_seconds": 0.0})
+                merged["calls"] += calls
+                merged["threads"] += 1
+                merged["thread_seconds"] += wall
+                merged["thread_cpu_seconds"] += cpu
+        for merged in stages.values():
+            merged["utilisation"] = round(merged["thread_seconds"] / (self._wall * merged["threads"]), 4) \
+                if self._wall > 0 else 0.0
+            merged["thread_seconds"] = round(merged["thread_seconds"], 6)
+            merged["thread_cpu_seconds"] = round(merged["thread_cpu_seconds"], 6)
+
+        return {"wall_seconds": round(self._wall, 6),
+                "cpu_seconds": round(self._cpu, 6),
+                "sampled_blocks": self.sampledBlocks,
+                "stages": stages}
+
+    def write(self, outputDir, name):
+        """Log the summary and write it, and the cProfile stats when sampled, to outputDir. Returns the paths."""
+        summary = self.summary()
+        log.info('Profile run | wall %.3f seconds | cpu %.3f seconds over all threads', summary["wall_seconds"],
+                 summary["cpu_seconds"])
+        for stage, totals in sorted(summary["stages"].items(), key=lambda item: -item[1]["thread_seconds"]):
+            log.info('Profile %s | calls %d | threads %d | wall %.3f thread-seconds | cpu %.3f thread-seconds | '
+                     'utilisation %.0f%%', stage, totals["calls"], totals["threads"], totals["thread_seconds"],
+                     totals["thread_cpu_seconds"], totals["utilisation"] * 100)
+
+        summaryPath = os.path.join(outputDir, "{}.profile.json".format(name))
+        with open(summaryPath, "w") as summaryFile:
+            json.dump(summary, summaryFile, indent=2)
+        paths = [summaryPath]
+        if self._profile is not None:
+            statsPath = os.path.join(outputDir, "{}.pstats".format(name))
+            self._profile.dump_stats(statsPath)
+            paths.append(statsPath)
+
+        return paths
+
+
+def _statusLabel(status):
+    """Group a response status for metrics. None means no response was received."""
+    if status is None:
+        return "none"
+    elif status >= 500:
+        return "5xx"
+
+    return str(status)
+
+
 class Configs(object):
     """Store input and output configs."""
 
@@ -57,17 +500,353 @@ class Configs(object):
         pass
 
 
+class ConnectionPool(object):
+    """
+    Keep-alive HTTP connections shared by all geocode requests.
+
+    Connections are checked out per request and returned after the response body is read.
+    At most size idle connections are kept per host and any idle longer than idleTimeout seconds are closed.
+    A request fails once connecting or waiting for the response takes longer than timeout seconds.
+    """
+
+    def __init__(self, size=POOL_SIZE, idleTimeout=POOL_IDLE_TIMEOUT_SECONDS, timeout=REQUEST_TIMEOUT_SECONDS):
+        """ctor."""
+        self._size = size
+        self._idleTimeout = idleTimeout
+        self._timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+
+    def _checkout(self, scheme, netloc):
+        """Get an idle connection for the host or open a new one."""
+        now = time.time()
+        with self._lock:
+            idle = self._idle.setdefault((scheme, netloc), deque())
+            while idle:
+                connection, lastUsed = idle.pop()
+                if now - lastUsed <= self._idleTimeout:
+                    self.reused += 1
+                    return connection, True
+                connection.close()
+
+        return self._connect(scheme, netloc), False
+
+    def _connect(self, scheme, netloc):
+        """Open a new connection to the host."""
+        with self._lock:
+            self.opened += 1
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=self._timeout)
+
+        return http.client.HTTPConnection(netloc, timeout=self._timeout)
+
+    def _checkin(self, scheme, netloc, connection):
+        """Return a connection to the idle list or close it if the pool is full."""
+        with self._lock:
+            idle = self._idle.setdefault((scheme, netloc), deque())
+            if len(idle) < self._size:
+                idle.append((connection, time.time()))
+                return
+        connection.close()
+
+    def urlopen(self, url, method="GET", body=None, headers=None):
+        """Send a request and return the status code and response body."""
+        parts = parse.urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        connection, reused = self._checkout(parts.scheme, parts.netloc)
+        try:
+            connection.request(method, path, body=body, headers=headers or {})
+            response = connection.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionError):
+            connection.close()
+            if not reused:
+                raise
+            #: the server closed an idle keep-alive connection, retry once on a new connection since the other
+            #: idle connections may be just as stale
+            connection = self._connect(parts.scheme, parts.netloc)
+            try:
+                connection.request(method, path, body=body, headers=headers or {})
+                response = connection.getresponse()
+            except Exception:
+                connection.close()
+                raise
+        except Exception:
+            connection.close()
+            raise
+
+        try:
+            data = response.read()
+        except Exception:
+            connection.close()
+            raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._checkin(parts.scheme, parts.netloc, connection)
+
+        return response.status, data
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            for idle in self._idle.values():
+                while idle:
+                    idle.pop()[0].close()
+
+
+class RateLimiter(object):
+    """
+    Token bucket shared by every in-flight geocode request.
+
+    The rate is adjusted once every RATE_ADJUST_SECONDS. A window is congested when more than RATE_ERROR_THRESHOLD
+    of its requests are 5xx or failed or its mean latency is over RATE_LATENCY_TOLERANCE times the baseline latency.
+    Until the first congested window the rate is multiplied by RATE_SLOW_START_FACTOR each window, after that it
+    grows by RATE_INCREASE_PER_SECOND, and a congested window multiplies it by RATE_DECREASE_FACTOR.
+    The rate only grows when the window sent at least RATE_UTILIZATION_THRESHOLD of it, so a rate the workers can
+    not use does not keep climbing. There is no ceiling unless maxRate is set.
+    The baseline is a decaying minimum of the window mean latencies. It drops to a lower mean at once and moves
+    RATE_BASELINE_DECAY of the way toward a higher one each window, so one quiet window does not hold the rate
+    down for the rest of the job.
+    """
+
+    def __init__(self, initialRate=INITIAL_RATE_PER_SECOND, maxRate=MAX_RATE_PER_SECOND, clock=time.time):
+        """ctor. clock returns the current time in seconds."""
+        self.maxRate = max(MIN_RATE_PER_SECOND, maxRate) if maxRate else None
+        self.rate = max(MIN_RATE_PER_SECOND, initialRate)
+        if self.maxRate is not None:
+            self.rate = min(self.rate, self.maxRate)
+        self.slowStart = True
+        self._clock = clock
+        self._tokens = 1.0
+        self._lastRefill = clock()
+        self._lock = threading.Lock()
+        self._windowStart = self._lastRefill
+        self._windowRequests = 0
+        self._windowLatency = 0.0
+        self._windowErrors = 0
+        self._baselineLatency = None
+
+    def acquire(self):
+        """Block until a request may be sent. Returns the seconds waited."""
+        with self._lock:
+            now = self._clock()
+            capacity = max(1.0, self.rate / 10)
+            self._tokens = min(capacity, self._tokens + (now - self._lastRefill) * self.rate)
+            self._lastRefill = now
+            #: reserve a token, a negative balance is the wait until it refills
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+
+        if wait > 0:
+            time.sleep(wait)
+        metrics.observe("rate_limit_wait_seconds", wait, WAIT_BUCKETS)
+
+        return wait
+
+    def report(self, latency, status):
+        """Record the outcome of a request. status is None when no response was received."""
+        with self._lock:
+            self._windowRequests += 1
+            self._windowLatency += latency
+            if status is None or status >= 500:
+                self._windowErrors += 1
+
+            now = self._clock()
+            if now - self._windowStart >= RATE_ADJUST_SECONDS:
+                self._adjust(now - self._windowStart)
+                self._windowStart = now
+                self._windowRequests = 0
+                self._windowLatency = 0.0
+                self._windowErrors = 0
+
+    def _adjust(self, windowSeconds):
+        """Grow or cut the rate for the window that just finished."""
+        meanLatency = self._windowLatency / self._windowRequests
+        if self._baselineLatency is None or meanLatency < self._baselineLatency:
+            self._baselineLatency = meanLatency
+        overloaded = meanLatency > self._baselineLatency * RATE_LATENCY_TOLERANCE
+        self._baselineLatency += (meanLatency - self._baselineLatency) * RATE_BASELINE_DECAY
+
+        if self._windowErrors > self._windowRequests * RATE_ERROR_THRESHOLD or overloaded:
+            self.rate = max(MIN_RATE_PER_SECOND, self.rate * RATE_DECREASE_FACTOR)
+            self.slowStart = False
+        elif self._windowRequests >= self.rate * windowSeconds * RATE_UTILIZATION_THRESHOLD:
+            if self.slowStart:
+                self.rate *= RATE_SLOW_START_FACTOR
+            else:
+                self.rate += RATE_INCREASE_PER_SECOND
+            if self.maxRate is not None:
+                self.rate = min(self.rate, self.maxRate)
+
+
+class CircuitOpenError(Exception):
+    """The geocoding api has been failing for longer than the outage limit."""
+
+    pass
+
+
+class CircuitBreaker(object):
+    """
+    Pause requests while the geocoding api is failing.
+
+    Opens after failureThreshold consecutive failed requests and every request waits while it is open.
+    When the open period ends a single probe request is let through. A success closes the circuit and a failure
+    opens it again for twice as long, up to maxOpenSeconds.
+    Waiting raises CircuitOpenError once the api has been failing for more than maxOutageSeconds.
+    """
+
+    def __init__(self, failureThreshold=CIRCUIT_FAILURE_THRESHOLD, openSeconds=CIRCUIT_OPEN_SECONDS,
+                 maxOpenSeconds=CIRCUIT_MAX_OPEN_SECONDS, maxOutageSeconds=MAX_OUTAGE_SECONDS):
+        """ctor."""
+        self.failureThreshold = failureThreshold
+        self.openSeconds = openSeconds
+        self.maxOpenSeconds = maxOpenSeconds
+        self.maxOutageSeconds = maxOutageSeconds
+        self.state = "closed"
+        self.opened = 0
+        self._condition = threading.Condition()
+        self._failures = 0
+        self._openFor = openSeconds
+        self._openUntil = 0
+        self._probing = False
+        self._outageStart = None
+
+    def wait(self):
+        """Block until a request may be sent."""
+        with self._condition:
+            while True:
+                if self._outageStart is not None and time.time() - self._outageStart > self.maxOutageSeconds:
+                    raise CircuitOpenError("Geocode service failed to respond for {} seconds".format(
+                        self.maxOutageSeconds))
+                if self.state == "closed":
+                    return
+
+                now = time.time()
+                if self.state == "open" and now >= self._openUntil:
+                    self.state = "half-open"
+                if self.state == "half-open":
+                    if not self._probing:
+                        self._probing = True
+                        return
+                    self._condition.wait(self._openFor)
+                else:
+                    self._condition.wait(self._openUntil - now)
+
+    def report(self, ok):
+        """Record the outcome of a request."""
+        with self._condition:
+            if ok:
+                if self.state != "closed":
+                    log.info("Geocode service recovered, resuming requests")
+                self.state = "closed"
+                self._failures = 0
+                self._openFor = self.openSeconds
+                self._probing = False
+                self._outageStart = None
+                self._condition.notify_all()
+                return
+
+            self._failures += 1
+            if self._outageStart is None:
+                self._outageStart = time.time()
+            if self.state == "half-open":
+                self._open(min(self._openFor * 2, self.maxOpenSeconds))
+            elif self.state == "closed" and self._failures >= self.failureThreshold:
+                self._open(self.openSeconds)
+
+    def _open(self, seconds):
+        """Open the circuit for seconds. Called with the condition held."""
+        log.info("Geocode service failing, pausing requests for %.1f seconds", seconds)
+        metrics.increment("circuit_opened_total")
+        self.state = "open"
+        self.opened += 1
+        self._openFor = seconds
+        self._openUntil = time.time() + seconds
+        self._probing = False
+        self._condition.notify_all()
+
+
+class RetryBudget(object):
+    """
+    Limit on deferred row retries so retrying can not multiply the load on a failing api.
+
+    Allows minimum retries plus ratio retries for every input row.
+    """
+
+    def __init__(self, ratio=RETRY_BUDGET_RATIO, minimum=RETRY_BUDGET_MIN):
+        """ctor."""
+        self.ratio = ratio
+        self.minimum = minimum
+        self.spent = 0
+
+    def spend(self, count, rows):
+        """Take up to count retries from the budget for a run of rows input rows. Returns the retries granted."""
+        granted = max(0, min(count, int(self.minimum + self.ratio * rows) - self.spent))
+        self.spent += granted
+
+        return granted
+
+
 class Geocoder(object):
     """Geocode and address and check api keys."""
 
     _api_key = None
     _url_template = GEOCODE_HOST + "api/v1/geocode/{}/{}?{}"
 
-    def __init__(self, api_key, spatialReference, locator):
+    def __init__(self, api_key, spatialReference, locator, connectionPool=None, rateLimiter=None,
+                 circuitBreaker=None):
         """Constructor."""
         self._api_key = api_key
         self._spatialRef = spatialReference
         self._locator = locator
+        self._pool = connectionPool or ConnectionPool()
+        self._rateLimiter = rateLimiter
+        self._circuitBreaker = circuitBreaker
+
+    def _urlopen(self, url, **kwargs):
+        """Send a request through the circuit breaker, rate limiter and connection pool."""
+        if self._circuitBreaker is not None:
+            self._circuitBreaker.wait()
+        if self._rateLimiter is not None:
+            self._rateLimiter.acquire()
+        start = time.time()
+        status = None
+        try:
+            status, data = self._pool.urlopen(url, **kwargs)
+        finally:
+            latency = time.time() - start
+            metrics.observe("geocode_request_seconds", latency)
+            metrics.increment("geocode_responses_total", status=_statusLabel(status))
+            if self._rateLimiter is not None:
+                self._rateLimiter.report(latency, status)
+            if self._circuitBreaker is not None:
+                self._circuitBreaker.report(status is not None and status < 500)
+
+        return status, data
+
+    def _parse(self, data):
+        start = time.time()
+        response = json.loads(data.decode("utf-8"))
+        metrics.observe("json_parse_seconds", time.time() - start, FAST_BUCKETS)
+
+        return response
+
+    def _get(self, url):
+        """Send a GET request and return the status code and parsed json."""
+        status, data = self._urlopen(url)
+        return status, self._parse(data)
+
+    def _post(self, url, jsonData):
+        """Send a json POST request and return the status code and parsed json."""
+        status, data = self._urlopen(url, method="POST", body=json.dumps(jsonData).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+        return status, self._parse(data)
 
     def _formatJsonData(self, formattedAddresses):
         jsonArray = {"addresses": []}
@@ -85,22 +864,20 @@ class Geocoder(object):
         params = parse.urlencode({"apiKey": self._api_key})
         url = apiCheck_Url.format(parse.quote("270 E CENTER ST"), "LINDON", params)
         try:
-            r = request.urlopen(url)
-            response = json.load(r)
+            status, response = self._get(url)
         except Exception as e:
             return None
 
         # check status code
-        if r.getcode() >= 500:
+        if status >= 500:
             return None
-        elif r.getcode() is not 200 or response["status"] is not 200:
+        elif status != 200 or response["status"] != 200:
             return "Error: " + str(response["message"])
         else:
             return "Api key is valid"
 
-    @api_retry
     def locateAddress(self, formattedAddress):
-        """Create URL from formatted address and send to api."""
+        """Create URL from formatted address and send to api. Returns None when the api fails to answer."""
         apiCheck_Url = GEOCODE_HOST + "api/v1/geocode/{}/{}?{}"
         params = parse.urlencode({"spatialReference": self._spatialRef,
                                   "locators": self._locator,
@@ -111,18 +888,44 @@ class Geocoder(object):
                                   params)
         response = None
         try:
-            r = request.urlopen(url)
-            response = json.load(r)
-        except error.HTTPError as httpError:
-            if httpError.code >= 500:
-                response = None
-            elif httpError.code == 404:
-                response = json.load(httpError)
+            status, body = self._get(url)
+            if status == 200 or status == 404:
+                response = body
+        except CircuitOpenError:
+            raise
         except:
             response = None
 
         return response
 
+    def locateAddresses(self, formattedAddresses):
+        """
+        Send a batch of formatted addresses to the multiple address endpoint.
+
+        Returns a dict of address id to a single address style response for every matched address.
+        Addresses missing from the dict were not matched by the batch. Returns None when the api fails to answer.
+        """
+        apiCheck_Url = GEOCODE_HOST + "api/v1/geocode/multiple?{}"
+        params = parse.urlencode({"spatialReference": self._spatialRef,
+                                  "locators": self._locator,
+                                  "apiKey": self._api_key,
+                                  "pobox": "true"})
+        url = apiCheck_Url.format(params)
+        try:
+            status, response = self._post(url, self._formatJsonData(formattedAddresses))
+            if status != 200 or response["status"] != 200:
+                return None
+            matches = {}
+            for coderResult in response["result"]["addresses"]:
+                if "location" in coderResult and "matchAddress" in coderResult:
+                    matches[str(coderResult["id"])] = {"status": 200, "result": coderResult}
+        except CircuitOpenError:
+            raise
+        except:
+            return None
+
+        return matches
+
 
 class AddressResult(object):
     """
@@ -131,6 +934,8 @@ class AddressResult(object):
     Also contains static methods for writing a list AddressResults to different formats.
     """
 
+    __slots__ = ("id", "inAddress", "inZone", "matchAddress", "zone", "score", "matchX", "matchY", "geoCoder")
+
     outputFields = ("INID", "INADDR", "INZONE",
                     "MatchAddress", "Zone", "Score",
                     "XCoord", "YCoord", "Geocoder")
@@ -155,7 +960,9 @@ class AddressResult(object):
 
     def __str__(self):
         """str."""
-        return "{},{},{},{},{},{},{},{},{}".format(*self.get_fields())
+        row = io.StringIO()
+        csv.writer(row, lineterminator="").writerow(self.get_fields())
+        return row.getvalue()
 
     def get_fields(self):
         """Get fields in output table order."""
@@ -186,9 +993,429 @@ class AddressResult(object):
             outCSV.write("\n" + str(addrResult))
 
 
+class GeocodeCache(object):
+    """
+    Bounded LRU cache of geocoder responses.
+
+    Keyed on the formatted address, zone, locator and spatial reference so repeated addresses in a run
+    only cost one request. Only responses the api answered (matches and not found) are cached.
+    """
+
+    def __init__(self, size=CACHE_SIZE, resultStore=None):
+        """ctor."""
+        self._size = size
+        self._entries = OrderedDict()
+        self._resultStore = resultStore
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.storeHits = 0
+
+    @staticmethod
+    def key(formattedAddress, locator, spatialRef):
+        """Get the cache key for a formatted address."""
+        return (formattedAddress.address, formattedAddress.zone, locator, spatialRef)
+
+    def get(self, key):
+        """Get a cached response, falling back to the result store, or None."""
+        response = self._entries.get(key)
+        if response is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return response
+
+        if self._resultStore is not None:
+            response = self._resultStore.get(key)
+            if response is not None:
+                self.storeHits += 1
+                self._remember(key, response)
+                return response
+
+        self.misses += 1
+        return None
+
+    def put(self, key, response):
+        """Cache a response in memory and in the result store."""
+        if response is None:
+            return
+        if self._resultStore is not None:
+            self._resultStore.put(key, response)
+        self._remember(key, response)
+
+    def _remember(self, key, response):
+        """Add a response to the LRU and evict the least recently used entries over the size limit."""
+        if self._size <= 0:
+            return
+        self._entries[key] = response
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+class ResultStore(object):
+    """
+    On disk SQLite store of geocoder responses shared between runs.
+
+    Uses the same keys as GeocodeCache. Entries older than ttlDays are ignored and pruned on close,
+    and the oldest entries over maxEntries are deleted on close.
+    """
+
+    def __init__(self, path, ttlDays=RESULT_STORE_TTL_DAYS, maxEntries=RESULT_STORE_MAX_ENTRIES):
+        """ctor."""
+        self.path = path
+        self._ttlSeconds = ttlDays * 24 * 60 * 60
+        self._maxEntries = maxEntries
+        self._uncommitted = 0
+        #: responses stored after this time are new in this run
+        self.openedAt = time.time()
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("PRAGMA synchronous = OFF")
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                    address TEXT NOT NULL,
+                                    zone TEXT NOT NULL,
+                                    locator TEXT NOT NULL,
+                                    spatial_ref TEXT NOT NULL,
+                                    response TEXT NOT NULL,
+                                    created REAL NOT NULL,
+                                    PRIMARY KEY (address, zone, locator, spatial_ref))""")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created)")
+        self._connection.commit()
+
+    def __len__(self):
+        """Count stored responses."""
+        return self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        """Get an unexpired response or None."""
+        address, zone, locator, spatialRef = key
+        row = self._connection.execute("""SELECT response FROM responses
+                                          WHERE address = ? AND zone = ? AND locator = ? AND spatial_ref = ?
+                                          AND created >= ?""",
+                                       (address, zone, str(locator), str(spatialRef),
+                                        time.time() - self._ttlSeconds)).fetchone()
+        if row is None:
+            return None
+
+        return json.loads(row[0])
+
+    def put(self, key, response):
+        """Store a response. Commits every RESULT_STORE_COMMIT_ROWS puts."""
+        address, zone, locator, spatialRef = key
+        self._connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                                 (address, zone, str(locator), str(spatialRef), json.dumps(response), time.time()))
+        self._uncommitted += 1
+        if self._uncommitted >= RESULT_STORE_COMMIT_ROWS:
+            self._connection.commit()
+            self._uncommitted = 0
+
+    def merge(self, sourcePath, since):
+        """Copy the responses stored in another result store file at or after since into this one."""
+        self._connection.commit()
+        self._connection.execute("ATTACH DATABASE ? AS source", (sourcePath,))
+        try:
+            self._connection.execute("""INSERT OR REPLACE INTO responses
+                                        SELECT * FROM source.responses WHERE created >= ?""", (since,))
+            self._connection.commit()
+        finally:
+            self._connection.execute("DETACH DATABASE source")
+
+    def close(self):
+        """Prune expired and excess entries, commit and close the database."""
+        self._connection.execute("DELETE FROM responses WHERE created < ?", (time.time() - self._ttlSeconds,))
+        excess = len(self) - self._maxEntries
+        if excess > 0:
+            self._connection.execute("""DELETE FROM responses WHERE rowid IN
+                                        (SELECT rowid FROM responses ORDER BY created LIMIT ?)""", (excess,))
+        self._connection.commit()
+        self._connection.close()
+
+
+class ResultWriter(object):
+    """
+    Long lived, buffered CSV writer for AddressResults.
+
+    Rows are csv quoted and buffered in memory. The buffer is flushed to the file every flushRows rows
+    or flushSeconds seconds, whichever comes first. close flushes and fsyncs the file.
+    """
+
+    def __init__(self, outputFilePath, flushRows=FLUSH_ROWS, flushSeconds=FLUSH_SECONDS, resultUploader=None):
+        """ctor."""
+        self.outputFilePath = outputFilePath
+        self._resultUploader = resultUploader
+        self._flushRows = flushRows
+        self._flushSeconds = flushSeconds
+        self._file = open(outputFilePath, "a", newline="", buffering=WRITE_BUFFER_BYTES)
+        self._writer = csv.writer(self._file, lineterminator="\n")
+        self._unflushedRows = 0
+        self._lastFlush = time.time()
+        self.rowsWritten = 0
+
+    def __enter__(self):
+        """Enter context."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Exit context."""
+        self.close()
+
+    def writeHeader(self):
+        """Write the output field names."""
+        self._writer.writerow(AddressResult.outputFields)
+
+    def writeResult(self, addressResult):
+        """Write a result row and flush if an interval has been reached."""
+        start = time.time()
+        self._writer.writerow(addressResult.get_fields())
+        metrics.observe("csv_write_seconds", time.time() - start, FAST_BUCKETS)
+        self.rowsWritten += 1
+        self._unflushedRows += 1
+        if self._unflushedRows >= self._flushRows or time.time() - self._lastFlush >= self._flushSeconds:
+            self.flush()
+
+    def flush(self, sync=False):
+        """Flush buffered rows to the file and optionally fsync it to disk."""
+        start = time.time()
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+        metrics.observe("csv_flush_seconds", time.time() - start)
+        self._unflushedRows = 0
+        self._lastFlush = time.time()
+        if self._resultUploader is not None:
+            self._resultUploader.flushed(self.outputFilePath, os.fstat(self._file.fileno()).st_size)
+
+    def close(self):
+        """Flush, fsync and close the file."""
+        if self._file.closed:
+            return
+        try:
+            self.flush(sync=True)
+        finally:
+            self._file.close()
+
+
+class ParquetResultWriter(object):
+    """
+    Parquet writer for AddressResults with the same interface as ResultWriter.
+
+    Rows are kept in column buffers, arrays of doubles for the numeric fields, and written as a row group
+    every rowGroupRows rows. Column types follow AddressResult.outputFieldTypes and empty values are null.
+    Requires pyarrow.
+    """
+
+    arrowTypes = {"TEXT": "string", "FLOAT": "float32", "DOUBLE": "float64"}
+
+    def __init__(self, outputFilePath, rowGroupRows=PARQUET_ROW_GROUP_ROWS):
+        """ctor."""
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("pyarrow is required for parquet output. pip install pyarrow")
+
+        self._pyarrow = pyarrow
+        self.outputFilePath = outputFilePath
+        self._rowGroupRows = rowGroupRows
+        self._schema = pyarrow.schema([(name, ParquetResultWriter.arrowTypes[fieldType])
+                                       for name, fieldType in zip(AddressResult.outputFields,
+                                                                  AddressResult.outputFieldTypes)])
+        self._numeric = [fieldType != "TEXT" for fieldType in AddressResult.outputFieldTypes]
+        self._writer = pyarrow.parquet.ParquetWriter(outputFilePath, self._schema, compression="snappy")
+        self._columns = self._newColumns()
+        self._bufferedRows = 0
+        self.rowsWritten = 0
+
+    def __enter__(self):
+        """Enter context."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Exit context."""
+        self.close()
+
+    def _newColumns(self):
+        return [array("d") if numeric else [] for numeric in self._numeric]
+
+    def writeHeader(self):
+        """Field names are part of the parquet schema."""
+        pass
+
+    def writeResult(self, addressResult):
+        """Buffer a result row and write a row group when it is full."""
+        for column, numeric, value in zip(self._columns, self._numeric, addressResult.get_fields()):
+            if value == "" or value is None:
+                column.append(math.nan if numeric else None)
+            else:
+                column.append(float(value) if numeric else str(value))
+        self.rowsWritten += 1
+        self._bufferedRows += 1
+        if self._bufferedRows >= self._rowGroupRows:
+            self._writeRowGroup()
+
+    def _writeRowGroup(self):
+        """Write the buffered rows as a row group."""
+        if self._bufferedRows == 0:
+            return
+        start = time.time()
+        pyarrow = self._pyarrow
+        arrays = [pyarrow.array(column, type=field.type, from_pandas=True)
+                  for column, field in zip(self._columns, self._schema)]
+        self._writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self._schema))
+        metrics.observe("parquet_row_group_seconds", time.time() - start)
+        self._columns = self._newColumns()
+        self._bufferedRows = 0
+
+    def flush(self, sync=False):
+        """Rows are written a row group at a time so only a sync writes a partial row group."""
+        if sync:
+            self._writeRowGroup()
+
+    def close(self):
+        """Write the remaining rows and the parquet footer."""
+        if self._writer is None:
+            return
+        try:
+            self._writeRowGroup()
+        finally:
+            self._writer.close()
+            self._writer = None
+
+
+class ParquetTableReader(object):
+    """
+    Read (id, address, zone) records from a parquet file a batch at a time. Requires pyarrow.
+
+    Only the three fields are read. Values are converted to text the way they would appear in a csv and nulls
+    are empty.
+    """
+
+    def __init__(self, inputFilePath, batchRows=READ_CHUNK_ROWS):
+        """ctor."""
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("pyarrow is required for parquet input. pip install pyarrow")
+
+        #: opened here because ParquetFile.close is missing from older pyarrow releases
+        self._file = open(inputFilePath, "rb")
+        self._parquetFile = pyarrow.parquet.ParquetFile(self._file)
+        self._batchRows = batchRows
+
+    def __enter__(self):
+        """Enter context."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Exit context."""
+        self.close()
+
+    def records(self, idField, addressField, zoneField):
+        """Yield (id, address, zone) for each row."""
+        fields = [idField, addressField, zoneField]
+        for batch in self._parquetFile.iter_batches(batch_size=self._batchRows, columns=fields):
+            columns = [batch.column(batch.schema.get_field_index(field)).to_pylist() for field in fields]
+            for values in zip(*columns):
+                yield tuple(value if isinstance(value, str) else "" if value is None else str(value)
+                            for value in values)
+
+    def close(self):
+        """Close the file."""
+        self._file.close()
+
+
+def _compression(name):
+    """gzip or zstd when a file name ends with a compression extension, otherwise None."""
+    extension = os.path.splitext(name)[1].lower()
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if extension == suffix:
+            return compression
+
+    return None
+
+
+def _isParquet(name):
+    """True for a parquet file name."""
+    return name.lower().endswith(".parquet")
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstandard is required for zstd files. pip install zstandard")
+
+    return zstandard
+
+
+class _ClosingGzipFile(gzip.GzipFile):
+    """GzipFile that also closes the stream it decompresses."""
+
+    def close(self):
+        """Close the gzip file and the stream."""
+        fileobj = self.fileobj
+        try:
+            gzip.GzipFile.close(self)
+        finally:
+            if fileobj is not None:
+                fileobj.close()
+
+
+def open_text_stream(stream, compression=None):
+    """Decode a binary stream as a text stream for csv.DictReader, decompressing gzip or zstd as it is read."""
+    if compression == "gzip":
+        stream = _ClosingGzipFile(fileobj=stream, mode="rb")
+    elif compression == "zstd":
+        stream = io.BufferedReader(_zstandard().ZstdDecompressor().stream_reader(stream, read_across_frames=True,
+                                                                                 closefd=True))
+
+    return io.TextIOWrapper(stream, encoding="utf-8", newline="")
+
+
+def compress_bytes(data, compression):
+    """
+    Compress data as one gzip member or zstd frame.
+
+    Members and frames can be concatenated, so compressed parts of a file compose into a valid compressed file.
+    """
+    if compression == "zstd":
+        return _zstandard().ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    compressed = io.BytesIO()
+    with gzip.GzipFile(fileobj=compressed, mode="wb", compresslevel=GZIP_LEVEL, mtime=0) as gzipFile:
+        gzipFile.write(data)
+
+    return compressed.getvalue()
+
+
+def compress_file(filePath, compression):
+    """Compress a file next to itself with the compression extension added. Returns the compressed file path."""
+    compressedPath = filePath + COMPRESSION_SUFFIXES[compression]
+    with open(filePath, "rb") as source, open(compressedPath, "wb") as destination:
+        if compression == "zstd":
+            _zstandard().ZstdCompressor(level=ZSTD_LEVEL).copy_stream(source, destination)
+        else:
+            with gzip.GzipFile(filename="", fileobj=destination, mode="wb", compresslevel=GZIP_LEVEL,
+                               mtime=0) as gzipFile:
+                shutil.copyfileobj(source, gzipFile, WRITE_BUFFER_BYTES)
+
+    return compressedPath
+
+
+def _addressTranslation():
+    """Build the str.translate table for control and punctuation characters removed from addresses."""
+    replacements = {}
+    for start, stop in ((0, 31), (33, 37), (39, 47), (58, 64), (91, 96), (123, 255)):
+        for c in range(start, stop):
+            replacements[c] = " "
+    replacements[38] = "and"
+
+    return str.maketrans(replacements)
+
+
 class AddressFormatter(object):
     """Address formating utility."""
     spaceReplaceMatcher = re.compile(r'(\s\d/\d\s)|/|(\s#.*)|%|(\.\s)|\?')
+    addressTranslation = _addressTranslation()
 
     def __init__(self, idNum, inAddr, inZone):
         """Ctor."""
@@ -196,28 +1423,26 @@ class AddressFormatter(object):
         self.address = self._formatAddress(inAddr)
         self.zone = self._formatZone(inZone)
 
-    def _formatAddress(self, inAddr):
-        addrString = str(inAddr)
-
-        formattedAddr = AddressFormatter.spaceReplaceMatcher.sub(" ", addrString)
+    @staticmethod
+    def formatRecords(records):
+        """
+        Format a list of (id, address, zone) tuples.
 
-        for c in range(0, 31):
-            formattedAddr = formattedAddr.replace(chr(c), " ")
-        for c in range(33, 37):
-            formattedAddr = formattedAddr.replace(chr(c), " ")
+        Returns an AddressFormatter for each record in the same order, or None for records that can not be formatted.
+        """
+        formatted = []
+        for idNum, inAddr, inZone in records:
+            try:
+                formatted.append(AddressFormatter(idNum, inAddr, inZone))
+            except UnicodeEncodeError:
+                formatted.append(None)
 
-        formattedAddr = formattedAddr.replace(chr(38), "and")
+        return formatted
 
-        for c in range(39, 47):
-            formattedAddr = formattedAddr.replace(chr(c), " ")
-        for c in range(58, 64):
-            formattedAddr = formattedAddr.replace(chr(c), " ")
-        for c in range(91, 96):
-            formattedAddr = formattedAddr.replace(chr(c), " ")
-        for c in range(123, 255):
-            formattedAddr = formattedAddr.replace(chr(c), " ")
+    def _formatAddress(self, inAddr):
+        formattedAddr = AddressFormatter.spaceReplaceMatcher.sub(" ", str(inAddr))
 
-        return formattedAddr
+        return formattedAddr.translate(AddressFormatter.addressTranslation)
 
     def _formatZone(self, inZone):
         formattedZone = AddressFormatter.spaceReplaceMatcher.sub(" ", str(inZone)).strip()
@@ -236,6 +1461,116 @@ class AddressFormatter(object):
             return True
 
 
+def format_chunk(records):
+    """Format a list of (id, address, zone) records. Returns (record, formattedAddress) pairs."""
+    return list(zip(records, AddressFormatter.formatRecords(records)))
+
+
+def _chunked(iterable, size):
+    """Yield lists of up to size items."""
+    iterator = iter(iterable)
+    chunk = list(itertools.islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(iterator, size))
+
+
+def _zoneKey(formattedAddress):
+    """Zone a formatted address is dispatched under. Rows that could not be formatted sort first."""
+    return formattedAddress.zone if formattedAddress is not None else ""
+
+
+class BackgroundStage(object):
+    """
+    Pipeline stage that drains an iterable on a background thread.
+
+    Up to maxsize items are buffered ahead of the consumer. A full buffer blocks the producer, so a slow
+    consumer holds back the stages before it and memory stays bounded.
+    """
+
+    _end = object()
+
+    def __init__(self, iterable, maxsize):
+        """ctor."""
+        self._items = queue.Queue(maxsize=maxsize)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(iterable,), daemon=True)
+        self._thread.start()
+
+    def _run(self, iterable):
+        try:
+            for item in iterable:
+                if self._stopped.is_set():
+                    return
+                self._put(item)
+            self._put(BackgroundStage._end)
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        while not self._stopped.is_set():
+            try:
+                self._items.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def __iter__(self):
+        """Yield the items in order. Re-raises an exception from the producer."""
+        while True:
+            item = self._items.get()
+            if item is BackgroundStage._end:
+                return
+            elif isinstance(item, Exception):
+                raise item
+            yield item
+
+    def depth(self):
+        """Items buffered for the consumer."""
+        return self._items.qsize()
+
+    def close(self):
+        """Stop the producer thread."""
+        self._stopped.set()
+
+
+class OrderedPoolStage(object):
+    """
+    Pipeline stage that maps a function over items with an executor.
+
+    Keeps up to window calls in flight and yields the results in input order.
+    """
+
+    def __init__(self, executor, function, items, window):
+        """ctor."""
+        self._executor = executor
+        self._function = function
+        self._items = items
+        self._window = window
+        self._pending = deque()
+
+    def __iter__(self):
+        """Yield function(item) for each item in order."""
+        try:
+            for item in self._items:
+                if len(self._pending) >= self._window:
+                    yield self._pending.popleft().result()
+                self._pending.append(self._executor.submit(self._function, item))
+            while self._pending:
+                yield self._pending.popleft().result()
+        finally:
+            self.close()
+
+    def depth(self):
+        """Calls in flight."""
+        return len(self._pending)
+
+    def close(self):
+        """Cancel the calls that have not started."""
+        while self._pending:
+            self._pending.popleft().cancel()
+
+
 class TableGeocoder(object):
     """
     Script tool user interface allows for.
@@ -254,7 +1589,14 @@ class TableGeocoder(object):
                      "NAD 1983 StatePlane Utah South(Meters)": 32144,
                      "GCS WGS 1984": 4326}
 
-    def __init__(self, apiKey, inputTable, idField, addressField, zoneField, locator, spatialRef, outputDir, outputFileName, outputGeodatabase):
+    def __init__(self, apiKey, inputTable, idField, addressField, zoneField, locator, spatialRef, outputDir, outputFileName, outputGeodatabase,
+                 workers=1, poolSize=POOL_SIZE, poolIdleTimeout=POOL_IDLE_TIMEOUT_SECONDS,
+                 requestTimeout=REQUEST_TIMEOUT_SECONDS, batchSize=1,
+                 flushRows=FLUSH_ROWS, flushSeconds=FLUSH_SECONDS, cacheSize=CACHE_SIZE, resultStore=None,
+                 checkpoint=None, checkpointRows=CHECKPOINT_ROWS, initialRate=INITIAL_RATE_PER_SECOND,
+                 maxRate=MAX_RATE_PER_SECOND, resultUploader=None, retryBudget=RETRY_BUDGET_RATIO,
+                 maxOutageSeconds=MAX_OUTAGE_SECONDS, outputFormat="csv", formatProcesses=0,
+                 readAheadChunks=READ_AHEAD_CHUNKS, zoneWindow=0, apiKeyCheck=None, profiler=None):
         """ctor."""
         self._apiKey = apiKey
         self._inputTable = inputTable
@@ -266,16 +1608,44 @@ class TableGeocoder(object):
         self._outputDir = outputDir
         self._outputFileName = outputFileName
         self._outputGdb = outputGeodatabase
+        self._workers = max(1, workers)
+        self._poolSize = poolSize
+        self._poolIdleTimeout = poolIdleTimeout
+        self._requestTimeout = requestTimeout
+        self._batchSize = min(max(1, batchSize), MAX_BATCH_SIZE)
+        self._flushRows = flushRows
+        self._flushSeconds = flushSeconds
+        self._resultWriter = None
+        self._cache = None
+        if cacheSize > 0 or resultStore is not None:
+            self._cache = GeocodeCache(cacheSize, resultStore)
+        self._checkpoint = checkpoint
+        self._checkpointRows = checkpointRows
+        #: a loaded checkpoint's output already has the header and the rows before startRow
+        self._resuming = checkpoint is not None and checkpoint.loaded
+        self._startRow = checkpoint.rowsCompleted if self._resuming else 0
+        self._deferred = [tuple(record) for record in checkpoint.deferred] if self._resuming else []
+        self._rateLimiter = RateLimiter(initialRate, maxRate)
+        self._circuitBreaker = CircuitBreaker(maxOutageSeconds=maxOutageSeconds)
+        self._retryBudget = RetryBudget(retryBudget)
+        self._resultUploader = resultUploader
+        self._outputFormat = outputFormat
+        self._formatProcesses = formatProcesses
+        self._readAheadChunks = max(1, readAheadChunks)
+        self._geocodeQueue = deque()
+        self._zoneWindow = zoneWindow
+        self._apiKeyCheck = apiKeyCheck
+        self._profiler = profiler
 
     #
     # Helper Functions
     #
-    def _HandleCurrentResult(self, addressResult, outputFullPath, outputCursor):
+    def _HandleCurrentResult(self, addressResult):
         """Handle appending a geocoded address to the output CSV."""
-        currentResult = addressResult
-        AddressResult.appendResultCSV(currentResult, outputFullPath)
+        self._resultWriter.writeResult(addressResult)
+        metrics.increment("rows_total")
 
-    def _processMatch(self, coderResponse, formattedAddr, outputFullPath, outputCursor):
+    def _processMatch(self, coderResponse, formattedAddr):
         """Handle an address that has been returned by the geocoder."""
         locatorErrorText = "Error: Locator error"
         addressId = formattedAddr.id
@@ -284,7 +1654,7 @@ class TableGeocoder(object):
             log.info("Address ID {} failed".format(addressId))
             # Handle bad response
             currentResult = AddressResult(addressId, "", "", locatorErrorText, "", "", "", "", "")
-            self._HandleCurrentResult(currentResult, outputFullPath, outputCursor)
+            self._HandleCurrentResult(currentResult)
         else:
             if coderResponse["status"] == 404:
                 # address not found error
@@ -292,7 +1662,7 @@ class TableGeocoder(object):
                 inputZone = formattedAddr.zone
                 currentResult = AddressResult(addressId, inputAddress, inputZone,
                                               "Error: " + coderResponse["message"], "", "", "", "", "")
-                self._HandleCurrentResult(currentResult, outputFullPath, outputCursor)
+                self._HandleCurrentResult(currentResult)
             # Matched address
             else:
                 coderResult = coderResponse["result"]
@@ -315,111 +1685,1268 @@ class TableGeocoder(object):
                                               matchAddress, matchZone, coderResult["score"],
                                               coderResult["location"]["x"], coderResult["location"]["y"],
                                               coderResult["locator"])
-                self._HandleCurrentResult(currentResult, outputFullPath, outputCursor)
+                self._HandleCurrentResult(currentResult)
+
+    def _locate(self, geocoder, formattedAddresses):
+        """
+        Geocode a list of addresses. Runs on a worker thread.
+
+        Returns a response for each address in the same order, None for addresses the api failed to answer.
+        Addresses that are not matched in a batch fall back to a single address request.
+        """
+        if len(formattedAddresses) == 1:
+            return [geocoder.locateAddress(formattedAddresses[0])]
+
+        matches = geocoder.locateAddresses(formattedAddresses)
+        if matches is None:
+            return [None] * len(formattedAddresses)
+        responses = []
+        for formattedAddress in formattedAddresses:
+            response = matches.get(str(formattedAddress.id))
+            if response is None:
+                response = geocoder.locateAddress(formattedAddress)
+            responses.append(response)
+
+        return responses
+
+    def _dispatch(self, formatted, geocoder, executor):
+        """
+        Yield (record, formattedAddress, future, index) in input order from (record, formattedAddress) pairs.
+
+        Valid addresses are grouped into batches of batchSize and submitted to the worker pool.
+        The response for a row is future.result()[index]. Rows that are not sent to the api have no future.
+        Cache hits and duplicates of an address that is already in flight share a future instead of a new request.
+        Keeps up to DISPATCH_WINDOW_PER_WORKER batches per worker in flight ahead of the row being yielded.
+        With a zone window, zoneWindow rows at a time are sent to the api sorted by zone so the api's per zone
+        locator lookups stay warm, and the next window is sent while the previous one is yielded.
+        """
+        window = self._workers * DISPATCH_WINDOW_PER_WORKER * self._batchSize
+        pending = self._geocodeQueue = deque()
+        inFlight = {}
+        batch = []
+        batchFuture = None
+
+        def submitBatch():
+            executorFuture = executor.submit(self._locate, geocoder, batch[:])
+            executorFuture.add_done_callback(lambda done, target=batchFuture: _copyFuture(done, target))
+            batchFuture.add_done_callback(lambda target: target.cancelled() and executorFuture.cancel())
+            del batch[:]
+
+        def route(record, formattedAddress):
+            """Get the (record, formattedAddress, future, index) for a row, adding it to a batch if needed."""
+            nonlocal batchFuture
+            # Check for major address format problems before sending to api
+            if formattedAddress is None or not formattedAddress.isValid():
+                return (record, formattedAddress, None, None)
+
+            key = None
+            if self._cache is not None:
+                key = GeocodeCache.key(formattedAddress, self._locator, self._spatialRef)
+                if key in inFlight:
+                    self._cache.hits += 1
+                    return (record, formattedAddress) + inFlight[key]
+                cachedResponse = self._cache.get(key)
+                if cachedResponse is not None:
+                    cachedFuture = Future()
+                    cachedFuture.set_result([cachedResponse])
+                    return (record, formattedAddress, cachedFuture, 0)
+
+            if len(batch) > 0 and formattedAddress.id in (queued.id for queued in batch):
+                submitBatch()
+            if len(batch) == 0:
+                batchFuture = Future()
+                #: indexes whose api response has been cached. Cache hit futures have none and are not cached again
+                batchFuture.cachedIndexes = set()
+            item = (record, formattedAddress, batchFuture, len(batch))
+            if key is not None:
+                inFlight[key] = item[2:]
+            batch.append(formattedAddress)
+            if len(batch) >= self._batchSize:
+                submitBatch()
+
+            return item
+
+        try:
+            if self._zoneWindow > 0:
+                for chunk in _chunked(formatted, self._zoneWindow):
+                    items = [None] * len(chunk)
+                    zone = None
+                    for i in sorted(range(len(chunk)), key=lambda i: _zoneKey(chunk[i][1])):
+                        #: keep each batch to one zone
+                        if _zoneKey(chunk[i][1]) != zone and len(batch) > 0:
+                            submitBatch()
+                        zone = _zoneKey(chunk[i][1])
+                        items[i] = route(*chunk[i])
+                    if len(batch) > 0:
+                        submitBatch()
+                    pending.extend(items)
+                    while len(pending) > len(items):
+                        yield self._popPending(pending, inFlight)
+            else:
+                for record, formattedAddress in formatted:
+                    while len(pending) >= window:
+                        if pending[0][2] is batchFuture and len(batch) > 0:
+                            submitBatch()
+                        yield self._popPending(pending, inFlight)
+                    pending.append(route(record, formattedAddress))
+
+            if len(batch) > 0:
+                submitBatch()
+            while pending:
+                yield self._popPending(pending, inFlight)
+        finally:
+            for _, _, future, _ in pending:
+                if future is not None:
+                    future.cancel()
+
+    def _popPending(self, pending, inFlight):
+        """Pop the next row to yield. Its response is cached by the caller so it is no longer in flight."""
+        item = pending.popleft()
+        if inFlight and item[2] is not None:
+            key = GeocodeCache.key(item[1], self._locator, self._spatialRef)
+            if inFlight.get(key) == item[2:]:
+                del inFlight[key]
+
+        return item
+
+    def _openInput(self):
+        """
+        Open the input table. inputTable may be a path or an already open text stream.
+
+        Paths ending in .gz or .zst are csvs decompressed as they are read and paths ending in .parquet are
+        read with ParquetTableReader.
+        """
+        if hasattr(self._inputTable, "read"):
+            return self._inputTable
+        elif _isParquet(self._inputTable):
+            return ParquetTableReader(self._inputTable)
+        compression = _compression(self._inputTable)
+        if compression is not None:
+            return open_text_stream(open(self._inputTable, "rb"), compression)
+
+        return open(self._inputTable, newline="")
+
+    def _records(self, tableInput):
+        """Get the (id, address, zone) records of the opened input table."""
+        if isinstance(tableInput, ParquetTableReader):
+            return tableInput.records(self._idField, self._addressField, self._zoneField)
+        reader = csv.DictReader(tableInput)
+
+        return ((row[self._idField], row[self._addressField], row[self._zoneField]) for row in reader)
+
+    def _openOutput(self, outputFullPath):
+        """Open the result writer for the output format."""
+        if self._outputFormat == "parquet":
+            return ParquetResultWriter(outputFullPath)
+
+        return ResultWriter(outputFullPath, self._flushRows, self._flushSeconds, self._resultUploader)
+
+    def _pipeline(self, records, geocoder, executor, formatPool):
+        """
+        Connect the read, format and geocode stages. Returns the dispatched rows and the stages as (name, stage).
+
+        Rows are read and parsed in chunks on a background thread. Chunks are formatted on that thread too,
+        or on the process pool when there is one. Each stage is bounded so memory stays flat on any input size.
+        """
+        chunks = _chunked(records, READ_CHUNK_ROWS)
+        if formatPool is None:
+            formatChunk = format_chunk if self._profiler is None else self._profiler.wrap("format", format_chunk)
+            readStage = BackgroundStage((formatChunk(chunk) for chunk in chunks), self._readAheadChunks)
+            stages = [("read", readStage)]
+            formatted = readStage
+        else:
+            readStage = BackgroundStage(chunks, self._readAheadChunks)
+            formatStage = OrderedPoolStage(formatPool, format_chunk, readStage,
+                                           self._formatProcesses * FORMAT_WINDOW_PER_PROCESS)
+            stages = [("read", readStage), ("format", formatStage)]
+            formatted = formatStage
+
+        dispatched = self._dispatch(itertools.chain.from_iterable(formatted), geocoder, executor)
+
+        return dispatched, stages
+
+    def _logQueueDepths(self, stages):
+        """Log how full each stage is. The fullest stage is ahead of the bottleneck."""
+        depths = [(name, stage.depth()) for name, stage in stages] + [("geocode", len(self._geocodeQueue))]
+        for name, depth in depths:
+            metrics.set("pipeline_queue_depth", depth, stage=name)
+        log.info("Queue depth %s", " | ".join("{} {}".format(name, depth) for name, depth in depths))
+
+    def _profileStages(self, geocoder):
+        """
+        Time the stages of the run with the profiler.
+
+        Formatting on the format processes is not timed, only the wait for it is included in dispatch.
+        """
+        profiler = self._profiler
+        geocoder._parse = profiler.wrap("json parse", geocoder._parse)
+        self._locate = profiler.wrap("geocode", self._locate)
+        self._handleRow = profiler.wrap("await response", self._handleRow)
+        self._processMatch = profiler.wrap("process match", self._processMatch)
+        self._HandleCurrentResult = profiler.wrap("write", self._HandleCurrentResult)
+
+    def _saveCheckpoint(self, outputFullPath, rowsCompleted, deferred):
+        """Sync the output and save a checkpoint of the input rows completed and the rows deferred so far."""
+        self._resultWriter.flush(sync=True)
+        self._checkpoint.save(rowsCompleted, outputFullPath, deferred)
+        log.info('Checkpoint saved at row %d with %d deferred rows', rowsCompleted, len(deferred))
+
+        return rowsCompleted
+
+    def _handleRow(self, record, formattedAddress, future, index, deferred):
+        """Write the result for a dispatched row. Rows the api failed to answer are added to deferred instead."""
+        if formattedAddress is None:
+            currentResult = AddressResult(record[0], "", "",
+                                          "Error: Unicode special character encountered", "", "", "", "", "")
+            self._HandleCurrentResult(currentResult)
+
+        elif future is not None:
+            matchedAddress = future.result()[index]
+            if matchedAddress is None:
+                deferred.append(record)
+                metrics.increment("deferred_rows_total")
+                return
+
+            #: only store responses from the api, a cache hit stored again would reset its result store age
+            cachedIndexes = getattr(future, "cachedIndexes", None)
+            if self._cache is not None and cachedIndexes is not None and index not in cachedIndexes:
+                cachedIndexes.add(index)
+                self._cache.put(GeocodeCache.key(formattedAddress, self._locator, self._spatialRef), matchedAddress)
+            self._processMatch(matchedAddress, formattedAddress)
+
+        else:
+            currentResult = AddressResult(record[0], formattedAddress.address, formattedAddress.zone,
+                                          "Error: Address invalid or NULL fields", "", "", "", "", "")
+            self._HandleCurrentResult(currentResult)
+
+    def _retryDeferred(self, deferred, rowsCompleted, geocoder, executor):
+        """
+        Geocode the deferred rows again after the main pass, within the retry budget.
+
+        Rows that still fail are written as failed. Returns None when done or the rows still deferred if the api
+        failed for longer than the outage limit.
+        """
+        for retryPass in range(DEFERRED_RETRY_PASSES):
+            if len(deferred) == 0:
+                break
+            granted = self._retryBudget.spend(len(deferred), rowsCompleted)
+            if granted == 0:
+                log.info('Retry budget spent with %d rows deferred', len(deferred))
+                break
+
+            retrying, rest = deferred[:granted], deferred[granted:]
+            deferred = []
+            log.info('Retrying %d deferred rows, pass %d', len(retrying), retryPass + 1)
+            metrics.increment("deferred_retries_total", len(retrying))
+            processed = 0
+            dispatched = self._dispatch(format_chunk(retrying), geocoder, executor)
+            try:
+                for item in dispatched:
+                    self._handleRow(*item, deferred)
+                    processed += 1
+            except CircuitOpenError:
+                return deferred + retrying[processed:] + rest
+            finally:
+                dispatched.close()
+            deferred.extend(rest)
+
+        for record, formattedAddress in format_chunk(deferred):
+            currentResult = AddressResult(record[0], formattedAddress.address, formattedAddress.zone,
+                                          "Error: Geocode failed", "", "", "", "", "")
+            self._HandleCurrentResult(currentResult)
+
+        return None
+
+    def _abort(self, outputFullPath, rowsCompleted, deferred):
+        """Log the geocode service outage and checkpoint the rows completed and deferred."""
+        error_msg = "Geocode Service Failed to respond{}"
+        if rowsCompleted > 0:
+            #: every input row read is either written or deferred
+            error_msg = error_msg.format("\n{} addresses written and {} deferred\nCheck: {} for partial table".format(
+                rowsCompleted - len(deferred), len(deferred), outputFullPath))
+        else:
+            error_msg = error_msg.format("")
+        log.info(error_msg)
+        if self._checkpoint is not None:
+            self._saveCheckpoint(outputFullPath, rowsCompleted, deferred)
 
     def start(self):
-        """Entery point into geocoding process."""
+        """Entery point into geocoding process. Returns True when every row was geocoded."""
         outputFullPath = os.path.join(self._outputDir, self._outputFileName)
 
-        geocoder = Geocoder(self._apiKey, self._spatialRef, self._locator)
+        connectionPool = ConnectionPool(max(self._poolSize, self._workers), self._poolIdleTimeout,
+                                        self._requestTimeout)
+        if self._profiler is not None:
+            self._profiler.start()
+        try:
+            return self._geocode(connectionPool, outputFullPath)
+        finally:
+            if self._profiler is not None:
+                self._profiler.stop()
+            if self._checkpoint is not None:
+                self._checkpoint.wait()
+            log.info('Connections opened %d | reused %d', connectionPool.opened, connectionPool.reused)
+            connectionPool.close()
+            metrics.set('connections_opened', connectionPool.opened)
+            metrics.set('connections_reused', connectionPool.reused)
+            if self._cache is not None:
+                metrics.set('cache_hits', self._cache.hits)
+                metrics.set('cache_result_store_hits', self._cache.storeHits)
+                metrics.set('cache_misses', self._cache.misses)
+
+    def _geocode(self, connectionPool, outputFullPath):
+        """Check the api key and geocode every row of the input table."""
+        geocoder = Geocoder(self._apiKey, self._spatialRef, self._locator, connectionPool, self._rateLimiter,
+                            self._circuitBreaker)
+        if self._profiler is not None:
+            self._profileStages(geocoder)
         # Test api key before we get started
-        apiKeyMessage = geocoder.isApiKeyValid()
+        if self._apiKeyCheck is not None:
+            start = time.time()
+            apiKeyMessage = self._apiKeyCheck.result()
+            log.info('Waited %.3f seconds for the api key check', time.time() - start)
+        else:
+            apiKeyMessage = geocoder.isApiKeyValid()
         if apiKeyMessage is None:
             log.info("Geocode service failed to respond on api key check")
-            return
+            return False
         elif "Error:" in apiKeyMessage:
             log.info(apiKeyMessage)
-            return
+            return False
         else:
             log.info(apiKeyMessage)
 
-        log.info("Begin Geocode")
-        AddressResult.addHeaderResultCSV(outputFullPath)
-        sequentialBadRequests = 0
-        rowNum = 1
+        log.info("Begin Geocode with %d worker(s), batch size %d and %d format process(es)", self._workers,
+                 self._batchSize, self._formatProcesses)
+        if self._zoneWindow > 0:
+            log.info("Dispatching rows grouped by zone %d rows at a time", self._zoneWindow)
+        rowNum = self._startRow + 1
+        lastCheckpoint = self._startRow
+        #: rows the api failed to answer, retried after the main pass
+        deferred = list(self._deferred)
         one_k_start = time.time()
-        outCursor = None
-        with open(self._inputTable) as csvInput:
-            reader = csv.DictReader(csvInput)
-            for row in reader:
-                record = (row[self._idField], row[self._addressField], row[self._zoneField])
-                try:
-                    inFormattedAddress = AddressFormatter(record[0], record[1], record[2])
-                except UnicodeEncodeError:
-                    currentResult = AddressResult(record[0], "", "",
-                                                  "Error: Unicode special character encountered", "", "", "", "", "")
-                    self._HandleCurrentResult(currentResult, outputFullPath, outCursor)
-
-                # Check for major address format problems before sending to api
-                if inFormattedAddress.isValid():
-                    throttleTime = random.uniform(RATE_LIMIT_SECONDS[0], RATE_LIMIT_SECONDS[1])
-                    time.sleep(throttleTime)
-                    matchedAddress = geocoder.locateAddress(inFormattedAddress)
-
-                    if matchedAddress is None:
-                        sequentialBadRequests += 1
-                        if sequentialBadRequests <= 5:
-                            currentResult = AddressResult(record[0], inFormattedAddress.address, inFormattedAddress.zone,
-                                                          "Error: Geocode failed", "", "", "", "", "")
-                            self._HandleCurrentResult(currentResult, outputFullPath, outCursor)
-                        else:
-                            error_msg = "Geocode Service Failed to respond{}"
-                            if rowNum > 1:
-                                error_msg = error_msg.format(
-                                    "\n{} adresses completed\nCheck: {} for partial table".format(rowNum - 1,
-                                                                                                  outputFullPath))
-                            else:
-                                error_msg = error_msg.format("")
-                            log.info(error_msg)
-
-                            return
-
-                        continue
-
-                    self._processMatch(matchedAddress, inFormattedAddress, outputFullPath, outCursor)
+        formatPool = None
+        if self._formatProcesses > 0:
+            formatPool = ProcessPoolExecutor(self._formatProcesses, mp_context=multiprocessing.get_context("spawn"))
+        with self._openOutput(outputFullPath) as self._resultWriter,\
+                self._openInput() as tableInput, ThreadPoolExecutor(max_workers=self._workers) as executor:
+            records = self._records(tableInput)
+            if self._resuming:
+                log.info("Resuming after row %d with %d deferred rows", self._startRow, len(deferred))
+                records = itertools.islice(records, self._startRow, None)
+            else:
+                self._resultWriter.writeHeader()
+            if self._profiler is not None:
+                records = self._profiler.iterate("read", records)
+            dispatched, stages = self._pipeline(records, geocoder, executor, formatPool)
+            rows = dispatched if self._profiler is None else self._profiler.iterate("dispatch", dispatched)
+            try:
+                for item in rows:
+                    if self._checkpoint is not None and rowNum - 1 - lastCheckpoint >= self._checkpointRows:
+                        lastCheckpoint = self._saveCheckpoint(outputFullPath, rowNum - 1, deferred)
 
-                else:
-                        currentResult = AddressResult(record[0], inFormattedAddress.address, inFormattedAddress.zone,
-                                                      "Error: Address invalid or NULL fields", "", "", "", "", "")
-                        self._HandleCurrentResult(currentResult, outputFullPath, outCursor)
+                    self._handleRow(*item, deferred)
+
+                    if rowNum % 1000 == 0:
+                        one_k_end = time.time() - one_k_start
+                        one_k_end = round(one_k_end, 3)
+                        log.info('Rows geocoded %d | seconds %f', rowNum, one_k_end)
+                        metrics.set('rows_per_second', round(1000 / max(one_k_end, 0.001), 1))
+                        log.info('Request rate limit %.1f per second', self._rateLimiter.rate)
+                        if self._cache is not None:
+                            log.info('Cache hits %d | result store hits %d | misses %d | evictions %d',
+                                     self._cache.hits, self._cache.storeHits, self._cache.misses,
+                                     self._cache.evictions)
+                        if len(deferred) > 0:
+                            log.info('Rows deferred %d', len(deferred))
+                        self._logQueueDepths(stages)
+                        if self._profiler is not None:
+                            self._profiler.sample(rowNum // 1000)
+                        one_k_start = time.time()
+                    rowNum += 1
+            except CircuitOpenError:
+                self._abort(outputFullPath, rowNum - 1, deferred)
+
+                return False
+            finally:
+                dispatched.close()
+                for _, stage in stages:
+                    stage.close()
+                if formatPool is not None:
+                    formatPool.shutdown()
+
+            deferred = self._retryDeferred(deferred, rowNum - 1, geocoder, executor)
+            if deferred is not None:
+                self._abort(outputFullPath, rowNum - 1, deferred)
+
+                return False
+
+        return True
+
+
+class BlobNotFound(Exception):
+    """A blob does not exist in a local bucket."""
+
+    pass
+
+
+class BlobPreconditionFailed(Exception):
+    """A local blob's generation does not match if_generation_match."""
+
+    pass
+
+
+#: exceptions for a missing blob, google.cloud NotFound is added when the storage client is imported
+_notFoundErrors = (BlobNotFound,)
+#: exceptions for a failed generation precondition, google PreconditionFailed is added with the storage client
+_preconditionErrors = (BlobPreconditionFailed,)
 
-                if rowNum % 1000 == 0:
-                    one_k_end = time.time() - one_k_start
-                    one_k_end = round(one_k_end, 3)
-                    log.info('Rows geocoded %d | seconds %f', rowNum, one_k_end)
-                    one_k_start = time.time()
-                rowNum += 1
-                sequentialBadRequests = 0
+
+class LocalBlob(object):
+    """Local file stand-in for a cloud storage blob."""
+
+    def __init__(self, bucket, name):
+        """ctor."""
+        self.bucket = bucket
+        self.name = name
+        self.path = os.path.join(bucket.path, name)
+        self.size = None
+        self.generation = None
+
+    def exists(self):
+        """True if the file exists."""
+        return os.path.isfile(self.path)
+
+    def _checkExists(self):
+        if not self.exists():
+            raise BlobNotFound("{} not found in {}".format(self.name, self.bucket.name))
+
+    def _generation(self):
+        return os.stat(self.path).st_mtime_ns if self.exists() else 0
+
+    def _checkGeneration(self, if_generation_match):
+        """
+        Raise BlobPreconditionFailed unless the file is at generation if_generation_match, 0 meaning missing.
+
+        The modified time stands in for the generation. The check is not atomic with the write that follows.
+        """
+        if if_generation_match is not None and self._generation() != if_generation_match:
+            raise BlobPreconditionFailed("{} is not at generation {}".format(self.name, if_generation_match))
+
+    def reload(self):
+        """Load the blob size and generation."""
+        self._checkExists()
+        self.size = os.path.getsize(self.path)
+        self.generation = self._generation()
+
+    def download_to_filename(self, filename, if_generation_match=None):
+        """Copy the blob to a local file."""
+        self._checkExists()
+        self._checkGeneration(if_generation_match)
+        shutil.copyfile(self.path, filename)
+
+    def download_as_bytes(self, start=None, end=None):
+        """Read the blob, or the inclusive byte range start to end."""
+        self._checkExists()
+        with open(self.path, "rb") as blobFile:
+            blobFile.seek(start or 0)
+            if end is None:
+                return blobFile.read()
+            return blobFile.read(end - (start or 0) + 1)
+
+    def _makeDirectory(self):
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def upload_from_filename(self, filename, if_generation_match=None):
+        """Copy a local file to the blob."""
+        self._checkGeneration(if_generation_match)
+        self._makeDirectory()
+        shutil.copyfile(filename, self.path)
+
+    def upload_from_string(self, data):
+        """Write bytes to the blob."""
+        self._makeDirectory()
+        with open(self.path, "wb") as blobFile:
+            blobFile.write(data)
+
+    def compose(self, sources):
+        """Concatenate source blobs into this blob."""
+        data = b"".join(source.download_as_bytes() for source in sources)
+        self.upload_from_string(data)
+
+    def delete(self):
+        """Delete the blob."""
+        self._checkExists()
+        os.remove(self.path)
+
+
+class LocalBucket(object):
+    """Directory stand-in for a cloud storage bucket, used for testing without GCS."""
+
+    def __init__(self, rootDir, name):
+        """ctor."""
+        self.name = name
+        self.path = os.path.join(rootDir, name)
+
+    def blob(self, blobName):
+        """Get a blob by name."""
+        return LocalBlob(self, blobName)
+
+    def list_blobs(self, prefix=None):
+        """List every blob in the bucket, optionally only names starting with prefix."""
+        for directory, _, fileNames in os.walk(self.path):
+            for fileName in sorted(fileNames):
+                name = os.path.relpath(os.path.join(directory, fileName), self.path).replace(os.sep, "/")
+                if prefix is None or name.startswith(prefix):
+                    yield LocalBlob(self, name)
+
+
+class BlobReader(io.RawIOBase):
+    """
+    Raw binary stream over a blob byte range.
+
+    Chunks of STREAM_CHUNK_BYTES are downloaded on a background thread and up to STREAM_READ_AHEAD_CHUNKS are
+    buffered ahead of the reader, so reading starts after the first chunk and memory stays constant.
+    """
+
+    def __init__(self, blob, start=0, end=None, chunkSize=STREAM_CHUNK_BYTES, readAhead=STREAM_READ_AHEAD_CHUNKS,
+                 prefix=b""):
+        """ctor. end is exclusive and defaults to the blob size. prefix is read before the byte range."""
+        io.RawIOBase.__init__(self)
+        if end is None:
+            blob.reload()
+            end = blob.size
+        self._blob = blob
+        self._chunks = queue.Queue(maxsize=readAhead)
+        self._buffer = memoryview(prefix)
+        self._eof = False
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._readAhead, args=(start, end, chunkSize), daemon=True)
+        self._thread.start()
+
+    def _download(self, start, end):
+        """Download an inclusive byte range, retrying transient failures."""
+        attempt = 1
+        while True:
+            try:
+                return self._blob.download_as_bytes(start=start, end=end)
+            except _notFoundErrors:
+                raise
+            except Exception:
+                if attempt >= STREAM_CHUNK_RETRIES:
+                    raise
+                time.sleep(attempt + random.random())
+                attempt += 1
+
+    def _readAhead(self, start, end, chunkSize):
+        try:
+            for offset in range(start, end, chunkSize):
+                if self._stopped.is_set():
+                    return
+                self._put(self._download(offset, min(offset + chunkSize, end) - 1))
+            self._put(None)
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        while not self._stopped.is_set():
+            try:
+                self._chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def readable(self):
+        """Stream is readable."""
+        return True
+
+    def readinto(self, b):
+        """Copy buffered bytes into b, waiting for the next chunk when the buffer is empty."""
+        while len(self._buffer) == 0:
+            if self._eof:
+                return 0
+            chunk = self._chunks.get()
+            if chunk is None:
+                self._eof = True
+                return 0
+            elif isinstance(chunk, Exception):
+                raise chunk
+            self._buffer = memoryview(chunk)
+
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+
+        return size
+
+    def close(self):
+        """Stop the read ahead thread."""
+        self._stopped.set()
+        io.RawIOBase.close(self)
+
+
+_storage_client = None
+
+
+def get_bucket(bucket_name):
+    """
+    Get a bucket from cloud storage, or from LOCAL_BUCKET_DIR when it is set.
+
+    The cloud storage client is imported on first use so jobs that do not touch cloud storage start faster.
+    """
+    global _storage_client, _notFoundErrors, _preconditionErrors
+    if LOCAL_BUCKET_DIR is not None:
+        return LocalBucket(LOCAL_BUCKET_DIR, bucket_name)
+    if _storage_client is None:
+        from google.cloud import storage
+        from google.cloud.exceptions import NotFound, PreconditionFailed
+
+        _notFoundErrors = (BlobNotFound, NotFound)
+        _preconditionErrors = (BlobPreconditionFailed, PreconditionFailed)
+        _storage_client = storage.Client()
+
+    return _storage_client.bucket(bucket_name)
 
 
 def list_blobs(bucket_name):
     """Lists all the blobs in the bucket."""
-    storage_client = storage.Client()
-    bucket = storage_client.get_bucket(bucket_name)
+    bucket = get_bucket(bucket_name)
 
     blobs = bucket.list_blobs()
 
     for blob in blobs:
         log.info(blob.name)
 
+
 def download_blob(bucket_name, source_blob_name, destination_file_name):
     """Downloads a blob from the bucket."""
-    storage_client = storage.Client()
-    bucket = storage_client.get_bucket(bucket_name)
+    bucket = get_bucket(bucket_name)
     blob = bucket.blob(source_blob_name)
 
     blob.download_to_filename(destination_file_name)
 
 
+def open_blob_stream(bucket_name, blob_name, start=0, end=None):
+    """Open a blob, or a byte range of it, as a text stream for csv.DictReader. .gz and .zst blobs are decompressed."""
+    blob = get_bucket(bucket_name).blob(blob_name)
+    reader = io.BufferedReader(BlobReader(blob, start, end), STREAM_CHUNK_BYTES)
+
+    return open_text_stream(reader, _compression(blob_name))
+
+
+def _find_newline(blob, offset, size):
+    """Position just after the first newline at or after offset, or size if there is none."""
+    while offset < size:
+        data = blob.download_as_bytes(start=offset, end=min(offset + SHARD_SCAN_BYTES, size) - 1)
+        newline = data.find(b"\n")
+        if newline >= 0:
+            return offset + newline + 1
+        offset += len(data)
+
+    return size
+
+
+def shard_byte_range(blob, shard_index, shard_count):
+    """
+    Get the header and the row aligned byte range of one shard of a CSV blob.
+
+    The rows after the header are split into shard_count equal byte ranges. A shard owns every row that starts
+    inside its range, so each row belongs to exactly one shard. Rows must not contain quoted newlines.
+    Returns (header bytes, start, end) with end exclusive.
+    """
+    blob.reload()
+    size = blob.size
+    data_start = _find_newline(blob, 0, size)
+    header = blob.download_as_bytes(start=0, end=data_start - 1) if data_start > 0 else b""
+
+    def row_start(offset):
+        if offset <= data_start:
+            return data_start
+        #: a row starts at offset only if the previous byte ends a row
+        return _find_newline(blob, offset - 1, size)
+
+    data_bytes = size - data_start
+    start = row_start(data_start + data_bytes * shard_index // shard_count)
+    end = row_start(data_start + data_bytes * (shard_index + 1) // shard_count)
+
+    return header, start, end
+
+
+def open_shard_stream(blob, shard_index, shard_count):
+    """Open one shard of a CSV blob, with the header, as a text stream for csv.DictReader."""
+    header, start, end = shard_byte_range(blob, shard_index, shard_count)
+    log.info('Shard %d of %d is bytes %d to %d', shard_index, shard_count, start, end)
+    reader = io.BufferedReader(BlobReader(blob, start, end, prefix=header), STREAM_CHUNK_BYTES)
+
+    return io.TextIOWrapper(reader, encoding="utf-8", newline="")
+
+
+class LeaseCoordinator(object):
+    """
+    Hand out chunks of the input to workers as leases so fast workers take more chunks than slow ones.
+
+    A lease is renewed by its worker while the chunk is geocoded. A lease that is not renewed or completed within
+    leaseSeconds has expired and its chunk is leased again to the next worker that asks.
+    A chunk completed by more than one worker is written to the same output name, so results are not duplicated.
+    """
+
+    def __init__(self, chunkCount, leaseSeconds=LEASE_SECONDS, runId=UNIQUE_RUN):
+        """ctor."""
+        self.chunkCount = chunkCount
+        self._leaseSeconds = leaseSeconds
+        self._runId = runId
+        self._pending = deque(range(chunkCount))
+        #: chunk to (lease token, worker, expires)
+        self._leases = {}
+        self._done = set()
+        self.reissued = 0
+        self._lock = threading.Lock()
+
+    def finished(self):
+        """True when every chunk is done."""
+        return len(self._done) == self.chunkCount
+
+    def lease(self, worker):
+        """Lease the next pending or expired chunk. Tells the worker to wait while every chunk is leased."""
+        with self._lock:
+            now = time.time()
+            if self._pending:
+                chunk = self._pending.popleft()
+            else:
+                expired = [chunk for chunk, (_, _, expires) in self._leases.items() if expires <= now]
+                if not expired:
+                    if self.finished():
+                        return {"done": True}
+                    nextExpiry = min(expires for _, _, expires in self._leases.values())
+                    return {"wait": min(COORDINATOR_POLL_SECONDS, max(nextExpiry - now, 0.1))}
+                chunk = min(expired)
+                self.reissued += 1
+                log.info('Lease on chunk %d held by %s expired, reissuing to %s', chunk, self._leases[chunk][1],
+                         worker)
+            token = uuid.uuid4().hex
+            self._leases[chunk] = (token, worker, now + self._leaseSeconds)
+
+        return {"chunk": chunk,
+                "chunk_count": self.chunkCount,
+                "lease": token,
+                "lease_seconds": self._leaseSeconds,
+                "run": self._runId}
+
+    def renew(self, chunk, token):
+        """Extend a lease. Returns False if the lease expired and was reissued or the chunk is done."""
+        with self._lock:
+            lease = self._leases.get(chunk)
+            if lease is None or lease[0] != token:
+                return False
+            self._leases[chunk] = (token, lease[1], time.time() + self._leaseSeconds)
+
+        return True
+
+    def complete(self, chunk, token):
+        """Mark a chunk done. Returns False if another worker already completed it."""
+        with self._lock:
+            if chunk in self._done:
+                return False
+            self._done.add(chunk)
+            self._leases.pop(chunk, None)
+            if chunk in self._pending:
+                self._pending.remove(chunk)
+
+        return True
+
+    def release(self, chunk, token):
+        """Give a leased chunk back so the next worker that asks gets it."""
+        with self._lock:
+            lease = self._leases.get(chunk)
+            if lease is None or lease[0] != token:
+                return False
+            del self._leases[chunk]
+            self._pending.appendleft(chunk)
+
+        return True
+
+    def status(self):
+        """Chunk counts."""
+        with self._lock:
+            return {"chunks": self.chunkCount,
+                    "pending": len(self._pending),
+                    "leased": len(self._leases),
+                    "done": len(self._done),
+                    "reissued": self.reissued}
+
+
+class CoordinatorHandler(http.server.BaseHTTPRequestHandler):
+    """Json endpoints of the server's LeaseCoordinator."""
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        """Chunk counts."""
+        self._send(200, self.server.coordinator.status())
+
+    def do_POST(self):
+        """Lease, renew, complete and release."""
+        coordinator = self.server.coordinator
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+        action = self.path.strip("/")
+        if action == "lease":
+            self._send(200, coordinator.lease(body.get("worker", self.client_address[0])))
+        elif action in ("renew", "complete", "release"):
+            self._send(200, {"ok": getattr(coordinator, action)(body["chunk"], body["lease"])})
+        else:
+            self._send(404, {"message": "Unknown action {}".format(action)})
+
+    def log_message(self, format, *args):
+        """Do not log requests."""
+        pass
+
+
+def serve_coordinator(port, coordinator):
+    """Serve the coordinator on daemon threads."""
+    server = http.server.ThreadingHTTPServer(("", port), CoordinatorHandler)
+    server.coordinator = coordinator
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+def run_coordinator(port, chunkCount, leaseSeconds):
+    """Serve leases until every chunk is done, then keep telling workers that ask that the run is done."""
+    coordinator = LeaseCoordinator(chunkCount, leaseSeconds)
+    server = serve_coordinator(port, coordinator)
+    log.info('Coordinating %d chunks on port %d', chunkCount, port)
+    lastLog = time.time()
+    while not coordinator.finished():
+        time.sleep(1)
+        if time.time() - lastLog >= COORDINATOR_LOG_SECONDS:
+            log.info('Chunks %s', json.dumps(coordinator.status()))
+            lastLog = time.time()
+    log.info('Chunks %s', json.dumps(coordinator.status()))
+    log.info('Every chunk is done, stopping in %d seconds', COORDINATOR_LINGER_SECONDS)
+    time.sleep(COORDINATOR_LINGER_SECONDS)
+    server.shutdown()
+
+
+class LeaseClient(object):
+    """Worker side of the coordinator api."""
+
+    def __init__(self, url, worker=None):
+        """ctor."""
+        self._url = url.rstrip("/") + "/"
+        self.worker = worker or socket.gethostname()
+
+    @api_retry
+    def _post(self, action, body):
+        """Post to the coordinator. Returns the json response or None when it did not respond."""
+        coordinatorRequest = request.Request(self._url + action, data=json.dumps(body).encode("utf-8"),
+                                             headers={"Content-Type": "application/json"})
+        try:
+            with request.urlopen(coordinatorRequest, timeout=COORDINATOR_TIMEOUT_SECONDS) as response:
+                return json.load(response)
+        except (OSError, ValueError, http.client.HTTPException):
+            return None
+
+    def lease(self):
+        """Lease a chunk. None when the coordinator did not respond."""
+        return self._post("lease", {"worker": self.worker})
+
+    def _leaseAction(self, action, lease):
+        response = self._post(action, {"chunk": lease["chunk"], "lease": lease["lease"]})
+
+        return response is not None and response["ok"]
+
+    def renew(self, lease):
+        """Extend a lease. False if it was reissued or could not be renewed."""
+        return self._leaseAction("renew", lease)
+
+    def complete(self, lease):
+        """Report a chunk done. False if another worker completed it first."""
+        return self._leaseAction("complete", lease)
+
+    def release(self, lease):
+        """Give a chunk back to the coordinator."""
+        return self._leaseAction("release", lease)
+
+
+class LeaseRenewer(object):
+    """Renew a lease on a background thread until stopped."""
+
+    def __init__(self, client, lease):
+        """ctor."""
+        self._client = client
+        self._lease = lease
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._renew, daemon=True)
+        self._thread.start()
+
+    def _renew(self):
+        while not self._stopped.wait(self._lease["lease_seconds"] / 3.0):
+            if not self._client.renew(self._lease):
+                log.info('Lease on chunk %d was lost, it may be geocoded again by another worker',
+                         self._lease["chunk"])
+                return
+
+    def stop(self):
+        """Stop renewing."""
+        self._stopped.set()
+        self._thread.join()
+
+
+def geocode_leased_chunks(client, inputBlob, outputDir, outputBucket, extension, createTool, compression=None):
+    """
+    Geocode chunks leased from the coordinator until every chunk of the input is done.
+
+    A chunk is a row aligned byte range of inputBlob like a shard. createTool(inputTable, outputFileName) returns
+    the TableGeocoder for a chunk. Each chunk's results are uploaded to outputBucket, when there is one, before the
+    chunk is reported complete, compressed when compression is set. Returns False when the coordinator stops
+    responding or a chunk fails.
+    """
+    while True:
+        lease = client.lease()
+        if lease is None:
+            log.info('Coordinator failed to respond')
+            return False
+        elif lease.get("done"):
+            log.info('Every chunk is done')
+            return True
+        elif "wait" in lease:
+            time.sleep(lease["wait"])
+            continue
+
+        chunk, chunkCount = lease["chunk"], lease["chunk_count"]
+        outputFileName = "GeocodeResults_{}_chunk{:05d}of{}{}".format(lease["run"], chunk, chunkCount, extension)
+        log.info('Leased chunk %d of %d', chunk, chunkCount)
+        renewer = LeaseRenewer(client, lease)
+        chunkInput = open_shard_stream(inputBlob, chunk, chunkCount)
+        try:
+            completed = createTool(chunkInput, outputFileName).start()
+        finally:
+            chunkInput.close()
+            renewer.stop()
+        if not completed:
+            client.release(lease)
+            return False
+
+        outputPath = os.path.join(outputDir, outputFileName)
+        if outputBucket:
+            uploadPath = outputPath if compression is None else compress_file(outputPath, compression)
+            upload_blob(outputBucket, uploadPath, os.path.basename(uploadPath))
+            for path in {outputPath, uploadPath}:
+                os.remove(path)
+            log.info("Uploading %s complete", os.path.basename(uploadPath))
+        if not client.complete(lease):
+            log.info('Chunk %d was already completed by another worker', chunk)
+
+
 def upload_blob(bucket_name, source_file_name, destination_blob_name):
     """Uploads a file to the bucket."""
-    storage_client = storage.Client()
-    bucket = storage_client.get_bucket(bucket_name)
+    bucket = get_bucket(bucket_name)
     blob = bucket.blob(destination_blob_name)
 
     blob.upload_from_filename(source_file_name)
 
 
+def blob_identity(blob):
+    """Generation, md5 and size of a blob, to tell a new input apart from an earlier one with the same name."""
+    blob.reload()
+
+    return {"generation": blob.generation, "md5": getattr(blob, "md5_hash", None), "size": blob.size}
+
+
+def delete_blob(bucket_name, blob_name):
+    """Deletes a blob from the bucket."""
+    bucket = get_bucket(bucket_name)
+    blob = bucket.blob(blob_name)
+
+    blob.delete()
+
+
+class Checkpoint(object):
+    """
+    Geocoding progress saved to the output bucket so a retried job resumes instead of starting over.
+
+    A checkpoint is the partial output, uploaded as ResultUploader parts, and a json file with the number of input
+    rows completed, the rows deferred for retry, the parts and size of the output at that point and the identity
+    of the input. Each save uploads only the output written since the last one, on a background thread, and the
+    json is uploaded after its parts so it never refers to missing output.
+    A checkpoint for a different input identity, such as a new csv uploaded with the same name, is ignored.
+    """
+
+    def __init__(self, bucketName, inputName, outputDir, outputFileName, inputIdentity=None):
+        """ctor."""
+        self._bucketName = bucketName
+        self.inputIdentity = inputIdentity
+        self._blobName = "checkpoints/{}.json".format(inputName)
+        self._localPath = os.path.join(outputDir, "checkpoint.json")
+        self._outputDir = outputDir
+        self.outputFileName = outputFileName
+        self.rowsCompleted = 0
+        self.deferred = []
+        self.loaded = False
+        self._uploader = None
+
+    def _outputUploader(self):
+        if self._uploader is None:
+            self._uploader = ResultUploader(self._bucketName, "checkpoints/{}".format(self.outputFileName), 0)
+
+        return self._uploader
+
+    def load(self):
+        """Download the checkpoint and rebuild the partial output. Returns False if there is no usable checkpoint."""
+        try:
+            download_blob(self._bucketName, self._blobName, self._localPath)
+        except _notFoundErrors:
+            return False
+
+        with open(self._localPath) as checkpointFile:
+            checkpoint = json.load(checkpointFile)
+        if checkpoint.get("input") != self.inputIdentity:
+            log.info('Ignoring checkpoint %s, it was saved for a different version of the input', self._blobName)
+            return False
+        outputPath = os.path.join(self._outputDir, checkpoint["output_file_name"])
+        bucket = get_bucket(self._bucketName)
+        try:
+            with open(outputPath, "wb") as outputFile:
+                for part in checkpoint["output_parts"]:
+                    outputFile.write(bucket.blob(part).download_as_bytes())
+        except _notFoundErrors:
+            log.info('Ignoring checkpoint %s, its partial output is missing', self._blobName)
+            os.remove(outputPath)
+            return False
+        #: drop rows uploaded after the checkpoint was taken
+        with open(outputPath, "r+b") as outputFile:
+            outputFile.truncate(checkpoint["output_bytes"])
+
+        self.outputFileName = checkpoint["output_file_name"]
+        self.rowsCompleted = checkpoint["rows_completed"]
+        self.deferred = checkpoint.get("deferred", [])
+        self.loaded = True
+        self._uploader = None
+        self._outputUploader().resume(checkpoint["output_parts"], checkpoint["output_bytes"])
+
+        return True
+
+    def save(self, rowsCompleted, outputPath, deferred=()):
+        """Start uploading the output synced since the last save and then the checkpoint."""
+        outputBytes = os.path.getsize(outputPath)
+        uploader = self._outputUploader()
+        checkpoint = {"output_file_name": self.outputFileName,
+                      "rows_completed": rowsCompleted,
+                      "output_parts": uploader.uploadThrough(outputPath, outputBytes),
+                      "output_bytes": outputBytes,
+                      "deferred": list(deferred),
+                      "input": self.inputIdentity}
+        uploader.then(self._upload, checkpoint)
+        self.rowsCompleted = rowsCompleted
+        self.deferred = list(deferred)
+
+    def _upload(self, partUploads, checkpoint):
+        if any(upload.exception() is not None for upload in partUploads):
+            log.info('Checkpoint at row %d not saved, a part of the output failed to upload',
+                     checkpoint["rows_completed"])
+            return
+        try:
+            get_bucket(self._bucketName).blob(self._blobName).upload_from_string(
+                json.dumps(checkpoint).encode("utf-8"))
+        except Exception as e:
+            log.info('Checkpoint at row %d not saved: %s', checkpoint["rows_completed"], e)
+
+    def wait(self):
+        """Wait for the checkpoint uploads in progress. A failed upload is logged and does not fail the job."""
+        if self._uploader is None:
+            return
+        try:
+            self._uploader.wait()
+        except Exception as e:
+            log.info('Checkpoint upload failed: %s', e)
+
+    def clear(self):
+        """Delete the checkpoint after the final results have been uploaded."""
+        self.wait()
+        bucket = get_bucket(self._bucketName)
+        blobs = list(bucket.list_blobs(prefix="checkpoints/{}.parts/".format(self.outputFileName)))
+        for blob in [bucket.blob(self._blobName)] + blobs:
+            try:
+                blob.delete()
+            except _notFoundErrors:
+                pass
+
+
+class ResultUploader(object):
+    """
+    Upload the output file in parts while it is being written.
+
+    ResultWriter reports each flush. Once partBytes of new rows are flushed, or intervalSeconds have passed,
+    the new bytes are uploaded in the background as the next {partPrefix}NNNNN object, so partial results
+    can be read during the run. finish uploads the rest, composes the parts into blobName and deletes every
+    part under partPrefix. A part prefix that does not change between attempts of a job, unlike blobName,
+    lets deleteParts remove the parts of an attempt that never finished.
+    """
+
+    def __init__(self, bucketName, blobName, intervalSeconds, partBytes=UPLOAD_PART_BYTES, compression=None,
+                 partPrefix=None):
+        """ctor. With compression each part is compressed on its own, so the composed object is compressed too."""
+        self._bucketName = bucketName
+        self._compression = compression
+        self._blobName = blobName
+        self._partPrefix = partPrefix or "{}.parts/".format(blobName)
+        self._intervalSeconds = intervalSeconds
+        self._partBytes = partBytes
+        self._uploadedBytes = 0
+        self._lastUpload = time.time()
+        self._parts = []
+        self._uploads = []
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def flushed(self, outputFilePath, fileSize):
+        """Start a part upload if enough rows or time have accumulated since the last one."""
+        newBytes = fileSize - self._uploadedBytes
+        if newBytes >= self._partBytes or (newBytes > 0 and time.time() - self._lastUpload >= self._intervalSeconds):
+            self._uploadPart(outputFilePath, fileSize)
+
+    def _uploadPart(self, outputFilePath, fileSize):
+        partName = "{}{:05d}".format(self._partPrefix, len(self._parts))
+        self._parts.append(partName)
+        self._uploads.append(self._executor.submit(self._upload, outputFilePath, self._uploadedBytes, fileSize,
+                                                   partName))
+        self._uploadedBytes = fileSize
+        self._lastUpload = time.time()
+
+    def _upload(self, outputFilePath, start, end, partName):
+        with open(outputFilePath, "rb") as outputFile:
+            outputFile.seek(start)
+            data = outputFile.read(end - start)
+        if self._compression is not None:
+            data = compress_bytes(data, self._compression)
+        get_bucket(self._bucketName).blob(partName).upload_from_string(data)
+        log.info("Uploaded %s", partName)
+
+    def resume(self, parts, uploadedBytes):
+        """Continue after parts uploaded by an earlier attempt that hold the first uploadedBytes of the output."""
+        self._parts = list(parts)
+        self._uploadedBytes = uploadedBytes
+
+    def uploadThrough(self, outputFilePath, fileSize):
+        """Start uploading the bytes before fileSize that are not uploaded yet. Returns the part names so far."""
+        if fileSize > self._uploadedBytes:
+            self._uploadPart(outputFilePath, fileSize)
+
+        return list(self._parts)
+
+    def then(self, function, *args):
+        """Run function on the upload thread once the uploads started so far have finished."""
+        self._uploads.append(self._executor.submit(function, list(self._uploads), *args))
+
+    def wait(self):
+        """Wait for the uploads started so far. Raises the first upload error."""
+        uploads, self._uploads = self._uploads, []
+        for upload in uploads:
+            upload.result()
+
+    def finish(self, outputFilePath):
+        """Upload the remaining rows, compose the parts into the final object and delete the parts."""
+        fileSize = os.path.getsize(outputFilePath)
+        if fileSize > self._uploadedBytes or len(self._parts) == 0:
+            self._uploadPart(outputFilePath, fileSize)
+        self._executor.shutdown(wait=True)
+        self.wait()
+
+        bucket = get_bucket(self._bucketName)
+        destination = bucket.blob(self._blobName)
+        #: compose accepts at most MAX_COMPOSE_SOURCES, so append the rest onto the destination in steps
+        remaining = [bucket.blob(part) for part in self._parts]
+        destination.compose(remaining[:MAX_COMPOSE_SOURCES])
+        remaining = remaining[MAX_COMPOSE_SOURCES:]
+        while remaining:
+            destination.compose([destination] + remaining[:MAX_COMPOSE_SOURCES - 1])
+            remaining = remaining[MAX_COMPOSE_SOURCES - 1:]
+
+        #: also removes stale parts left by an earlier attempt of the job
+        self.deleteParts()
+
+    def deleteParts(self):
+        """Delete every blob under the part prefix. Returns the number deleted."""
+        parts = list(get_bucket(self._bucketName).list_blobs(prefix=self._partPrefix))
+        for part in parts:
+            try:
+                part.delete()
+            except _notFoundErrors:
+                pass
+
+        return len(parts)
+
+
+def open_result_store(path, bucket_name, blob_name, ttl_days, max_entries):
+    """Open the result store, downloading it from the bucket first when one is given."""
+    if bucket_name:
+        try:
+            download_blob(bucket_name, blob_name, path)
+            log.info('Downloading result store %s complete', blob_name)
+        except _notFoundErrors:
+            log.info('Result store %s not found, starting empty', blob_name)
+
+    return ResultStore(path, ttl_days, max_entries)
+
+
+def upload_result_store(path, since, bucket_name, blob_name, ttl_days, max_entries):
+    """
+    Merge the responses stored in path at or after since into the result store in the bucket.
+
+    The bucket's copy is downloaded and the merged file is uploaded only if the blob's generation is unchanged,
+    so jobs finishing at the same time retry the merge instead of overwriting each other's responses.
+    Returns the number of responses in the merged store.
+    """
+    blob = get_bucket(bucket_name).blob(blob_name)
+    mergePath = path + ".merge"
+    for attempt in range(1, RESULT_STORE_UPLOAD_ATTEMPTS + 1):
+        if os.path.exists(mergePath):
+            os.remove(mergePath)
+        try:
+            blob.reload()
+            generation = blob.generation
+            blob.download_to_filename(mergePath, if_generation_match=generation)
+        except _notFoundErrors:
+            generation = 0
+        except _preconditionErrors:
+            continue
+
+        mergedStore = ResultStore(mergePath, ttl_days, max_entries)
+        mergedStore.merge(path, since)
+        entries = len(mergedStore)
+        mergedStore.close()
+        try:
+            blob.upload_from_filename(mergePath, if_generation_match=generation)
+        except _preconditionErrors:
+            log.info('Result store %s changed while merging, retrying', blob_name)
+            time.sleep(attempt * random.random())
+            continue
+        finally:
+            os.remove(mergePath)
+
+        return entries
+
+    raise RuntimeError("Result store {} changed on every one of {} merge attempts".format(
+        blob_name, RESULT_STORE_UPLOAD_ATTEMPTS))
+
+
+def close_result_store(result_store, bucket_name, blob_name, ttl_days, max_entries):
+    """Close the result store and merge its new responses into the bucket's result store when one is given."""
+    result_store.close()
+    if bucket_name:
+        entries = upload_result_store(result_store.path, result_store.openedAt, bucket_name, blob_name, ttl_days,
+                                      max_entries)
+        log.info('Uploading result store %s with %d entries complete', blob_name, entries)
+
+
 def _setup_logging():
     log = logging.getLogger('geocoder')
     log.setLevel(logging.DEBUG)
@@ -449,7 +2976,8 @@ if __name__ == "__main__":
     parser.add_argument('--input_bucket', action='store', dest='input_bucket',
                         help='GCS bucket with input data')
     parser.add_argument('--input_csv', action='store', dest='input_csv',
-                        help='Name of the CSV in input_bucket')
+                        help='Name of the CSV in input_bucket. Names ending in .gz or .zst are decompressed while they '
+                             'are read and names ending in .parquet are read with pyarrow.')
     parser.add_argument('--id_field', action='store', dest='id_field',
                         help='ID field in the csv. d')
     parser.add_argument('--address_field', action='store', dest='address_field',
@@ -462,6 +2990,110 @@ if __name__ == "__main__":
                         help='Do not download from GCS. Downloaded data must already be local.')
     parser.add_argument('--no_upload', action='store_true', dest='no_ul',
                         help='Do not upload to GCS.')
+    parser.add_argument('--stream_input', action='store_true', dest='stream_input',
+                        help='Geocode while reading input_csv from GCS instead of downloading it first.')
+    parser.add_argument('--local_bucket_dir', action='store', dest='local_bucket_dir',
+                        help='Use sub directories of this directory as buckets instead of GCS.')
+    parser.add_argument('--shard_index', action='store', dest='shard_index', type=int,
+                        default=int(os.environ.get('JOB_COMPLETION_INDEX', 0)),
+                        help='Shard of the input to geocode. Defaults to JOB_COMPLETION_INDEX from an Indexed Job.')
+    parser.add_argument('--shard_count', action='store', dest='shard_count', type=int, default=1,
+                        help='Split the input into this many row aligned byte ranges and only geocode shard_index.')
+    parser.add_argument('--coordinator', action='store', dest='coordinator',
+                        help='Url of a coordinator such as http://geocode-coordinator:8000/. Lease chunks of input_csv '
+                             'from it and geocode them until every chunk is done, instead of one shard.')
+    parser.add_argument('--serve_coordinator', action='store_true', dest='serve_coordinator',
+                        help='Run the coordinator for input_csv instead of geocoding. Exits when every chunk is done.')
+    parser.add_argument('--coordinator_port', action='store', dest='coordinator_port', type=int,
+                        default=COORDINATOR_PORT,
+                        help='Port the coordinator listens on.')
+    parser.add_argument('--chunk_mb', action='store', dest='chunk_mb', type=float,
+                        default=LEASE_CHUNK_BYTES / 1024 / 1024,
+                        help='Size of the row aligned input chunks the coordinator leases to workers.')
+    parser.add_argument('--lease_seconds', action='store', dest='lease_seconds', type=float, default=LEASE_SECONDS,
+                        help='A chunk is leased to another worker when its worker has not renewed the lease for this '
+                             'many seconds.')
+    parser.add_argument('--metrics_port', action='store', dest='metrics_port', type=int, default=0,
+                        help='Serve Prometheus metrics on this port. 0 disables the endpoint.')
+    parser.add_argument('--workers', action='store', dest='workers', type=int, default=1,
+                        help='Number of concurrent geocode requests. Results are written in input order, except rows '
+                             'deferred after failed requests which are written after the main pass.')
+    parser.add_argument('--pool_size', action='store', dest='pool_size', type=int, default=POOL_SIZE,
+                        help='Maximum idle keep-alive connections kept to the geocode host.')
+    parser.add_argument('--pool_idle_timeout', action='store', dest='pool_idle_timeout', type=float,
+                        default=POOL_IDLE_TIMEOUT_SECONDS,
+                        help='Seconds an idle keep-alive connection is kept before it is closed.')
+    parser.add_argument('--request_timeout', action='store', dest='request_timeout', type=float,
+                        default=REQUEST_TIMEOUT_SECONDS,
+                        help='Seconds to wait for the geocode api to accept a connection or answer before the request '
+                             'fails and is retried.')
+    parser.add_argument('--initial_rate', action='store', dest='initial_rate', type=float,
+                        default=INITIAL_RATE_PER_SECOND,
+                        help='Requests per second to start at. The rate doubles each second until the api slows '
+                             'down or returns errors and then adapts to the api.')
+    parser.add_argument('--max_rate', action='store', dest='max_rate', type=float, default=MAX_RATE_PER_SECOND,
+                        help='Ceiling on requests per second for this job. No ceiling by default.')
+    parser.add_argument('--upload_interval', action='store', dest='upload_interval', type=float, default=0,
+                        help='Upload new results to output_bucket as parts at least this often in seconds and '
+                             'compose them at the end. 0 uploads once when geocoding is complete.')
+    parser.add_argument('--upload_part_mb', action='store', dest='upload_part_mb', type=float,
+                        default=UPLOAD_PART_BYTES / 1024 / 1024,
+                        help='Upload a part as soon as this many MB of new results are written.')
+    parser.add_argument('--batch_size', action='store', dest='batch_size', type=int, default=1,
+                        help='Addresses sent per multiple address request. 1 sends single address requests. Max {}.'.format(
+                            MAX_BATCH_SIZE))
+    parser.add_argument('--flush_rows', action='store', dest='flush_rows', type=int, default=FLUSH_ROWS,
+                        help='Flush buffered results to the output file after this many rows.')
+    parser.add_argument('--flush_seconds', action='store', dest='flush_seconds', type=float, default=FLUSH_SECONDS,
+                        help='Flush buffered results to the output file after this many seconds.')
+    parser.add_argument('--cache_size', action='store', dest='cache_size', type=int, default=CACHE_SIZE,
+                        help='Maximum geocode responses kept to answer repeated addresses. 0 disables the cache.')
+    parser.add_argument('--result_store', action='store', dest='result_store',
+                        help='Local SQLite file used to reuse geocode responses between runs.')
+    parser.add_argument('--result_store_bucket', action='store', dest='result_store_bucket',
+                        help='GCS bucket the result store is downloaded from at start and uploaded to at exit.')
+    parser.add_argument('--result_store_blob', action='store', dest='result_store_blob',
+                        default='geocode_result_store.sqlite',
+                        help='Name of the result store in result_store_bucket.')
+    parser.add_argument('--result_store_ttl_days', action='store', dest='result_store_ttl_days', type=float,
+                        default=RESULT_STORE_TTL_DAYS,
+                        help='Days a stored response is reused before it is geocoded again.')
+    parser.add_argument('--result_store_max_entries', action='store', dest='result_store_max_entries', type=int,
+                        default=RESULT_STORE_MAX_ENTRIES,
+                        help='Maximum responses kept in the result store. The oldest are removed first.')
+    parser.add_argument('--checkpoint_rows', action='store', dest='checkpoint_rows', type=int, default=CHECKPOINT_ROWS,
+                        help='Save a checkpoint to output_bucket every this many rows so a retried job resumes. '
+                             '0 disables checkpoints.')
+    parser.add_argument('--retry_budget', action='store', dest='retry_budget', type=float, default=RETRY_BUDGET_RATIO,
+                        help='Failed rows are retried and written after the main pass. Retries allowed per input row, '
+                             'in addition to {}.'.format(RETRY_BUDGET_MIN))
+    parser.add_argument('--max_outage_seconds', action='store', dest='max_outage_seconds', type=float,
+                        default=MAX_OUTAGE_SECONDS,
+                        help='Stop and checkpoint when the geocode service fails for this many seconds.')
+    parser.add_argument('--output_format', action='store', dest='output_format', choices=('csv', 'parquet'),
+                        default='csv',
+                        help='Write results as csv or as parquet with typed Score, XCoord and YCoord columns. '
+                             'Parquet requires pyarrow and disables checkpoints and incremental uploads.')
+    parser.add_argument('--output_compression', action='store', dest='output_compression', choices=('gzip', 'zstd'),
+                        help='Compress the csv results uploaded to output_bucket and add .gz or .zst to the name. '
+                             'zstd requires zstandard.')
+    parser.add_argument('--format_processes', action='store', dest='format_processes', type=int, default=0,
+                        help='Processes used to format addresses. 0 formats on the input reading thread.')
+    parser.add_argument('--read_ahead_chunks', action='store', dest='read_ahead_chunks', type=int,
+                        default=READ_AHEAD_CHUNKS,
+                        help='Chunks of {} input rows read and formatted ahead of geocoding.'.format(READ_CHUNK_ROWS))
+    parser.add_argument('--zone_window', action='store', dest='zone_window', type=int, default=0,
+                        help='Send this many rows at a time to the api grouped by zone to keep its locator caches '
+                             'warm. Output stays in input order, except deferred rows as with --workers. 0 sends rows '
+                             'in input order.')
+    parser.add_argument('--profile', action='store_true', dest='profile',
+                        help='Time each stage of the run and write the timings next to the results as '
+                             '{output}.profile.json. Uploaded to output_bucket with the results.')
+    parser.add_argument('--profile_sample', action='store', dest='profile_sample', type=int, default=0,
+                        help='With --profile also cProfile the main thread for 1000 rows out of every this many '
+                             'thousand and write {output}.pstats. 1 profiles every row. 0 disables the cProfile.')
+    parser.add_argument('--skip_version_check', action='store_true', dest='skip_version_check',
+                        help='Do not check for a newer version. The check otherwise runs in the background.')
     args = parser.parse_args()
     apiKey = args.apikey
     inputBucket = args.input_bucket
@@ -470,42 +3102,197 @@ if __name__ == "__main__":
     addressField = args.address_field
     zoneField = args.zone_field
     outputBucket = args.output_bucket
+    if args.shard_count < 1:
+        parser.error('--shard_count must be at least 1')
+    if args.shard_count > 1 and not 0 <= args.shard_index < args.shard_count:
+        parser.error('--shard_index must be from 0 to {}'.format(args.shard_count - 1))
+    if inputCsv and (_compression(inputCsv) or _isParquet(inputCsv)):
+        if args.shard_count > 1 or args.coordinator or args.serve_coordinator:
+            parser.error('--shard_count and --coordinator split the input by bytes and need an uncompressed csv')
+        #: keep the extension so the downloaded input is read the same way
+        inputExtension = '.parquet' if _isParquet(inputCsv) else '.csv' + os.path.splitext(inputCsv)[1]
+        inputTable = './tmp/inputdata' + inputExtension
+    if args.output_compression and args.output_format == 'parquet':
+        parser.error('--output_compression is for csv output, parquet output is already compressed')
 
     _setup_logging()
-    global log
-    log = logging.getLogger('geocoder')
-
-    if not args.no_dl:
+    startup = PhaseTimer()
+    LOCAL_BUCKET_DIR = args.local_bucket_dir
+    inputBlob = None
+    if args.shard_count > 1 or args.coordinator or args.serve_coordinator:
+        if args.no_dl:
+            inputBlob = LocalBucket(os.path.dirname(os.path.abspath(inputTable)), '').blob(os.path.basename(inputTable))
+        else:
+            inputBlob = get_bucket(inputBucket).blob(inputCsv)
+    if args.serve_coordinator:
+        inputBlob.reload()
+        run_coordinator(args.coordinator_port, int(math.ceil(inputBlob.size / (args.chunk_mb * 1024 * 1024))),
+                        args.lease_seconds)
+        logging.shutdown()
+        sys.exit(0)
+
+    #: check the api key while the input is opened
+    apiKeyCheck = check_api_key(apiKey)
+    if not args.skip_version_check:
+        threading.Thread(target=log_version_check, args=(VERSION_CHECK_URL,), daemon=True).start()
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+        log.info('Serving metrics on port %d', args.metrics_port)
+
+    checkpointName = inputCsv or os.path.basename(inputTable)
+    if args.coordinator:
+        #: chunks are opened as they are leased
+        log.info('Leasing chunks of %s from %s', inputBlob.name, args.coordinator)
+    elif args.shard_count > 1:
+        inputTable = open_shard_stream(inputBlob, args.shard_index, args.shard_count)
+        checkpointName = '{}.shard{}of{}'.format(checkpointName, args.shard_index, args.shard_count)
+        outputFileName = "GeocodeResults_{}_shard{}of{}.csv".format(UNIQUE_RUN, args.shard_index, args.shard_count)
+        log.info('Streaming shard %d of %d from %s', args.shard_index, args.shard_count, inputBlob.name)
+    elif args.stream_input and not args.no_dl and not _isParquet(inputCsv):
+        inputTable = open_blob_stream(inputBucket, inputCsv)
+        log.info('Streaming %s', inputCsv)
+    elif not args.no_dl:
         download_blob(inputBucket,
                       inputCsv,
                       inputTable)
         log.info('Downloading %s complete', inputCsv)
+    startup.lap('input')
 
     outputGeodatabase = None
     version = VERSION_NUMBER
     log.info("Geocode Table Version " + version)
-    currentVersion = get_version(VERSION_CHECK_URL)
-    if currentVersion and VERSION_NUMBER != currentVersion:
-        log.info('Current version is: {}'.format(currentVersion))
-        log.info('Please download at: https://github.com/agrc/geocoding-toolbox/raw/{}/AGRC Geocode Tools.tbx'.format(BRANCH))
 
-    Tool = TableGeocoder(apiKey,
-                         inputTable,
-                         idField,
-                         addressField,
-                         zoneField,
-                         locator,
-                         spatialRef,
-                         outputDir,
-                         outputFileName,
-                         outputGeodatabase)
-    Tool.start()
-    log.info("Geocode completed")
-
-    if not args.no_ul:
+    if args.output_format == 'parquet':
+        #: a parquet file is only readable once its footer is written, so it can not be resumed or uploaded in parts
+        outputFileName = os.path.splitext(outputFileName)[0] + '.parquet'
+        args.checkpoint_rows = 0
+        args.upload_interval = 0
+
+    if args.coordinator:
+        #: a chunk that fails is leased again instead of resumed, and its results are uploaded when it is done
+        args.checkpoint_rows = 0
+        args.upload_interval = 0
+
+    checkpoint = None
+    if args.checkpoint_rows > 0 and not args.no_ul:
+        if inputBlob is None and args.no_dl:
+            inputBlob = LocalBucket(os.path.dirname(os.path.abspath(inputTable)), '').blob(os.path.basename(inputTable))
+        elif inputBlob is None:
+            inputBlob = get_bucket(inputBucket).blob(inputCsv)
+        checkpoint = Checkpoint(outputBucket, checkpointName, outputDir, outputFileName, blob_identity(inputBlob))
+        if checkpoint.load():
+            outputFileName = checkpoint.outputFileName
+            log.info('Checkpoint found for %s at row %d with %d deferred rows', outputFileName,
+                     checkpoint.rowsCompleted, len(checkpoint.deferred))
+        startup.lap('checkpoint')
+
+    outputBlobName = outputFileName
+    if args.output_compression:
+        outputBlobName += COMPRESSION_SUFFIXES[args.output_compression]
+    resultUploader = None
+    if args.upload_interval > 0 and not args.no_ul:
+        #: parts are named after the input instead of the run, so a restarted job finds the parts of the last one
+        resultUploader = ResultUploader(outputBucket, outputBlobName, args.upload_interval,
+                                        int(args.upload_part_mb * 1024 * 1024), args.output_compression,
+                                        "uploads/{}.parts/".format(checkpointName))
+        stalePartCount = resultUploader.deleteParts()
+        if stalePartCount:
+            log.info('Deleted %d result parts left by an earlier attempt', stalePartCount)
+
+    resultStore = None
+    if args.result_store:
+        resultStore = open_result_store(args.result_store,
+                                        args.result_store_bucket,
+                                        args.result_store_blob,
+                                        args.result_store_ttl_days,
+                                        args.result_store_max_entries)
+        startup.lap('result store')
+
+    profiler = None
+    if args.profile:
+        profiler = StageProfiler(args.profile_sample)
+
+    toolOptions = dict(workers=args.workers,
+                       poolSize=args.pool_size,
+                       poolIdleTimeout=args.pool_idle_timeout,
+                       requestTimeout=args.request_timeout,
+                       batchSize=args.batch_size,
+                       flushRows=args.flush_rows,
+                       flushSeconds=args.flush_seconds,
+                       cacheSize=args.cache_size,
+                       resultStore=resultStore,
+                       checkpoint=checkpoint,
+                       checkpointRows=args.checkpoint_rows,
+                       retryBudget=args.retry_budget,
+                       maxOutageSeconds=args.max_outage_seconds,
+                       outputFormat=args.output_format,
+                       formatProcesses=args.format_processes,
+                       readAheadChunks=args.read_ahead_chunks,
+                       zoneWindow=args.zone_window,
+                       initialRate=args.initial_rate,
+                       maxRate=args.max_rate,
+                       resultUploader=resultUploader,
+                       apiKeyCheck=apiKeyCheck,
+                       profiler=profiler)
+    try:
+        if args.coordinator:
+            completed = geocode_leased_chunks(LeaseClient(args.coordinator),
+                                              inputBlob,
+                                              outputDir,
+                                              None if args.no_ul else outputBucket,
+                                              os.path.splitext(outputFileName)[1],
+                                              lambda chunkTable, chunkFileName: TableGeocoder(
+                                                  apiKey, chunkTable, idField, addressField, zoneField, locator,
+                                                  spatialRef, outputDir, chunkFileName, outputGeodatabase,
+                                                  **toolOptions),
+                                              args.output_compression)
+        else:
+            Tool = TableGeocoder(apiKey,
+                                 inputTable,
+                                 idField,
+                                 addressField,
+                                 zoneField,
+                                 locator,
+                                 spatialRef,
+                                 outputDir,
+                                 outputFileName,
+                                 outputGeodatabase,
+                                 **toolOptions)
+            completed = Tool.start()
+    finally:
+        if resultStore is not None:
+            close_result_store(resultStore, args.result_store_bucket, args.result_store_blob,
+                               args.result_store_ttl_days, args.result_store_max_entries)
+        metrics.set('rows_per_second', round(metrics.counter('rows_total') / max(metrics.seconds(), 0.001), 1))
+        log.info('Metrics summary %s', json.dumps(metrics.summary()))
+    if completed:
+        log.info("Geocode completed")
+    else:
+        log.info("Geocode stopped before every row was geocoded")
+
+    profilePaths = []
+    if profiler is not None:
+        profilePaths = profiler.write(outputDir, os.path.splitext(outputFileName)[0])
+
+    if resultUploader is not None:
+        resultUploader.finish(os.path.join(outputDir, outputFileName))
+        log.info("Composing %s complete", outputBlobName)
+    elif not args.no_ul and not args.coordinator:
+        outputPath = os.path.join(outputDir, outputFileName)
+        if args.output_compression:
+            outputPath = compress_file(outputPath, args.output_compression)
         upload_blob(outputBucket,
-                    os.path.join(outputDir, outputFileName),
-                    outputFileName)
-        log.info("Uploading %s complete", outputFileName)
+                    outputPath,
+                    outputBlobName)
+        log.info("Uploading %s complete", outputBlobName)
+    if not args.no_ul:
+        for profilePath in profilePaths:
+            upload_blob(outputBucket, profilePath, os.path.basename(profilePath))
+            log.info("Uploading %s complete", os.path.basename(profilePath))
+    if checkpoint is not None and completed:
+        checkpoint.clear()
 
     logging.shutdown()
+    if not completed:
+        #: fail the pod so the job is retried, resuming from the checkpoint or leasing the chunks still pending
+        sys.exit(1)
@@ -0,0 +1,42 @@
+"""Shared fixtures. Tests run against benchmark/stub_api.py and LocalBucket instead of the web API and GCS."""
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..'))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'benchmark'))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'vista'))
+
+import geocode_gcs_csv as geocode  # noqa: E402
+from stub_api import StubConfig, serve  # noqa: E402
+
+
+@pytest.fixture
+def stub_api(monkeypatch):
+    """Start the stub api with StubConfig options and point GEOCODE_HOST at it. Returns the server."""
+    servers = []
+
+    def start(**options):
+        options.setdefault('latency', 'fixed:0')
+        server = serve(StubConfig(**options))
+        servers.append(server)
+        monkeypatch.setattr(geocode, 'GEOCODE_HOST', 'http://127.0.0.1:{}/'.format(server.server_address[1]))
+
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def local_buckets(monkeypatch, tmp_path):
+    """Use sub directories of a temporary directory as buckets. Returns the directory."""
+    bucketDir = tmp_path / 'buckets'
+    bucketDir.mkdir()
+    monkeypatch.setattr(geocode, 'LOCAL_BUCKET_DIR', str(bucketDir))
+
+    return bucketDir
@@ -0,0 +1,55 @@
+"""AddressFormatter's translation table matches the original str.replace formatter."""
+import csv
+
+import geocode_gcs_csv as geocode
+from formatter_benchmark import legacy_format_address, vista_records
+
+
+def format_address(address):
+    return geocode.AddressFormatter(1, address, 'PROVO').address
+
+
+def test_every_character_is_replaced_like_the_legacy_formatter():
+    for code in range(0, 0x3000):
+        address = '1 N{}MAIN ST'.format(chr(code))
+
+        assert format_address(address) == legacy_format_address(address), hex(code)
+
+
+def test_generated_vista_addresses_match_the_legacy_formatter():
+    for _, address, _ in vista_records(20000):
+        assert format_address(address) == legacy_format_address(address), address
+
+
+def test_format_records_keeps_the_input_order():
+    records = vista_records(100)
+
+    formatted = geocode.AddressFormatter.formatRecords(records)
+
+    assert [formatter.id for formatter in formatted] == [record[0] for record in records]
+    assert [formatter.address for formatter in formatted] == [legacy_format_address(record[1]) for record in records]
+
+
+def test_zones_are_trimmed_to_five_digit_zip_codes():
+    assert geocode.AddressFormatter(1, '1 N MAIN ST', ' 84121-1234 ').zone == '84121'
+    assert geocode.AddressFormatter(1, '1 N MAIN ST', 'S. SALT LAKE').zone == 'S SALT LAKE'
+
+
+def test_geocoded_table_sends_the_formatted_address(stub_api, tmp_path):
+    stub_api(not_found_rate=0)
+    inputPath = tmp_path / 'input.csv'
+    addresses = ['1 N MAIN ST #4', '2 N MAIN ST & STATE', '3 N ST. MARY\'S DR', '4 1/2 CAÑON RD']
+    with open(str(inputPath), 'w', newline='', encoding='utf-8') as inputFile:
+        writer = csv.writer(inputFile)
+        writer.writerow(['id', 'address', 'zone'])
+        writer.writerows((str(i), address, 'PROVO') for i, address in enumerate(addresses))
+
+    for formatProcesses in (0, 2):
+        assert geocode.TableGeocoder('key', str(inputPath), 'id', 'address', 'zone', 'all', 26912, str(tmp_path),
+                                     'results{}.csv'.format(formatProcesses), None,
+                                     formatProcesses=formatProcesses).start()
+
+        with open(str(tmp_path / 'results{}.csv'.format(formatProcesses)), encoding='utf-8') as results:
+            matched = [row['MatchAddress'] for row in csv.DictReader(results)]
+        #: the stub echoes the address it was sent as the match address, which is written without its zone
+        assert matched == [legacy_format_address(address) for address in addresses]
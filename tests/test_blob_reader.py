@@ -0,0 +1,57 @@
+"""Streaming blob reads through BlobReader and open_blob_stream."""
+import csv
+import gzip
+import io
+
+import pytest
+
+import geocode_gcs_csv as geocode
+
+DATA = b''.join(b'%d,%d N MAIN ST,PROVO\n' % (i, i) for i in range(1000))
+
+
+def make_blob(local_buckets, name, data):
+    (local_buckets / 'input').mkdir(exist_ok=True)
+    (local_buckets / 'input' / name).write_bytes(data)
+
+    return geocode.get_bucket('input').blob(name)
+
+
+@pytest.mark.parametrize('start, end', [(0, None), (0, len(DATA)), (17, 4000), (4000, 4001), (100, 100)])
+def test_reads_the_byte_range_in_chunks(local_buckets, start, end):
+    blob = make_blob(local_buckets, 'input.csv', DATA)
+
+    with geocode.BlobReader(blob, start, end, chunkSize=100, readAhead=2, prefix=b'header\n') as reader:
+        data = io.BufferedReader(reader, 64).read()
+
+    assert data == b'header\n' + DATA[start:end]
+
+
+def test_missing_blob_raises_when_read(local_buckets):
+    (local_buckets / 'input').mkdir()
+    blob = geocode.get_bucket('input').blob('missing.csv')
+
+    with geocode.BlobReader(blob, 0, 100) as reader:
+        with pytest.raises(geocode.BlobNotFound):
+            reader.read()
+
+
+def test_close_stops_reading_ahead(local_buckets):
+    blob = make_blob(local_buckets, 'input.csv', DATA)
+    reader = geocode.BlobReader(blob, chunkSize=10, readAhead=1)
+
+    reader.close()
+    reader._thread.join(5)
+
+    assert not reader._thread.is_alive()
+
+
+@pytest.mark.parametrize('name, compress', [('input.csv', bytes), ('input.csv.gz', gzip.compress)])
+def test_open_blob_stream_reads_csv_rows(local_buckets, name, compress):
+    make_blob(local_buckets, name, compress(b'id,address,zone\n' + DATA))
+
+    with geocode.open_blob_stream('input', name) as stream:
+        rows = list(csv.DictReader(stream))
+
+    assert len(rows) == 1000
+    assert rows[999] == {'id': '999', 'address': '999 N MAIN ST', 'zone': 'PROVO'}
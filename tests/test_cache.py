@@ -0,0 +1,85 @@
+"""GeocodeCache LRU eviction, result store fallback and repeated addresses in a run."""
+import csv
+
+import geocode_gcs_csv as geocode
+
+
+def key(i):
+    return ('{} N MAIN ST'.format(i), 'PROVO', 'all', 26912)
+
+
+def response(i):
+    return {'matchAddress': '{} N MAIN ST, PROVO'.format(i), 'score': 100}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = geocode.GeocodeCache(size=2)
+    cache.put(key(1), response(1))
+    cache.put(key(2), response(2))
+    #: reading 1 makes 2 the least recently used
+    assert cache.get(key(1)) == response(1)
+
+    cache.put(key(3), response(3))
+
+    assert cache.get(key(2)) is None
+    assert cache.get(key(1)) == response(1)
+    assert cache.get(key(3)) == response(3)
+    assert (cache.hits, cache.misses, cache.evictions) == (3, 1, 1)
+
+
+def test_replacing_an_entry_does_not_evict():
+    cache = geocode.GeocodeCache(size=2)
+    cache.put(key(1), response(1))
+    cache.put(key(2), response(2))
+
+    cache.put(key(1), response(4))
+
+    assert cache.evictions == 0
+    assert cache.get(key(1)) == response(4)
+
+
+def test_missing_responses_are_not_cached():
+    cache = geocode.GeocodeCache(size=2)
+
+    cache.put(key(1), None)
+
+    assert cache.get(key(1)) is None
+    assert cache.misses == 1
+
+
+def test_result_store_hits_are_kept_in_memory(tmp_path):
+    store = geocode.ResultStore(str(tmp_path / 'store.sqlite'))
+    store.put(key(1), response(1))
+    cache = geocode.GeocodeCache(size=2, resultStore=store)
+
+    assert cache.get(key(1)) == response(1)
+    assert cache.get(key(1)) == response(1)
+
+    assert (cache.storeHits, cache.hits, cache.misses) == (1, 1, 0)
+    store.close()
+
+
+def test_zero_size_only_uses_the_result_store(tmp_path):
+    store = geocode.ResultStore(str(tmp_path / 'store.sqlite'))
+    cache = geocode.GeocodeCache(size=0, resultStore=store)
+
+    cache.put(key(1), response(1))
+
+    assert cache.get(key(1)) == response(1)
+    assert cache.storeHits == 1
+    store.close()
+
+
+def test_repeated_addresses_are_requested_once(stub_api, tmp_path):
+    server = stub_api(not_found_rate=0)
+    inputPath = tmp_path / 'input.csv'
+    inputPath.write_text('id,address,zone\n' + ''.join('{},{} N MAIN ST,PROVO\n'.format(i, i % 5) for i in range(40)))
+
+    assert geocode.TableGeocoder('key', str(inputPath), 'id', 'address', 'zone', 'all', 26912, str(tmp_path),
+                                 'results.csv', None, cacheSize=10).start()
+
+    assert server.requests == 5
+    with open(str(tmp_path / 'results.csv')) as results:
+        rows = list(csv.DictReader(results))
+    assert [row['INID'] for row in rows] == [str(i) for i in range(40)]
+    assert len({(row['INADDR'], row['XCoord'], row['YCoord']) for row in rows}) == 5
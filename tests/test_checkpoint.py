@@ -0,0 +1,186 @@
+"""Checkpoint save, truncate on load and resume of a TableGeocoder run."""
+import csv
+import shutil
+
+import geocode_gcs_csv as geocode
+
+INPUT = {'generation': 1, 'md5': 'abc', 'size': 100}
+
+
+def make_checkpoint(tmp_path, inputIdentity=INPUT):
+    return geocode.Checkpoint('output', 'input.csv', str(tmp_path), 'results.csv', inputIdentity)
+
+
+def save(tmp_path, rowsCompleted, outputPath, deferred=()):
+    checkpoint = make_checkpoint(tmp_path)
+    checkpoint.save(rowsCompleted, str(outputPath), deferred)
+    checkpoint.wait()
+
+    return checkpoint
+
+
+def test_missing_checkpoint_is_not_loaded(local_buckets, tmp_path):
+    checkpoint = make_checkpoint(tmp_path)
+
+    assert not checkpoint.load()
+    assert not checkpoint.loaded
+
+
+def test_load_truncates_rows_written_after_the_checkpoint(local_buckets, tmp_path):
+    outputPath = tmp_path / 'results.csv'
+    outputPath.write_bytes(b'header\nrow 1\nrow 2\n')
+    save(tmp_path, 2, outputPath, [('3', '3 N MAIN ST', 'PROVO')])
+    with open(str(outputPath), 'ab') as outputFile:
+        outputFile.write(b'row 4\nrow')
+    outputPath.unlink()
+
+    checkpoint = make_checkpoint(tmp_path)
+
+    assert checkpoint.load()
+    assert checkpoint.rowsCompleted == 2
+    assert checkpoint.deferred == [['3', '3 N MAIN ST', 'PROVO']]
+    assert outputPath.read_bytes() == b'header\nrow 1\nrow 2\n'
+
+
+def test_each_save_uploads_only_the_new_output(local_buckets, tmp_path):
+    outputPath = tmp_path / 'results.csv'
+    outputPath.write_bytes(b'header\nrow 1\n')
+    checkpoint = make_checkpoint(tmp_path)
+    checkpoint.save(1, str(outputPath))
+    with open(str(outputPath), 'ab') as outputFile:
+        outputFile.write(b'row 2\n')
+    checkpoint.save(2, str(outputPath))
+    #: nothing new to upload
+    checkpoint.save(2, str(outputPath))
+    checkpoint.wait()
+
+    parts = sorted((local_buckets / 'output' / 'checkpoints' / 'results.csv.parts').iterdir())
+    assert [part.read_bytes() for part in parts] == [b'header\nrow 1\n', b'row 2\n']
+    outputPath.unlink()
+    assert make_checkpoint(tmp_path).load()
+    assert outputPath.read_bytes() == b'header\nrow 1\nrow 2\n'
+
+
+def test_resumed_checkpoint_continues_the_part_list(local_buckets, tmp_path):
+    outputPath = tmp_path / 'results.csv'
+    outputPath.write_bytes(b'header\nrow 1\n')
+    save(tmp_path, 1, outputPath)
+    checkpoint = make_checkpoint(tmp_path)
+    assert checkpoint.load()
+
+    with open(str(outputPath), 'ab') as outputFile:
+        outputFile.write(b'row 2\n')
+    checkpoint.save(2, str(outputPath))
+    checkpoint.wait()
+    outputPath.unlink()
+
+    assert make_checkpoint(tmp_path).load()
+    assert outputPath.read_bytes() == b'header\nrow 1\nrow 2\n'
+
+
+def test_checkpoint_for_a_different_input_is_ignored(local_buckets, tmp_path):
+    outputPath = tmp_path / 'results.csv'
+    outputPath.write_bytes(b'header\nrow 1\n')
+    save(tmp_path, 1, outputPath)
+
+    assert not make_checkpoint(tmp_path, dict(INPUT, generation=2)).load()
+
+
+def test_checkpoint_with_missing_output_is_ignored(local_buckets, tmp_path):
+    outputPath = tmp_path / 'results.csv'
+    outputPath.write_bytes(b'header\nrow 1\n')
+    save(tmp_path, 1, outputPath)
+    shutil.rmtree(str(local_buckets / 'output' / 'checkpoints' / 'results.csv.parts'))
+    outputPath.unlink()
+
+    checkpoint = make_checkpoint(tmp_path)
+
+    assert not checkpoint.load()
+    assert checkpoint.rowsCompleted == 0
+    assert not outputPath.exists()
+
+
+def test_clear_deletes_the_checkpoint(local_buckets, tmp_path):
+    outputPath = tmp_path / 'results.csv'
+    outputPath.write_bytes(b'header\nrow 1\n')
+    checkpoint = make_checkpoint(tmp_path)
+    checkpoint.save(1, str(outputPath))
+
+    checkpoint.clear()
+
+    assert not make_checkpoint(tmp_path).load()
+    assert list((local_buckets / 'output' / 'checkpoints').rglob('*.parts/*')) == []
+
+
+def write_input(inputPath, rows):
+    with open(str(inputPath), 'w', newline='') as inputFile:
+        writer = csv.writer(inputFile)
+        writer.writerow(['id', 'address', 'zone'])
+        writer.writerows((str(i), '{} N MAIN ST'.format(i), 'PROVO') for i in range(rows))
+
+
+def geocode_table(inputPath, outputDir, outputFileName, checkpoint=None, **options):
+    return geocode.TableGeocoder('key', str(inputPath), 'id', 'address', 'zone', 'all', 26912, str(outputDir),
+                                 outputFileName, None, workers=2, checkpoint=checkpoint, **options).start()
+
+
+def test_resumed_run_continues_after_the_checkpoint(stub_api, local_buckets, tmp_path):
+    stub_api(not_found_rate=0)
+    inputPath = tmp_path / 'input.csv'
+    write_input(inputPath, 30)
+    assert geocode_table(inputPath, tmp_path, 'complete.csv')
+    complete = (tmp_path / 'complete.csv').read_text().splitlines(True)
+
+    #: an interrupted run that wrote rows 0 to 9 except row 4, which it deferred, and then two more rows
+    outputPath = tmp_path / 'results.csv'
+    outputPath.write_text(''.join(complete[:5] + complete[6:11]))
+    save(tmp_path, 10, outputPath, [('4', '4 N MAIN ST', 'PROVO')])
+    with open(str(outputPath), 'a') as outputFile:
+        outputFile.writelines(complete[11:13])
+    outputPath.unlink()
+
+    checkpoint = make_checkpoint(tmp_path)
+    assert checkpoint.load()
+    assert geocode_table(inputPath, tmp_path, checkpoint.outputFileName, checkpoint)
+
+    #: the deferred row is retried after the main pass, so it is written last
+    assert outputPath.read_text().splitlines(True) == complete[:5] + complete[6:] + complete[5:6]
+
+
+def test_resume_after_a_checkpoint_with_no_rows(stub_api, local_buckets, tmp_path):
+    stub_api(not_found_rate=0)
+    inputPath = tmp_path / 'input.csv'
+    write_input(inputPath, 30)
+    assert geocode_table(inputPath, tmp_path, 'complete.csv')
+    complete = (tmp_path / 'complete.csv').read_text()
+    #: an outage before any row completed leaves the header in the checkpointed output
+    outputPath = tmp_path / 'results.csv'
+    with geocode.ResultWriter(str(outputPath)) as writer:
+        writer.writeHeader()
+    save(tmp_path, 0, outputPath)
+    outputPath.unlink()
+
+    checkpoint = make_checkpoint(tmp_path)
+    assert checkpoint.load()
+    assert geocode_table(inputPath, tmp_path, checkpoint.outputFileName, checkpoint)
+
+    assert outputPath.read_text() == complete
+
+
+def test_resume_after_an_outage(stub_api, local_buckets, tmp_path):
+    stub_api(error_rate=1.0)
+    inputPath = tmp_path / 'input.csv'
+    write_input(inputPath, 30)
+    assert not geocode_table(inputPath, tmp_path, 'results.csv', make_checkpoint(tmp_path), maxOutageSeconds=0.5)
+
+    stub_api(not_found_rate=0)
+    assert geocode_table(inputPath, tmp_path, 'complete.csv')
+    (tmp_path / 'results.csv').unlink()
+    checkpoint = make_checkpoint(tmp_path)
+    assert checkpoint.load()
+    assert geocode_table(inputPath, tmp_path, checkpoint.outputFileName, checkpoint)
+
+    complete = (tmp_path / 'complete.csv').read_text().splitlines(True)
+    resumed = (tmp_path / 'results.csv').read_text().splitlines(True)
+    assert resumed[0] == complete[0]
+    assert sorted(resumed[1:]) == sorted(complete[1:])
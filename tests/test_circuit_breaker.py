@@ -0,0 +1,128 @@
+"""CircuitBreaker state transitions and the deferred retry budget."""
+import re
+import threading
+import time
+
+import pytest
+
+import geocode_gcs_csv as geocode
+
+
+def make_breaker(openSeconds=0.05, maxOpenSeconds=0.15, maxOutageSeconds=60):
+    return geocode.CircuitBreaker(failureThreshold=3, openSeconds=openSeconds, maxOpenSeconds=maxOpenSeconds,
+                                  maxOutageSeconds=maxOutageSeconds)
+
+
+def fail(breaker, count):
+    for _ in range(count):
+        breaker.report(False)
+
+
+def waits(breaker, seconds):
+    """True if wait blocks for longer than seconds."""
+    done = threading.Event()
+    thread = threading.Thread(target=lambda: (breaker.wait(), done.set()), daemon=True)
+    thread.start()
+
+    return not done.wait(seconds)
+
+
+def test_stays_closed_below_the_failure_threshold():
+    breaker = make_breaker()
+    fail(breaker, 2)
+    breaker.report(True)
+    fail(breaker, 2)
+
+    assert breaker.state == 'closed'
+    assert breaker.opened == 0
+    breaker.wait()
+
+
+def test_opens_after_consecutive_failures_and_waits():
+    breaker = make_breaker(openSeconds=0.2)
+    fail(breaker, 3)
+
+    assert breaker.state == 'open'
+    start = time.time()
+    breaker.wait()
+
+    assert time.time() - start >= 0.15
+    assert breaker.state == 'half-open'
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = make_breaker()
+    fail(breaker, 3)
+    breaker.wait()
+
+    assert waits(breaker, 0.2)
+
+
+def test_successful_probe_closes():
+    breaker = make_breaker()
+    fail(breaker, 3)
+    breaker.wait()
+    breaker.report(True)
+
+    assert breaker.state == 'closed'
+    breaker.wait()
+    #: the failure count starts over
+    fail(breaker, 2)
+    assert breaker.state == 'closed'
+
+
+def test_failed_probe_reopens_for_longer_up_to_the_limit():
+    breaker = make_breaker()
+    fail(breaker, 3)
+    openFor = []
+    for _ in range(3):
+        breaker.wait()
+        breaker.report(False)
+        openFor.append(breaker._openFor)
+
+    assert breaker.state == 'open'
+    assert breaker.opened == 4
+    assert openFor == [0.1, 0.15, 0.15]
+
+
+def test_waiting_raises_after_the_outage_limit():
+    breaker = make_breaker(maxOutageSeconds=0.1)
+    fail(breaker, 3)
+    time.sleep(0.15)
+
+    with pytest.raises(geocode.CircuitOpenError):
+        breaker.wait()
+
+
+def test_success_wakes_waiting_requests():
+    breaker = make_breaker(openSeconds=10, maxOpenSeconds=10)
+    fail(breaker, 3)
+    done = threading.Event()
+    threading.Thread(target=lambda: (breaker.wait(), done.set()), daemon=True).start()
+
+    breaker.report(True)
+
+    assert done.wait(1)
+
+
+def test_retry_budget_grants_the_minimum_plus_a_ratio_of_rows():
+    budget = geocode.RetryBudget(ratio=0.1, minimum=10)
+
+    assert budget.spend(15, 20) == 12
+    assert budget.spend(5, 20) == 0
+    assert budget.spend(5, 40) == 2
+
+
+def test_outage_reports_written_and_deferred_rows(stub_api, tmp_path, caplog):
+    stub_api(error_rate=1.0)
+    inputPath = tmp_path / 'input.csv'
+    inputPath.write_text('id,address,zone\n' + ''.join('{0},{0} N MAIN ST,PROVO\n'.format(i) for i in range(8)))
+    tool = geocode.TableGeocoder('key', str(inputPath), 'id', 'address', 'zone', 'all', 26912, str(tmp_path),
+                                 'results.csv', None, workers=2, maxOutageSeconds=0.5)
+
+    with caplog.at_level('INFO', logger='geocoder'):
+        assert not tool.start()
+
+    #: how many rows were read before the abort depends on timing, but none of them were written
+    assert re.search(r'\n0 addresses written and [1-8] deferred\n', caplog.text)
+    assert (tmp_path / 'results.csv').read_text().count('\n') == 1
@@ -0,0 +1,93 @@
+"""ConnectionPool reuse, idle expiry, stale keep-alive retry and timeouts against the stub api."""
+import http.client
+import socket
+from urllib import parse
+
+import pytest
+
+import geocode_gcs_csv as geocode
+from stub_api import StubGeocodeHandler
+
+
+class ClosingHandler(StubGeocodeHandler):
+    """Close the connection after each response without telling the client, like a server dropping idle sockets."""
+
+    def _send(self, status, body):
+        StubGeocodeHandler._send(self, status, body)
+        self.close_connection = True
+
+
+class SilentHandler(StubGeocodeHandler):
+    """Close every connection without a response."""
+
+    def handle_one_request(self):
+        self.close_connection = True
+
+
+def url(server, street='1 N MAIN ST'):
+    return 'http://127.0.0.1:{}/api/v1/geocode/{}/PROVO'.format(server.server_address[1], parse.quote(street))
+
+
+def test_connections_are_reused(stub_api):
+    server = stub_api(not_found_rate=0)
+    pool = geocode.ConnectionPool()
+
+    statuses = [pool.urlopen(url(server))[0] for _ in range(3)]
+
+    assert statuses == [200, 200, 200]
+    assert (pool.opened, pool.reused) == (1, 2)
+    pool.close()
+
+
+def test_idle_connections_expire(stub_api):
+    server = stub_api(not_found_rate=0)
+    pool = geocode.ConnectionPool(idleTimeout=-1)
+
+    pool.urlopen(url(server))
+    pool.urlopen(url(server))
+
+    assert (pool.opened, pool.reused) == (2, 0)
+
+
+def test_idle_connections_are_capped_at_the_pool_size(stub_api):
+    server = stub_api(not_found_rate=0)
+    pool = geocode.ConnectionPool(size=1)
+    connections = [pool._checkout('http', '127.0.0.1:{}'.format(server.server_address[1]))[0] for _ in range(2)]
+    for connection in connections:
+        pool._checkin('http', '127.0.0.1:{}'.format(server.server_address[1]), connection)
+
+    assert sum(len(idle) for idle in pool._idle.values()) == 1
+
+
+def test_stale_keep_alive_connection_is_retried_once(stub_api):
+    server = stub_api(not_found_rate=0)
+    server.RequestHandlerClass = ClosingHandler
+    pool = geocode.ConnectionPool()
+
+    first = pool.urlopen(url(server, '1 N MAIN ST'))
+    second = pool.urlopen(url(server, '2 N MAIN ST'))
+
+    assert first[0] == second[0] == 200
+    assert b'2 N MAIN ST' in second[1]
+    assert (pool.opened, pool.reused) == (2, 1)
+
+
+def test_new_connection_that_fails_is_not_retried(stub_api):
+    server = stub_api()
+    server.RequestHandlerClass = SilentHandler
+    pool = geocode.ConnectionPool()
+
+    with pytest.raises((http.client.RemoteDisconnected, ConnectionError)):
+        pool.urlopen(url(server))
+
+    assert pool.opened == 1
+
+
+def test_slow_response_times_out(stub_api):
+    server = stub_api(latency='fixed:0.5')
+    pool = geocode.ConnectionPool(timeout=0.1)
+
+    with pytest.raises(socket.timeout):
+        pool.urlopen(url(server))
+    #: the timed out connection is not returned to the pool
+    assert not any(pool._idle.values())
@@ -0,0 +1,106 @@
+"""LeaseCoordinator leases, expiry and reissue, and workers geocoding leased chunks."""
+import csv
+import threading
+import time
+
+import geocode_gcs_csv as geocode
+
+
+def test_leases_chunks_in_order_then_waits():
+    coordinator = geocode.LeaseCoordinator(2, leaseSeconds=60, runId='run')
+
+    first, second, third = (coordinator.lease('worker') for _ in range(3))
+
+    assert (first['chunk'], second['chunk']) == (0, 1)
+    assert first['chunk_count'] == 2 and first['run'] == 'run'
+    assert first['lease'] != second['lease']
+    assert 0 < third['wait'] <= geocode.COORDINATOR_POLL_SECONDS
+
+
+def test_expired_lease_is_reissued():
+    coordinator = geocode.LeaseCoordinator(1, leaseSeconds=0.05)
+    expired = coordinator.lease('slow')
+    time.sleep(0.1)
+
+    reissued = coordinator.lease('fast')
+
+    assert reissued['chunk'] == 0
+    assert reissued['lease'] != expired['lease']
+    assert coordinator.reissued == 1
+    #: the first worker finds out it lost the lease when it next renews
+    assert not coordinator.renew(0, expired['lease'])
+    assert coordinator.renew(0, reissued['lease'])
+
+
+def test_renewed_lease_is_not_reissued():
+    coordinator = geocode.LeaseCoordinator(1, leaseSeconds=0.2)
+    lease = coordinator.lease('worker')
+    for _ in range(3):
+        time.sleep(0.1)
+        assert coordinator.renew(0, lease['lease'])
+
+    assert 'wait' in coordinator.lease('other')
+    assert coordinator.reissued == 0
+
+
+def test_released_chunk_is_leased_next():
+    coordinator = geocode.LeaseCoordinator(3, leaseSeconds=60)
+    lease = coordinator.lease('worker')
+
+    assert coordinator.release(0, lease['lease'])
+    assert not coordinator.release(0, lease['lease'])
+    assert coordinator.lease('other')['chunk'] == 0
+
+
+def test_chunk_is_completed_once():
+    coordinator = geocode.LeaseCoordinator(1, leaseSeconds=0.05)
+    slow = coordinator.lease('slow')
+    time.sleep(0.1)
+    fast = coordinator.lease('fast')
+
+    assert coordinator.complete(0, fast['lease'])
+    assert not coordinator.complete(0, slow['lease'])
+    assert coordinator.finished()
+    assert coordinator.lease('worker') == {'done': True}
+    assert coordinator.status() == {'chunks': 1, 'pending': 0, 'leased': 0, 'done': 1, 'reissued': 1}
+
+
+def test_workers_geocode_every_chunk_including_abandoned_ones(stub_api, local_buckets, tmp_path):
+    stub_api(not_found_rate=0)
+    (local_buckets / 'input').mkdir()
+    with open(str(local_buckets / 'input' / 'input.csv'), 'w', newline='') as inputFile:
+        writer = csv.writer(inputFile)
+        writer.writerow(['id', 'address', 'zone'])
+        writer.writerows((str(i), '{} N MAIN ST'.format(i), 'PROVO') for i in range(200))
+    inputBlob = geocode.get_bucket('input').blob('input.csv')
+    coordinator = geocode.LeaseCoordinator(8, leaseSeconds=0.5, runId='run')
+    server = geocode.serve_coordinator(0, coordinator)
+    url = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+    #: a worker that dies holding a lease
+    assert geocode.LeaseClient(url, 'dead').lease()['chunk'] == 0
+
+    def createTool(inputTable, outputFileName):
+        return geocode.TableGeocoder('key', inputTable, 'id', 'address', 'zone', 'all', 26912, str(tmp_path),
+                                     outputFileName, None)
+
+    results = []
+
+    def work(worker):
+        results.append(geocode.geocode_leased_chunks(geocode.LeaseClient(url, worker), inputBlob, str(tmp_path),
+                                                     'output', '.csv', createTool))
+
+    workers = [threading.Thread(target=work, args=('worker{}'.format(i),)) for i in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+    server.shutdown()
+    server.server_close()
+
+    assert results == [True, True]
+    assert coordinator.reissued == 1
+    rowIds = []
+    for chunk in range(8):
+        with open(str(local_buckets / 'output' / 'GeocodeResults_run_chunk{:05d}of8.csv'.format(chunk))) as output:
+            rowIds.extend(row['INID'] for row in csv.DictReader(output))
+    assert rowIds == [str(i) for i in range(200)]
@@ -0,0 +1,97 @@
+"""TableGeocoder._dispatch ordering, deduplication and batch fallback against the stub api."""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import geocode_gcs_csv as geocode
+
+
+def make_tool(workers=2, batchSize=1, cacheSize=0, zoneWindow=0):
+    return geocode.TableGeocoder('key', None, 'id', 'address', 'zone', 'all', 26912, '.', 'out.csv', None,
+                                 workers=workers, batchSize=batchSize, cacheSize=cacheSize, zoneWindow=zoneWindow)
+
+
+def dispatch(tool, records):
+    """Dispatch records and return (record, formattedAddress, response) for every row in the order yielded."""
+    pool = geocode.ConnectionPool()
+    geocoder = geocode.Geocoder('key', 26912, 'all', pool)
+    rows = []
+    with ThreadPoolExecutor(max_workers=tool._workers) as executor:
+        for record, formattedAddress, future, index in tool._dispatch(geocode.format_chunk(records), geocoder,
+                                                                      executor):
+            rows.append((record, formattedAddress, future.result()[index] if future is not None else None))
+    pool.close()
+
+    return rows
+
+
+def addresses(count):
+    return [(str(i), '{} N MAIN ST'.format(i), 'PROVO' if i % 3 else 'OREM') for i in range(count)]
+
+
+@pytest.mark.parametrize('batchSize, zoneWindow', [(1, 0), (7, 0), (1, 25), (7, 25)])
+def test_rows_are_yielded_in_input_order(stub_api, batchSize, zoneWindow):
+    stub_api(not_found_rate=0)
+    records = addresses(100)
+
+    rows = dispatch(make_tool(workers=4, batchSize=batchSize, zoneWindow=zoneWindow), records)
+
+    assert [record for record, _, _ in rows] == records
+    for _, formattedAddress, response in rows:
+        assert response['status'] == 200
+        assert response['result']['inputAddress'] == '{}, {}'.format(formattedAddress.address, formattedAddress.zone)
+
+
+def test_invalid_rows_are_not_sent(stub_api):
+    server = stub_api(not_found_rate=0)
+    records = [('1', '1 N MAIN ST', 'PROVO'), ('2', '', 'PROVO'), ('3', '3 N MAIN ST', ''), ('4', '4 N MAIN ST', 'OREM')]
+
+    rows = dispatch(make_tool(), records)
+
+    assert [record for record, _, _ in rows] == records
+    assert [response is None for _, _, response in rows] == [False, True, True, False]
+    assert server.requests == 2
+
+
+def test_duplicate_addresses_share_a_request(stub_api):
+    server = stub_api(not_found_rate=0)
+    records = [(str(i), '{} N MAIN ST'.format(i % 3), 'PROVO') for i in range(12)]
+
+    rows = dispatch(make_tool(workers=4, cacheSize=100), records)
+
+    assert [record for record, _, _ in rows] == records
+    assert [response['result']['inputAddress'] for _, _, response in rows] == \
+        ['{} N MAIN ST, PROVO'.format(i % 3) for i in range(12)]
+    assert server.requests == 3
+
+
+def test_cached_addresses_are_not_sent(stub_api):
+    server = stub_api(not_found_rate=0)
+    tool = make_tool(cacheSize=100)
+    cached = geocode.AddressFormatter('0', '1 N MAIN ST', 'PROVO')
+    tool._cache.put(geocode.GeocodeCache.key(cached, 'all', 26912), {'status': 404, 'message': 'cached'})
+
+    rows = dispatch(tool, [('1', '1 N MAIN ST', 'PROVO'), ('2', '2 N MAIN ST', 'PROVO')])
+
+    assert [response.get('message') for _, _, response in rows] == ['cached', None]
+    assert server.requests == 1
+
+
+def test_batches_are_answered_by_the_batch_endpoint(stub_api):
+    server = stub_api(not_found_rate=0)
+
+    rows = dispatch(make_tool(workers=1, batchSize=5), addresses(10))
+
+    assert all(response['status'] == 200 for _, _, response in rows)
+    assert server.requests == 2
+
+
+def test_unmatched_batch_addresses_fall_back_to_single_requests(stub_api):
+    server = stub_api(not_found_rate=1.0)
+
+    rows = dispatch(make_tool(workers=1, batchSize=5), addresses(10))
+
+    assert [record for record, _, _ in rows] == addresses(10)
+    assert all(response['status'] == 404 for _, _, response in rows)
+    #: two batches and a single address request for every address
+    assert server.requests == 2 + 10
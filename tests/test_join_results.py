@@ -0,0 +1,77 @@
+"""Joining geocode results onto a VISTA export."""
+import csv
+import gzip
+import math
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+import join_results  # noqa: E402
+
+
+def dist(vista_x, vista_y, agrc_x, agrc_y):
+    """combine_results.dist, which can not be imported without arcpy."""
+    if not vista_x or not vista_y or not agrc_x or not agrc_y:
+        return None
+    elif vista_x > 0 or vista_y > 0 or agrc_x > 0 or agrc_y > 0:
+        return math.hypot(agrc_x - vista_x, agrc_y - vista_y)
+    else:
+        return None
+
+
+def test_distance_matches_the_scalar_rules():
+    rand = random.Random(0)
+    choices = [None, 0.0, -1.5, 2.5, 420000.5, -4500000.25]
+    rows = [[rand.choice(choices) if rand.random() < 0.3 else rand.uniform(-1e6, 1e6) for _ in range(4)]
+            for _ in range(5000)]
+    columns = [np.array([np.nan if row[i] is None else row[i] for row in rows]) for i in range(4)]
+
+    distance = join_results.distance_meters(*columns)
+
+    expected = [dist(*row) for row in rows]
+    assert [None if np.isnan(d) else d for d in distance.tolist()] == pytest.approx(expected)
+    assert sum(d is None for d in expected) > 1000
+
+
+def test_csv_values_are_parsed_as_floats():
+    parsed = join_results._to_float(['1.5', '', 'x', '-2'])
+
+    assert parsed[0] == 1.5 and np.isnan(parsed[1]) and np.isnan(parsed[2]) and parsed[3] == -2
+
+
+def write_csv(path, rows, opener=open):
+    with opener(str(path), 'wt', encoding='utf-8', newline='') as csvFile:
+        csv.writer(csvFile).writerows(rows)
+
+
+def test_join_reads_and_writes_utf8_under_any_locale(tmp_path):
+    write_csv(tmp_path / 'vista.csv', [['RESIDENCE_ID', 'NAME', 'VISTA_X', 'VISTA_Y'],
+                                       ['1', 'CAÑON', '420003.5', '4500004.25'],
+                                       ['2', 'PEÑA', '', ''],
+                                       ['3', 'MISSING', '1', '1']])
+    write_csv(tmp_path / 'results.csv.gz', [['INID', 'INADDR', 'INZONE', 'MatchAddress', 'Zone', 'Score', 'XCoord',
+                                             'YCoord', 'Geocoder'],
+                                            ['1', '1 CAÑON RD', 'SPANISH FORK', '1 CAÑON RD', 'SPANISH FORK', '100',
+                                             '420000.5', '4500000.25', 'AddressPoints.AddressGrid'],
+                                            ['2', '2 MAIN ST', 'OREM', '2 MAIN ST', 'OREM', '90', '1', '2',
+                                             'Centerlines.StatewideRoads']], gzip.open)
+    script = os.path.abspath(join_results.__file__)
+    environment = dict(os.environ, LC_ALL='C', LANG='C', PYTHONUTF8='0', PYTHONCOERCECLOCALE='0',
+                       PYTHONIOENCODING='utf-8')
+
+    subprocess.run([sys.executable, script, str(tmp_path / 'vista.csv'), str(tmp_path / 'results.csv.gz'),
+                    '--output', str(tmp_path / 'joined.csv')], check=True, stdout=subprocess.DEVNULL,
+                   env=environment)
+
+    with open(str(tmp_path / 'joined.csv'), encoding='utf-8', newline='') as joined:
+        rows = list(csv.DictReader(joined))
+    assert 'AGRC_Precinct' not in rows[0]
+    assert [row['NAME'] for row in rows] == ['CAÑON', 'PEÑA', 'MISSING']
+    assert rows[0]['AGRC_MatchAddress'] == '1 CAÑON RD'
+    assert float(rows[0]['Distance_Meters']) == 5.0
+    assert rows[1]['AGRC_Zone'] == 'OREM' and rows[1]['Distance_Meters'] == ''
+    assert rows[2]['AGRC_MatchAddress'] == '' and rows[2]['Distance_Meters'] == ''
@@ -0,0 +1,88 @@
+"""Metrics Prometheus text, summary quantiles, the metrics endpoint and the counters of a geocoded table."""
+from urllib import request
+
+import geocode_gcs_csv as geocode
+
+
+def test_prometheus_text_format():
+    metrics = geocode.Metrics()
+    metrics.increment('geocode_responses_total', status='200')
+    metrics.increment('geocode_responses_total', 2, status='404')
+    metrics.increment('rows_total', 3)
+    metrics.set('cache_hits', 4)
+    for value in (0.003, 0.02, 0.02, 20):
+        metrics.observe('geocode_latency_seconds', value, buckets=(0.01, 0.1))
+
+    assert metrics.prometheus() == '\n'.join([
+        '# TYPE geocode_responses_total counter',
+        'geocode_responses_total{status="200"} 1',
+        'geocode_responses_total{status="404"} 2',
+        '# TYPE rows_total counter',
+        'rows_total 3',
+        '# TYPE cache_hits gauge',
+        'cache_hits 4',
+        '# TYPE geocode_latency_seconds histogram',
+        'geocode_latency_seconds_bucket{le="0.01"} 1',
+        'geocode_latency_seconds_bucket{le="0.1"} 3',
+        'geocode_latency_seconds_bucket{le="+Inf"} 4',
+        'geocode_latency_seconds_sum 20.043',
+        'geocode_latency_seconds_count 4']) + '\n'
+
+
+def test_labels_are_sorted_into_one_series():
+    metrics = geocode.Metrics()
+    metrics.increment('api_retries_total', call='locate', attempt='1')
+    metrics.increment('api_retries_total', attempt='1', call='locate')
+
+    assert metrics.counter('api_retries_total', call='locate', attempt='1') == 2
+    assert 'api_retries_total{attempt="1",call="locate"} 2\n' in metrics.prometheus()
+
+
+def test_summary_quantiles_are_bucket_upper_bounds():
+    metrics = geocode.Metrics()
+    for value in [0.001] * 90 + [0.05] * 9 + [30]:
+        metrics.observe('geocode_latency_seconds', value)
+
+    histogram = metrics.summary()['histograms']['geocode_latency_seconds']
+
+    assert histogram['count'] == 100
+    assert (histogram['p50'], histogram['p95'], histogram['p99']) == (0.005, 0.05, 0.05)
+    metrics.observe('geocode_latency_seconds', 30)
+    assert metrics.summary()['histograms']['geocode_latency_seconds']['p99'] is None
+
+
+def test_endpoint_serves_the_shared_metrics(monkeypatch):
+    metrics = geocode.Metrics()
+    metrics.increment('rows_total', 5)
+    monkeypatch.setattr(geocode, 'metrics', metrics)
+    server = geocode.serve_metrics(0)
+
+    try:
+        with request.urlopen('http://127.0.0.1:{}/metrics'.format(server.server_address[1])) as response:
+            contentType = response.headers['Content-Type']
+            text = response.read().decode('utf-8')
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert contentType.startswith('text/plain')
+    assert text == metrics.prometheus()
+
+
+def test_geocoded_table_counts_rows_and_responses(stub_api, tmp_path, monkeypatch):
+    stub_api(not_found_rate=0)
+    metrics = geocode.Metrics()
+    monkeypatch.setattr(geocode, 'metrics', metrics)
+    inputPath = tmp_path / 'input.csv'
+    inputPath.write_text('id,address,zone\n' + ''.join('{0},{0} N MAIN ST,PROVO\n'.format(i) for i in range(12)))
+
+    assert geocode.TableGeocoder('key', str(inputPath), 'id', 'address', 'zone', 'all', 26912, str(tmp_path),
+                                 'results.csv', None).start()
+
+    assert metrics.counter('rows_total') == 12
+    #: and the api key check
+    assert metrics.counter('geocode_responses_total', status='200') == 13
+    histograms = metrics.summary()['histograms']
+    assert histograms['geocode_request_seconds']['count'] == 13
+    assert histograms['csv_write_seconds']['count'] == 12
+    assert '# TYPE rows_total counter\nrows_total 12\n' in metrics.prometheus()
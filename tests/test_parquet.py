@@ -0,0 +1,68 @@
+"""ParquetResultWriter and ParquetTableReader round trips. Skipped without pyarrow."""
+import csv
+
+import pytest
+
+import geocode_gcs_csv as geocode
+
+pyarrow = pytest.importorskip('pyarrow')
+import pyarrow.parquet  # noqa: E402
+
+
+def test_written_results_read_back_with_column_types(tmp_path):
+    outputPath = str(tmp_path / 'results.parquet')
+    results = [geocode.AddressResult('1', '1 N MAIN ST', 'PROVO', '1 N MAIN ST', 'PROVO', 100, 420000.5, 4500000.25,
+                                     'AddressPoints.AddressGrid'),
+               geocode.AddressResult('2', '', '', 'Error: Locator error', '', '', '', '', '')]
+
+    with geocode.ParquetResultWriter(outputPath, rowGroupRows=1) as writer:
+        writer.writeHeader()
+        for result in results * 3:
+            writer.writeResult(result)
+
+    table = pyarrow.parquet.read_table(outputPath)
+    assert table.column_names == list(geocode.AddressResult.outputFields)
+    assert [field.type for field in table.schema] == \
+        [pyarrow.type_for_alias(geocode.ParquetResultWriter.arrowTypes[fieldType])
+         for fieldType in geocode.AddressResult.outputFieldTypes]
+    assert pyarrow.parquet.ParquetFile(outputPath).metadata.num_row_groups == 6
+    rows = table.to_pylist()
+    assert rows[0]['Score'] == 100 and rows[0]['XCoord'] == 420000.5 and rows[0]['YCoord'] == 4500000.25
+    assert rows[1]['MatchAddress'] == 'Error: Locator error'
+    assert rows[1]['Score'] is None and rows[1]['XCoord'] is None and rows[1]['INADDR'] is None
+
+
+def test_reader_yields_text_records(tmp_path):
+    inputPath = str(tmp_path / 'input.parquet')
+    pyarrow.parquet.write_table(pyarrow.table({'id': [1, 2, 3],
+                                               'address': ['1 N MAIN ST', None, '3 N MAIN ST'],
+                                               'zone': ['PROVO', 'OREM', None],
+                                               'other': [1.5, 2.5, 3.5]}), inputPath)
+
+    with geocode.ParquetTableReader(inputPath, batchRows=2) as reader:
+        records = list(reader.records('id', 'address', 'zone'))
+
+    assert records == [('1', '1 N MAIN ST', 'PROVO'), ('2', '', 'OREM'), ('3', '3 N MAIN ST', '')]
+
+
+def test_parquet_input_and_output_match_csv(stub_api, tmp_path):
+    stub_api(not_found_rate=0)
+    rows = [(str(i), '{} N MAIN ST'.format(i), 'PROVO') for i in range(20)]
+    with open(str(tmp_path / 'input.csv'), 'w', newline='') as inputFile:
+        writer = csv.writer(inputFile)
+        writer.writerow(['id', 'address', 'zone'])
+        writer.writerows(rows)
+    pyarrow.parquet.write_table(pyarrow.table({'id': [row[0] for row in rows],
+                                               'address': [row[1] for row in rows],
+                                               'zone': [row[2] for row in rows]}), str(tmp_path / 'input.parquet'))
+
+    for inputName, outputName, outputFormat in (('input.csv', 'results.csv', 'csv'),
+                                                ('input.parquet', 'results.parquet', 'parquet')):
+        assert geocode.TableGeocoder('key', str(tmp_path / inputName), 'id', 'address', 'zone', 'all', 26912,
+                                     str(tmp_path), outputName, None, outputFormat=outputFormat).start()
+
+    with open(str(tmp_path / 'results.csv')) as results:
+        expected = list(csv.DictReader(results))
+    actual = pyarrow.parquet.read_table(str(tmp_path / 'results.parquet')).to_pylist()
+    assert [row['INID'] for row in actual] == [row['INID'] for row in expected]
+    assert [row['XCoord'] for row in actual] == [float(row['XCoord']) for row in expected]
@@ -0,0 +1,87 @@
+"""Partitioning an address csv into shards by normalized address."""
+import csv
+import os
+import random
+import subprocess
+import sys
+
+import partition_addresses
+
+FIELDS = ['UNIQUE_ID', 'VISTA_ADDRESS', 'VISTA_CITY']
+
+
+def write_addresses(path, uniqueCount, seed=0):
+    """Write uniqueCount addresses repeated a random number of times, in random order, with invalid rows."""
+    rand = random.Random(seed)
+    rows = []
+    for i in range(uniqueCount):
+        for _ in range(rand.randint(1, 5)):
+            rows.append(['{} N {} ST'.format(i % 1000, i // 1000), 'PROVO' if i % 2 else 'OREM'])
+    rows.extend([['', 'PROVO'], ['1 N MAIN ST', '']] * 50)
+    rand.shuffle(rows)
+    with open(str(path), 'w', newline='') as addressFile:
+        writer = csv.writer(addressFile)
+        writer.writerow(FIELDS)
+        writer.writerows([str(rowId)] + row for rowId, row in enumerate(rows))
+
+    return len(rows)
+
+
+def read_shards(shards):
+    addresses = []
+    for shard in shards:
+        with open(shard.path, newline='') as shardFile:
+            addresses.append([row for row in csv.DictReader(shardFile)])
+
+    return addresses
+
+
+def read_bytes(path):
+    with open(path, 'rb') as shardFile:
+        return shardFile.read()
+
+
+def test_duplicates_land_in_one_shard(tmp_path):
+    rowCount = write_addresses(tmp_path / 'addresses.csv', 2000)
+
+    shards = partition_addresses.partition_csv(str(tmp_path / 'addresses.csv'), 7, str(tmp_path / 'shards'),
+                                               'VISTA_ADDRESS', 'VISTA_CITY')
+
+    shardRows = read_shards(shards)
+    assert sum(len(rows) for rows in shardRows) == rowCount == sum(shard.rows for shard in shards)
+    shardOf = {}
+    for shardIndex, rows in enumerate(shardRows):
+        for row in rows:
+            key = partition_addresses.address_key(row['VISTA_ADDRESS'], row['VISTA_CITY'])
+            if key is not None:
+                assert shardOf.setdefault(key, shardIndex) == shardIndex
+    assert len(shardOf) == 2000
+
+
+def test_unique_addresses_are_balanced(tmp_path):
+    write_addresses(tmp_path / 'addresses.csv', 20000)
+
+    shards = partition_addresses.partition_csv(str(tmp_path / 'addresses.csv'), 8, str(tmp_path / 'shards'),
+                                               'VISTA_ADDRESS', 'VISTA_CITY')
+
+    unique = [len({partition_addresses.address_key(row['VISTA_ADDRESS'], row['VISTA_CITY']) for row in rows} - {None})
+              for rows in read_shards(shards)]
+    assert sum(unique) == 20000
+    assert max(unique) < 20000 / 8 * 1.1 and min(unique) > 20000 / 8 * 0.9
+    #: invalid rows are dealt out in turn
+    assert [shard.invalid for shard in shards] == [13, 13, 13, 13, 12, 12, 12, 12]
+
+
+def test_shards_are_the_same_for_every_hash_seed(tmp_path):
+    write_addresses(tmp_path / 'addresses.csv', 500)
+    script = os.path.abspath(partition_addresses.__file__)
+
+    shardFiles = []
+    for seed in ('1', '2'):
+        outputDir = str(tmp_path / 'shards{}'.format(seed))
+        subprocess.run([sys.executable, script, str(tmp_path / 'addresses.csv'), '--parts', '4',
+                        '--output_dir', outputDir], check=True, stdout=subprocess.DEVNULL,
+                       env=dict(os.environ, PYTHONHASHSEED=seed))
+        shardFiles.append([read_bytes(os.path.join(outputDir, name)) for name in sorted(os.listdir(outputDir))])
+
+    assert shardFiles[0] == shardFiles[1]
@@ -0,0 +1,50 @@
+"""StageProfiler stage totals over several threads."""
+import json
+import re
+import threading
+import time
+
+import pytest
+
+import geocode_gcs_csv as geocode
+
+
+def test_stage_seconds_are_summed_over_threads_with_utilisation(tmp_path, caplog):
+    profiler = geocode.StageProfiler()
+    wait = profiler.wrap('geocode', time.sleep)
+    profiler.start()
+    threads = [threading.Thread(target=wait, args=(0.2,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    time.sleep(0.2)
+    profiler.stop()
+
+    with caplog.at_level('INFO', logger='geocoder'):
+        profiler.write(str(tmp_path), 'results')
+
+    summary = json.loads((tmp_path / 'results.profile.json').read_text())
+    stage = summary['stages']['geocode']
+    assert summary['wall_seconds'] == pytest.approx(0.4, abs=0.1)
+    assert stage['calls'] == 4 and stage['threads'] == 4
+    assert stage['thread_seconds'] == pytest.approx(0.8, abs=0.1)
+    #: each thread was busy for about half of the run
+    assert stage['utilisation'] == pytest.approx(0.5, abs=0.15)
+    assert re.search(r'Profile run \| wall 0\.[345]\d* seconds', caplog.text)
+    assert re.search(r'Profile geocode \| calls 4 \| threads 4 \| wall 0\.[789]\d* thread-seconds .* utilisation \d+%',
+                     caplog.text)
+
+
+def test_nested_stages_are_exclusive():
+    profiler = geocode.StageProfiler()
+    parse = profiler.wrap('json parse', lambda: time.sleep(0.1))
+    locate = profiler.wrap('geocode', lambda: (time.sleep(0.1), parse()))
+    profiler.start()
+    locate()
+    profiler.stop()
+
+    stages = profiler.summary()['stages']
+    assert stages['geocode']['thread_seconds'] == pytest.approx(0.1, abs=0.05)
+    assert stages['json parse']['thread_seconds'] == pytest.approx(0.1, abs=0.05)
+    assert stages['geocode']['utilisation'] + stages['json parse']['utilisation'] == pytest.approx(1, abs=0.1)
@@ -0,0 +1,125 @@
+"""RateLimiter slow start, increase, decrease and baseline decay against a fake clock."""
+import pytest
+
+import geocode_gcs_csv as geocode
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_limiter(initialRate=40, maxRate=None):
+    clock = FakeClock()
+
+    return geocode.RateLimiter(initialRate, maxRate, clock=clock), clock
+
+
+def window(limiter, clock, requests=None, latency=0.01, errors=0):
+    """Report a full window of requests, by default as many as the rate allows."""
+    if requests is None:
+        requests = int(limiter.rate * geocode.RATE_ADJUST_SECONDS)
+    for request in range(requests - 1):
+        limiter.report(latency, 500 if request < errors else 200)
+    clock.now += geocode.RATE_ADJUST_SECONDS
+    limiter.report(latency, 500 if requests - 1 < errors else 200)
+
+
+def test_slow_start_doubles_each_window():
+    limiter, clock = make_limiter()
+
+    rates = []
+    for _ in range(4):
+        window(limiter, clock)
+        rates.append(limiter.rate)
+
+    assert rates == [80, 160, 320, 640]
+    assert limiter.slowStart
+
+
+def test_increase_is_additive_after_the_first_decrease():
+    limiter, clock = make_limiter()
+    window(limiter, clock)
+    window(limiter, clock, errors=10)
+    assert limiter.rate == pytest.approx(80 * geocode.RATE_DECREASE_FACTOR)
+    assert not limiter.slowStart
+
+    window(limiter, clock)
+
+    assert limiter.rate == pytest.approx(80 * geocode.RATE_DECREASE_FACTOR + geocode.RATE_INCREASE_PER_SECOND)
+
+
+def test_error_fraction_above_the_threshold_decreases():
+    limiter, clock = make_limiter(initialRate=100)
+    window(limiter, clock, requests=100, errors=5)
+    assert limiter.rate == 200
+
+    window(limiter, clock, requests=200, errors=11)
+
+    assert limiter.rate == pytest.approx(200 * geocode.RATE_DECREASE_FACTOR)
+
+
+def test_latency_over_the_baseline_decreases():
+    limiter, clock = make_limiter()
+    window(limiter, clock, latency=0.01)
+
+    window(limiter, clock, latency=0.01 * geocode.RATE_LATENCY_TOLERANCE * 1.5)
+
+    assert limiter.rate == pytest.approx(80 * geocode.RATE_DECREASE_FACTOR)
+
+
+def test_decrease_stops_at_the_minimum_rate():
+    limiter, clock = make_limiter(initialRate=1)
+    for _ in range(3):
+        window(limiter, clock, requests=2, errors=2)
+
+    assert limiter.rate == geocode.MIN_RATE_PER_SECOND
+
+
+def test_baseline_decays_toward_slower_windows():
+    limiter, clock = make_limiter(initialRate=10, maxRate=10)
+    window(limiter, clock, latency=0.01)
+    assert limiter._baselineLatency == pytest.approx(0.01)
+
+    window(limiter, clock, latency=0.015)
+    assert limiter._baselineLatency == pytest.approx(0.01 + 0.005 * geocode.RATE_BASELINE_DECAY)
+
+    #: a slower api is accepted as the new normal instead of cutting the rate forever
+    for _ in range(30):
+        window(limiter, clock, latency=0.015)
+    window(limiter, clock, latency=0.025)
+    assert limiter.rate == 10
+
+    #: a faster window resets the baseline at once
+    window(limiter, clock, latency=0.005)
+    assert limiter._baselineLatency == pytest.approx(0.005)
+
+
+def test_unused_rate_does_not_grow():
+    limiter, clock = make_limiter(initialRate=100)
+
+    window(limiter, clock, requests=10)
+
+    assert limiter.rate == 100
+
+
+def test_rate_is_capped_by_max_rate():
+    limiter, clock = make_limiter(initialRate=100, maxRate=150)
+    window(limiter, clock)
+
+    assert limiter.rate == 150
+    assert make_limiter(initialRate=100, maxRate=50)[0].rate == 50
+
+
+def test_acquire_waits_for_tokens_at_the_rate():
+    limiter, clock = make_limiter(initialRate=1000)
+    #: the bucket holds a tenth of a second of tokens
+    clock.now += 1
+
+    waits = [limiter.acquire() for _ in range(101)]
+
+    assert waits[:100] == [0] * 100
+    assert waits[100] == pytest.approx(0.001)
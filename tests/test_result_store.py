@@ -0,0 +1,117 @@
+"""ResultStore expiry and pruning, and merging stores into the bucket with generation preconditions."""
+import shutil
+import time
+
+import pytest
+
+import geocode_gcs_csv as geocode
+
+
+def key(i):
+    return ('{} N MAIN ST'.format(i), 'PROVO', 'all', 26912)
+
+
+def response(i):
+    return {'matchAddress': '{} N MAIN ST, PROVO'.format(i), 'score': 100}
+
+
+def make_store(path, keys, **options):
+    store = geocode.ResultStore(str(path), **options)
+    for i in keys:
+        store.put(key(i), response(i))
+        #: keeps the created times in put order
+        time.sleep(0.001)
+
+    return store
+
+
+def stored_keys(path):
+    store = geocode.ResultStore(str(path))
+    keys = sorted(int(row[0].split()[0]) for row in store._connection.execute('SELECT address FROM responses'))
+    store.close()
+
+    return keys
+
+
+def test_expired_responses_are_ignored_and_pruned(tmp_path):
+    store = make_store(tmp_path / 'store.sqlite', [1], ttlDays=1)
+    store._connection.execute('UPDATE responses SET created = ?', (time.time() - 2 * 24 * 60 * 60,))
+    store.put(key(2), response(2))
+
+    assert store.get(key(1)) is None
+    assert store.get(key(2)) == response(2)
+    store.close()
+    assert stored_keys(tmp_path / 'store.sqlite') == [2]
+
+
+def test_oldest_responses_over_the_limit_are_pruned(tmp_path):
+    make_store(tmp_path / 'store.sqlite', range(5), maxEntries=3).close()
+
+    assert stored_keys(tmp_path / 'store.sqlite') == [2, 3, 4]
+
+
+def test_missing_store_in_the_bucket_opens_empty(local_buckets, tmp_path):
+    store = geocode.open_result_store(str(tmp_path / 'store.sqlite'), 'stores', 'responses.sqlite', 90, 100)
+
+    assert len(store) == 0
+    store.close()
+
+
+def test_new_responses_are_merged_into_the_bucket(local_buckets, tmp_path):
+    (local_buckets / 'stores').mkdir()
+    make_store(local_buckets / 'stores' / 'responses.sqlite', [1]).close()
+    store = geocode.open_result_store(str(tmp_path / 'store.sqlite'), 'stores', 'responses.sqlite', 90, 100)
+    assert store.get(key(1)) == response(1)
+    store.put(key(2), response(2))
+
+    geocode.close_result_store(store, 'stores', 'responses.sqlite', 90, 100)
+
+    assert stored_keys(local_buckets / 'stores' / 'responses.sqlite') == [1, 2]
+
+
+def test_only_responses_since_the_store_opened_are_merged(local_buckets, tmp_path):
+    store = make_store(tmp_path / 'store.sqlite', [1])
+    since = time.time()
+    store.put(key(2), response(2))
+    store.close()
+
+    assert geocode.upload_result_store(str(tmp_path / 'store.sqlite'), since, 'stores', 'responses.sqlite', 90,
+                                       100) == 1
+    assert stored_keys(local_buckets / 'stores' / 'responses.sqlite') == [2]
+
+
+def test_store_changed_during_the_merge_is_merged_again(local_buckets, tmp_path, monkeypatch):
+    (local_buckets / 'stores').mkdir()
+    bucketPath = local_buckets / 'stores' / 'responses.sqlite'
+    make_store(bucketPath, [1]).close()
+    make_store(tmp_path / 'other.sqlite', [1, 3]).close()
+    make_store(tmp_path / 'store.sqlite', [2]).close()
+    merge = geocode.ResultStore.merge
+    merges = []
+
+    def mergeWhileAnotherJobUploads(store, sourcePath, since):
+        merges.append(sourcePath)
+        if len(merges) == 1:
+            #: another job finishes and uploads its responses between this job's download and upload
+            time.sleep(0.01)
+            shutil.copyfile(str(tmp_path / 'other.sqlite'), str(bucketPath))
+        merge(store, sourcePath, since)
+
+    monkeypatch.setattr(geocode.ResultStore, 'merge', mergeWhileAnotherJobUploads)
+
+    assert geocode.upload_result_store(str(tmp_path / 'store.sqlite'), 0, 'stores', 'responses.sqlite', 90, 100) == 3
+    assert len(merges) == 2
+    assert stored_keys(bucketPath) == [1, 2, 3]
+
+
+def test_merge_gives_up_after_the_attempt_limit(local_buckets, tmp_path, monkeypatch):
+    make_store(tmp_path / 'store.sqlite', [1]).close()
+    monkeypatch.setattr(geocode, 'RESULT_STORE_UPLOAD_ATTEMPTS', 2)
+
+    def upload(blob, filename, if_generation_match=None):
+        raise geocode.BlobPreconditionFailed('changed')
+
+    monkeypatch.setattr(geocode.LocalBlob, 'upload_from_filename', upload)
+
+    with pytest.raises(RuntimeError):
+        geocode.upload_result_store(str(tmp_path / 'store.sqlite'), 0, 'stores', 'responses.sqlite', 90, 100)
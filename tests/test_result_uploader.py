@@ -0,0 +1,75 @@
+"""ResultUploader part uploads, compose and part cleanup against LocalBucket."""
+import gzip
+
+import geocode_gcs_csv as geocode
+
+
+def write_rows(outputPath, uploader, rows):
+    """Append rows to the output and report a flush after each one, like ResultWriter."""
+    with open(str(outputPath), 'ab') as outputFile:
+        for row in rows:
+            outputFile.write(row)
+            outputFile.flush()
+            uploader.flushed(str(outputPath), outputPath.stat().st_size)
+
+
+def parts(local_buckets, prefix='results.csv.parts'):
+    return sorted(path.name for path in (local_buckets / 'output' / prefix).glob('*'))
+
+
+def test_parts_are_uploaded_while_writing_and_composed(local_buckets, tmp_path):
+    outputPath = tmp_path / 'results.csv'
+    uploader = geocode.ResultUploader('output', 'results.csv', 3600, partBytes=10)
+    rows = [b'header\n'] + ['{0},{0} N MAIN ST\n'.format(i).encode() for i in range(5)]
+
+    write_rows(outputPath, uploader, rows)
+    uploader.wait()
+    #: the header alone is under partBytes, so it goes with the first row
+    assert len(parts(local_buckets)) == 5
+
+    uploader.finish(str(outputPath))
+
+    assert (local_buckets / 'output' / 'results.csv').read_bytes() == b''.join(rows)
+    assert parts(local_buckets) == []
+
+
+def test_more_parts_than_one_compose_accepts(local_buckets, tmp_path):
+    outputPath = tmp_path / 'results.csv'
+    uploader = geocode.ResultUploader('output', 'results.csv', 3600, partBytes=1)
+    rows = ['{}\n'.format(i).encode() for i in range(geocode.MAX_COMPOSE_SOURCES * 2 + 5)]
+
+    write_rows(outputPath, uploader, rows)
+    uploader.finish(str(outputPath))
+
+    assert (local_buckets / 'output' / 'results.csv').read_bytes() == b''.join(rows)
+    assert parts(local_buckets) == []
+
+
+def test_compressed_parts_compose_into_one_compressed_object(local_buckets, tmp_path):
+    outputPath = tmp_path / 'results.csv'
+    uploader = geocode.ResultUploader('output', 'results.csv.gz', 3600, partBytes=10, compression='gzip')
+    rows = ['{0},{0} N MAIN ST\n'.format(i).encode() for i in range(5)]
+
+    write_rows(outputPath, uploader, rows)
+    uploader.finish(str(outputPath))
+
+    assert gzip.decompress((local_buckets / 'output' / 'results.csv.gz').read_bytes()) == b''.join(rows)
+
+
+def test_parts_of_an_earlier_attempt_are_deleted(local_buckets, tmp_path):
+    #: an attempt that was killed before it composed its parts, under a different run name
+    outputPath = tmp_path / 'results_run1.csv'
+    killed = geocode.ResultUploader('output', 'results_run1.csv', 3600, partBytes=1, partPrefix='uploads/input.parts/')
+    write_rows(outputPath, killed, [b'header\n', b'1\n', b'2\n'])
+    killed.wait()
+    assert len(parts(local_buckets, 'uploads/input.parts')) == 3
+
+    outputPath = tmp_path / 'results_run2.csv'
+    uploader = geocode.ResultUploader('output', 'results_run2.csv', 3600, partBytes=1,
+                                      partPrefix='uploads/input.parts/')
+    assert uploader.deleteParts() == 3
+    write_rows(outputPath, uploader, [b'header\n', b'1\n'])
+    uploader.finish(str(outputPath))
+
+    assert (local_buckets / 'output' / 'results_run2.csv').read_bytes() == b'header\n1\n'
+    assert parts(local_buckets, 'uploads/input.parts') == []
@@ -0,0 +1,79 @@
+"""ResultWriter flushes every flushRows rows or flushSeconds seconds and reports each flush."""
+import csv
+import os
+import time
+
+import geocode_gcs_csv as geocode
+
+
+class RecordingUploader(object):
+    """Records the file sizes ResultWriter reports."""
+
+    def __init__(self):
+        self.sizes = []
+
+    def flushed(self, outputFilePath, fileSize):
+        self.sizes.append(fileSize)
+
+
+def make_result(i):
+    return geocode.AddressResult(str(i), '{} N MAIN ST'.format(i), 'PROVO', '{} N MAIN ST'.format(i), 'PROVO', 100,
+                                 420000.5, 4500000.25, 'AddressPoints.AddressGrid')
+
+
+def test_rows_are_flushed_every_flush_rows(tmp_path):
+    outputPath = str(tmp_path / 'results.csv')
+    uploader = RecordingUploader()
+
+    with geocode.ResultWriter(outputPath, flushRows=3, flushSeconds=3600, resultUploader=uploader) as writer:
+        writer.writeHeader()
+        sizes = []
+        for i in range(7):
+            writer.writeResult(make_result(i))
+            sizes.append(os.path.getsize(outputPath))
+
+    #: nothing reaches the file until the third row, then nothing more until the sixth
+    assert sizes[0] == sizes[1] == 0
+    assert 0 < sizes[2] == sizes[3] == sizes[4] < sizes[5] == sizes[6]
+    assert uploader.sizes == [sizes[2], sizes[5], os.path.getsize(outputPath)]
+    assert writer.rowsWritten == 7
+    with open(outputPath) as output:
+        assert [row['INID'] for row in csv.DictReader(output)] == [str(i) for i in range(7)]
+
+
+def test_rows_are_flushed_after_flush_seconds(tmp_path):
+    outputPath = str(tmp_path / 'results.csv')
+
+    with geocode.ResultWriter(outputPath, flushRows=1000, flushSeconds=0.1) as writer:
+        writer.writeResult(make_result(0))
+        assert os.path.getsize(outputPath) == 0
+        time.sleep(0.15)
+        writer.writeResult(make_result(1))
+        assert os.path.getsize(outputPath) > 0
+
+
+def test_close_flushes_the_remaining_rows_once(tmp_path):
+    outputPath = str(tmp_path / 'results.csv')
+    uploader = RecordingUploader()
+    writer = geocode.ResultWriter(outputPath, flushRows=1000, flushSeconds=3600, resultUploader=uploader)
+    writer.writeResult(make_result(0))
+
+    writer.close()
+    writer.close()
+
+    assert uploader.sizes == [os.path.getsize(outputPath)]
+    assert open(outputPath).read().startswith('0,')
+
+
+def test_geocoded_table_reports_flushes_to_the_uploader(stub_api, tmp_path):
+    stub_api(not_found_rate=0)
+    inputPath = tmp_path / 'input.csv'
+    inputPath.write_text('id,address,zone\n' + ''.join('{0},{0} N MAIN ST,PROVO\n'.format(i) for i in range(20)))
+    uploader = RecordingUploader()
+
+    assert geocode.TableGeocoder('key', str(inputPath), 'id', 'address', 'zone', 'all', 26912, str(tmp_path),
+                                 'results.csv', None, flushRows=7, flushSeconds=3600, resultUploader=uploader).start()
+
+    assert len(uploader.sizes) >= 3
+    assert uploader.sizes == sorted(uploader.sizes)
+    assert uploader.sizes[-1] == os.path.getsize(str(tmp_path / 'results.csv'))
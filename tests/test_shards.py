@@ -0,0 +1,77 @@
+"""Row aligned byte range sharding of a csv blob."""
+import csv
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+import geocode_gcs_csv as geocode
+
+HEADER = b'id,address,zone\n'
+
+
+def make_blob(local_buckets, data):
+    (local_buckets / 'input').mkdir()
+    (local_buckets / 'input' / 'input.csv').write_bytes(data)
+
+    return geocode.get_bucket('input').blob('input.csv')
+
+
+def random_rows(count, seed=0):
+    rand = random.Random(seed)
+
+    return [b'%d,%s,PROVO\n' % (i, b'N' * rand.randint(0, 200)) for i in range(count)]
+
+
+def read_shard(blob, shardIndex, shardCount):
+    with geocode.open_shard_stream(blob, shardIndex, shardCount) as stream:
+        return [row['id'] for row in csv.DictReader(stream)]
+
+
+@pytest.mark.parametrize('rowCount, shardCount', [(1000, 1), (1000, 2), (1000, 7), (1000, 64), (3, 10), (0, 4)])
+def test_every_row_is_in_exactly_one_shard(local_buckets, monkeypatch, rowCount, shardCount):
+    #: scan for row boundaries a few bytes at a time so boundaries fall across scan blocks
+    monkeypatch.setattr(geocode, 'SHARD_SCAN_BYTES', 7)
+    blob = make_blob(local_buckets, HEADER + b''.join(random_rows(rowCount)))
+
+    shards = [read_shard(blob, shardIndex, shardCount) for shardIndex in range(shardCount)]
+
+    assert [rowId for shard in shards for rowId in shard] == [str(i) for i in range(rowCount)]
+
+
+def test_shard_ranges_are_contiguous(local_buckets):
+    data = HEADER + b''.join(random_rows(500))
+    blob = make_blob(local_buckets, data)
+
+    ranges = [geocode.shard_byte_range(blob, shardIndex, 5) for shardIndex in range(5)]
+
+    assert all(header == HEADER for header, _, _ in ranges)
+    assert ranges[0][1] == len(HEADER)
+    assert ranges[-1][2] == len(data)
+    assert all(ranges[i][2] == ranges[i + 1][1] for i in range(4))
+    assert all(start == len(HEADER) or data[start - 1:start] == b'\n' for _, start, _ in ranges)
+
+
+def test_last_row_without_a_newline(local_buckets):
+    blob = make_blob(local_buckets, HEADER + b''.join(random_rows(100)).rstrip(b'\n'))
+
+    shards = [read_shard(blob, shardIndex, 3) for shardIndex in range(3)]
+
+    assert [rowId for shard in shards for rowId in shard] == [str(i) for i in range(100)]
+
+
+@pytest.mark.parametrize('shardArgs', [['--shard_count', '4', '--shard_index', '4'],
+                                       ['--shard_count', '4', '--shard_index', '-1'],
+                                       ['--shard_count', '0']])
+def test_shard_arguments_are_validated(shardArgs):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'geocode_gcs_csv.py')
+    arguments = ['--apikey', 'key', '--input_bucket', 'input', '--input_csv', 'input.csv', '--id_field', 'id',
+                 '--address_field', 'address', '--zone_field', 'zone', '--output_bucket', 'output']
+
+    result = subprocess.run([sys.executable, script] + arguments + shardArgs, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+
+    assert result.returncode == 2
+    assert '--shard_' in result.stderr
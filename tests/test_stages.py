@@ -0,0 +1,139 @@
+"""BackgroundStage and OrderedPoolStage ordering, bounds and error propagation."""
+import csv
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import geocode_gcs_csv as geocode
+
+
+def failing(items, error):
+    for item in items:
+        yield item
+    raise error
+
+
+def test_background_stage_yields_items_in_order():
+    assert list(geocode.BackgroundStage(iter(range(100)), 4)) == list(range(100))
+
+
+def test_background_stage_buffers_at_most_maxsize_items():
+    produced = []
+
+    def produce():
+        for i in range(20):
+            produced.append(i)
+            yield i
+
+    stage = geocode.BackgroundStage(produce(), 3)
+    time.sleep(0.1)
+
+    #: three are buffered and the producer holds the fourth until there is room
+    assert stage.depth() == 3
+    assert len(produced) == 4
+    assert list(stage) == list(range(20))
+
+
+def test_background_stage_raises_the_producer_error_after_its_items():
+    stage = geocode.BackgroundStage(failing(range(3), ValueError('bad row')), 2)
+    items = []
+
+    with pytest.raises(ValueError, match='bad row'):
+        for item in stage:
+            items.append(item)
+
+    assert items == [0, 1, 2]
+
+
+def test_closed_background_stage_stops_producing():
+    produced = []
+
+    def produce():
+        for i in range(1000):
+            produced.append(i)
+            yield i
+
+    stage = geocode.BackgroundStage(produce(), 1)
+    next(iter(stage))
+    stage.close()
+    time.sleep(0.1)
+
+    assert len(produced) < 5
+
+
+def test_ordered_pool_stage_yields_results_in_input_order():
+    def slowFirst(i):
+        time.sleep(0.01 * (10 - i))
+        return i * i
+
+    with ThreadPoolExecutor(4) as executor:
+        assert list(geocode.OrderedPoolStage(executor, slowFirst, range(10), 4)) == [i * i for i in range(10)]
+
+
+def test_ordered_pool_stage_keeps_window_calls_in_flight():
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def call(i):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+        return i
+
+    with ThreadPoolExecutor(8) as executor:
+        stage = geocode.OrderedPoolStage(executor, call, range(20), 3)
+        assert list(stage) == list(range(20))
+
+    assert peak[0] == 3
+    assert stage.depth() == 0
+
+
+def test_ordered_pool_stage_raises_in_order_and_cancels_the_rest():
+    started = []
+
+    def call(i):
+        started.append(i)
+        if i == 2:
+            raise ValueError('bad chunk')
+        time.sleep(0.05)
+        return i
+
+    with ThreadPoolExecutor(1) as executor:
+        stage = geocode.OrderedPoolStage(executor, call, range(10), 4)
+        results = []
+        with pytest.raises(ValueError, match='bad chunk'):
+            for result in stage:
+                results.append(result)
+
+    assert results == [0, 1]
+    #: calls queued behind the failure are cancelled instead of run
+    assert max(started) < 9
+
+
+def test_ordered_pool_stage_raises_an_input_error():
+    with ThreadPoolExecutor(2) as executor:
+        stage = geocode.OrderedPoolStage(executor, str, failing(range(3), ValueError('bad input')), 2)
+
+        with pytest.raises(ValueError, match='bad input'):
+            list(stage)
+
+
+@pytest.mark.parametrize('formatProcesses', [0, 2])
+def test_geocoded_rows_keep_input_order_across_chunks(stub_api, tmp_path, formatProcesses):
+    stub_api(not_found_rate=0)
+    rows = geocode.READ_CHUNK_ROWS * 2 + 10
+    inputPath = tmp_path / 'input.csv'
+    inputPath.write_text('id,address,zone\n' + ''.join('{0},{0} N MAIN ST,PROVO\n'.format(i) for i in range(rows)))
+
+    assert geocode.TableGeocoder('key', str(inputPath), 'id', 'address', 'zone', 'all', 26912, str(tmp_path),
+                                 'results.csv', None, workers=4, readAheadChunks=1, initialRate=100000,
+                                 formatProcesses=formatProcesses).start()
+
+    with open(str(tmp_path / 'results.csv')) as results:
+        assert [row['INID'] for row in csv.DictReader(results)] == [str(i) for i in range(rows)]
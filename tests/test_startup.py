@@ -0,0 +1,111 @@
+"""Lazy imports and the background api key and version checks."""
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import geocode_gcs_csv as geocode
+from stub_api import StubGeocodeHandler
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+class SlowHandler(StubGeocodeHandler):
+    def do_GET(self):
+        time.sleep(0.3)
+        StubGeocodeHandler.do_GET(self)
+
+
+class InvalidKeyHandler(StubGeocodeHandler):
+    def do_GET(self):
+        self._send(400, {'status': 400, 'message': 'Invalid API key'})
+
+
+class VersionHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        data = json.dumps({'VERSION_NUMBER': self.server.version}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def write_input(inputPath):
+    inputPath.write_text('id,address,zone\n' + ''.join('{0},{0} N MAIN ST,PROVO\n'.format(i) for i in range(5)))
+
+
+def test_import_does_not_load_optional_packages(local_buckets):
+    script = ('import sys, geocode_gcs_csv\n'
+              'geocode_gcs_csv.LOCAL_BUCKET_DIR = sys.argv[1]\n'
+              'geocode_gcs_csv.get_bucket("output").blob("results.csv")\n'
+              'print(sorted(name for name in ("google.cloud.storage", "pyarrow", "zstandard") if name in sys.modules))')
+    output = subprocess.check_output([sys.executable, '-W', 'ignore', '-c', script, str(local_buckets)], cwd=REPO_DIR)
+
+    assert output.decode('utf-8').strip() == '[]'
+
+
+def test_api_key_is_checked_in_the_background(stub_api):
+    server = stub_api()
+    server.RequestHandlerClass = SlowHandler
+    start = time.time()
+
+    check = geocode.check_api_key('key')
+
+    assert time.time() - start < 0.2
+    assert not check.done()
+    assert check.result(5) == 'Api key is valid'
+
+
+def test_invalid_api_key_stops_the_run_before_any_request(stub_api, tmp_path):
+    server = stub_api()
+    server.RequestHandlerClass = InvalidKeyHandler
+    check = geocode.check_api_key('bad key')
+    assert check.result(5) == 'Error: Invalid API key'
+    inputPath = tmp_path / 'input.csv'
+    write_input(inputPath)
+
+    assert not geocode.TableGeocoder('bad key', str(inputPath), 'id', 'address', 'zone', 'all', 26912, str(tmp_path),
+                                     'results.csv', None, apiKeyCheck=check).start()
+    assert server.requests == 0
+
+
+def test_run_waits_for_the_api_key_check_instead_of_checking_again(stub_api, tmp_path, monkeypatch):
+    stub_api(not_found_rate=0)
+    metrics = geocode.Metrics()
+    monkeypatch.setattr(geocode, 'metrics', metrics)
+    check = Future()
+    threading.Timer(0.2, check.set_result, args=('Api key is valid',)).start()
+    inputPath = tmp_path / 'input.csv'
+    write_input(inputPath)
+
+    assert geocode.TableGeocoder('key', str(inputPath), 'id', 'address', 'zone', 'all', 26912, str(tmp_path),
+                                 'results.csv', None, apiKeyCheck=check).start()
+    #: only the rows were requested
+    assert metrics.counter('geocode_responses_total', status='200') == 5
+
+
+def test_newer_version_is_logged(caplog):
+    server = HTTPServer(('127.0.0.1', 0), VersionHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:{}/tool-version.json'.format(server.server_address[1])
+
+    try:
+        with caplog.at_level('INFO', logger='geocoder'):
+            server.version = geocode.VERSION_NUMBER
+            geocode.log_version_check(url)
+            assert caplog.text == ''
+
+            server.version = '99.0.0'
+            geocode.log_version_check(url)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert 'Current version is: 99.0.0' in caplog.text
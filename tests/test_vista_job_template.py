@@ -0,0 +1,106 @@
+"""vista_job_template skips uploading files whose blob already has the same CRC32C or MD5."""
+import base64
+import hashlib
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('jinja2')
+pytest.importorskip('google.cloud.storage')
+google_crc32c = pytest.importorskip('google_crc32c')
+import vista_job_template  # noqa: E402
+
+
+class StoredBlob(object):
+    """Blob metadata the way cloud storage reports it."""
+
+    def __init__(self, path, composite=False):
+        with open(path, 'rb') as blobFile:
+            data = blobFile.read()
+        self.crc32c = base64.b64encode(google_crc32c.Checksum(data).digest()).decode('utf-8')
+        #: composite objects have no md5
+        self.md5_hash = None if composite else base64.b64encode(hashlib.md5(data).digest()).decode('utf-8')
+
+
+class UploadBlob(object):
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    def upload_from_filename(self, filename):
+        with open(filename, 'rb') as source, open(os.path.join(self.bucket.path, self.name), 'wb') as destination:
+            destination.write(source.read())
+        self.bucket.uploads.append(self.name)
+
+
+class DirectoryBucket(object):
+    """Bucket stand-in over a LocalBucket directory that reports checksums."""
+
+    def __init__(self, path, composite=False):
+        self.path = path
+        self.composite = composite
+        self.uploads = []
+
+    def get_blob(self, name):
+        path = os.path.join(self.path, name)
+        return StoredBlob(path, self.composite) if os.path.isfile(path) else None
+
+    def blob(self, name):
+        return UploadBlob(self, name)
+
+
+@pytest.fixture
+def bucket(local_buckets, monkeypatch):
+    (local_buckets / 'upload').mkdir()
+    bucket = DirectoryBucket(str(local_buckets / 'upload'))
+    monkeypatch.setattr(vista_job_template, 'get_bucket', lambda bucket_name: bucket)
+
+    return bucket
+
+
+def test_unchanged_file_is_not_uploaded_again(bucket, tmp_path):
+    csvPath = tmp_path / 'part0.csv'
+    csvPath.write_text('id,address,zone\n1,1 N MAIN ST,PROVO\n')
+
+    assert vista_job_template.upload_blob('upload', str(csvPath), 'part0.csv')
+    assert not vista_job_template.upload_blob('upload', str(csvPath), 'part0.csv')
+
+    csvPath.write_text('id,address,zone\n1,2 N MAIN ST,PROVO\n')
+    assert vista_job_template.upload_blob('upload', str(csvPath), 'part0.csv')
+    assert bucket.uploads == ['part0.csv', 'part0.csv']
+
+
+def test_composite_blob_is_matched_on_crc32c(bucket, tmp_path):
+    csvPath = tmp_path / 'part0.csv'
+    csvPath.write_text('id,address,zone\n')
+    vista_job_template.upload_blob('upload', str(csvPath), 'part0.csv')
+    bucket.composite = True
+
+    assert not vista_job_template.upload_blob('upload', str(csvPath), 'part0.csv')
+
+
+def test_md5_is_used_without_google_crc32c(bucket, tmp_path, monkeypatch):
+    csvPath = tmp_path / 'part0.csv'
+    csvPath.write_text('id,address,zone\n')
+    vista_job_template.upload_blob('upload', str(csvPath), 'part0.csv')
+    monkeypatch.setitem(sys.modules, 'google_crc32c', None)
+
+    assert vista_job_template._file_checksums(str(csvPath))[0] is None
+    assert not vista_job_template.upload_blob('upload', str(csvPath), 'part0.csv')
+
+
+def test_regzipped_csv_is_not_uploaded_again(bucket, tmp_path, monkeypatch):
+    csvDir = tmp_path / 'job_uploads'
+    csvDir.mkdir()
+    (csvDir / 'part0.csv').write_text('id,address,zone\n1,1 N MAIN ST,PROVO\n')
+    monkeypatch.setattr(vista_job_template, 'UPLOAD_BUCKET', 'upload')
+
+    args = vista_job_template.get_template_args(str(csvDir), 'id', 'address', 'zone', 'upload', 'results',
+                                                compress=True)
+    #: a gzip made again from the same csv has the same bytes
+    os.remove(str(tmp_path / 'job_uploads_gz' / 'part0.csv.gz'))
+    vista_job_template.get_template_args(str(csvDir), 'id', 'address', 'zone', 'upload', 'results', compress=True)
+
+    assert [arg['csv_name'] for arg in args] == ['part0.csv.gz']
+    assert bucket.uploads == ['part0.csv.gz']
@@ -0,0 +1,178 @@
+"""
+Join geocoding results onto a VISTA export without ArcGIS.
+
+Builds a hash index of the GeocodeResults_*.csv files on INID, streams the VISTA export joining on RESIDENCE_ID
+and computes Distance_Meters with numpy a chunk at a time using the same rules as combine_results.dist.
+AGRC_Precinct is not written, it needs the VistaBallotAreas overlay that combine_results runs in ArcGIS.
+Files are read and written as utf-8.
+
+python vista/join_results.py vista_export.csv results/GeocodeResults_*.csv --output vista_joined.csv
+"""
+import argparse
+import csv
+import glob
+import gzip
+import io
+import itertools
+import os
+import time
+
+import numpy as np
+
+VISTA_ID_FIELD = 'RESIDENCE_ID'
+VISTA_X_FIELD = 'VISTA_X'
+VISTA_Y_FIELD = 'VISTA_Y'
+RESULT_ID_FIELD = 'INID'
+#: combine_results.ADD_RESULT_FIELDS and the geocode result field each one is filled from. AGRC_Precinct is left out,
+#: it comes from the VistaBallotAreas identity overlay in combine_results, not from the geocode results
+RESULT_FIELD_MAP = (
+    ('AGRC_MatchAddress', 'MatchAddress'),
+    ('AGRC_Zone', 'Zone'),
+    ('AGRC_MatchScore', 'Score'),
+    ('AGRC_X', 'XCoord'),
+    ('AGRC_Y', 'YCoord'),
+    ('AGRC_Geocoder', 'Geocoder'),
+)
+DISTANCE_FIELD = 'Distance_Meters'
+CHUNK_ROWS = 100000
+
+
+def _read_results(result_path):
+    """Yield result rows as dicts from a results csv, gzip or zstd compressed csv, or parquet file."""
+    if result_path.endswith('.parquet'):
+        import pyarrow.parquet
+
+        parquet_file = pyarrow.parquet.ParquetFile(result_path)
+        for batch in parquet_file.iter_batches():
+            for row in batch.to_pylist():
+                yield {field: '' if value is None else str(value) for field, value in row.items()}
+        return
+
+    if result_path.endswith('.gz'):
+        result_csv = gzip.open(result_path, 'rt', encoding='utf-8', newline='')
+    elif result_path.endswith('.zst'):
+        import zstandard
+
+        result_csv = io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(result_path, 'rb'),
+                                                                                read_across_frames=True),
+                                      encoding='utf-8', newline='')
+    else:
+        result_csv = open(result_path, encoding='utf-8', newline='')
+    with result_csv:
+        for row in csv.DictReader(result_csv):
+            yield row
+
+
+def load_result_index(result_paths):
+    """
+    Hash index of geocode results keyed on INID.
+
+    Values are tuples in RESULT_FIELD_MAP order. Fields a result file does not have are empty.
+    A later result for the same INID replaces an earlier one.
+    """
+    index = {}
+    duplicates = 0
+    for result_path in result_paths:
+        for row in _read_results(result_path):
+            result_id = row[RESULT_ID_FIELD]
+            if result_id in index:
+                duplicates += 1
+            index[result_id] = tuple(row.get(result_field) or '' for _, result_field in RESULT_FIELD_MAP)
+        print(result_path, 'indexed')
+    if duplicates:
+        print(duplicates, 'duplicate results replaced')
+
+    return index
+
+
+def _to_float(values):
+    """Float array of csv values. Empty and unparsable values are nan."""
+    text = np.array(values, dtype=str)
+    text[text == ''] = 'nan'
+    try:
+        return text.astype(float)
+    except ValueError:
+        pass
+
+    array = np.full(len(values), np.nan)
+    for i, value in enumerate(values):
+        try:
+            array[i] = float(value)
+        except ValueError:
+            pass
+
+    return array
+
+
+def distance_meters(vista_x, vista_y, agrc_x, agrc_y):
+    """
+    Vectorized combine_results.dist.
+
+    Distance between the VISTA and AGRC points for each row, nan where a coordinate is missing or zero
+    or where none of the coordinates are positive.
+    """
+    coordinates = (vista_x, vista_y, agrc_x, agrc_y)
+    valid = np.logical_and.reduce([np.isfinite(c) & (c != 0) for c in coordinates])
+    valid &= np.logical_or.reduce([c > 0 for c in coordinates])
+    with np.errstate(invalid='ignore'):
+        distance = np.hypot(agrc_x - vista_x, agrc_y - vista_y)
+    distance[~valid] = np.nan
+
+    return distance
+
+
+def join_results(vista_path, index, output_path, chunk_rows=CHUNK_ROWS):
+    """
+    Left join the results index onto the VISTA csv and write the joined csv.
+
+    Returns (rows, matched).
+    """
+    rows = 0
+    matched = 0
+    missing = ('',) * len(RESULT_FIELD_MAP)
+    agrc_x_column = [agrc_field for agrc_field, _ in RESULT_FIELD_MAP].index('AGRC_X')
+    with open(vista_path, encoding='utf-8', newline='') as vista_csv, \
+            open(output_path, 'w', encoding='utf-8', newline='') as output_csv:
+        reader = csv.reader(vista_csv)
+        fields = next(reader)
+        id_column = fields.index(VISTA_ID_FIELD)
+        x_column = fields.index(VISTA_X_FIELD)
+        y_column = fields.index(VISTA_Y_FIELD)
+        writer = csv.writer(output_csv)
+        writer.writerow(fields + [agrc_field for agrc_field, _ in RESULT_FIELD_MAP] + [DISTANCE_FIELD])
+
+        chunk = list(itertools.islice(reader, chunk_rows))
+        while chunk:
+            results = [index.get(row[id_column], missing) for row in chunk]
+            distance = distance_meters(_to_float([row[x_column] for row in chunk]),
+                                       _to_float([row[y_column] for row in chunk]),
+                                       _to_float([result[agrc_x_column] for result in results]),
+                                       _to_float([result[agrc_x_column + 1] for result in results]))
+            distance_text = ['' if np.isnan(d) else repr(d) for d in distance.tolist()]
+            writer.writerows(row + list(result) + [d] for row, result, d in zip(chunk, results, distance_text))
+
+            rows += len(chunk)
+            matched += sum(1 for result in results if result is not missing)
+            chunk = list(itertools.islice(reader, chunk_rows))
+
+    return rows, matched
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Join geocode results onto VISTA data')
+    parser.add_argument('vista_csv', help='VISTA export with RESIDENCE_ID, VISTA_X and VISTA_Y fields.')
+    parser.add_argument('results', nargs='+',
+                        help='Geocode result csv, .csv.gz, .csv.zst or parquet files. Glob patterns are expanded.')
+    parser.add_argument('--output', action='store', dest='output', default='vista_geocode_results.csv')
+    parser.add_argument('--chunk_rows', action='store', dest='chunk_rows', type=int, default=CHUNK_ROWS,
+                        help='VISTA rows joined at a time.')
+    args = parser.parse_args()
+
+    start = time.time()
+    result_paths = sorted(set(itertools.chain.from_iterable(glob.glob(pattern) or [pattern]
+                                                            for pattern in args.results)))
+    result_index = load_result_index(result_paths)
+    print(len(result_index), 'results indexed in', round(time.time() - start, 1), 'seconds')
+    total_rows, total_matched = join_results(args.vista_csv, result_index, args.output, args.chunk_rows)
+    print(total_rows, 'VISTA rows joined,', total_matched, 'matched, written to', os.path.abspath(args.output))
+    print('total seconds', round(time.time() - start, 1))
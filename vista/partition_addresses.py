@@ -0,0 +1,107 @@
+"""
+Partition a VISTA address CSV into shard CSVs for cloud geocoding.
+
+Rows are keyed on their normalized (address, zone) from AddressFormatter, the same key the geocoder caches on,
+and sent to the shard picked by a crc32 digest of the key, so every copy of an address lands in the same shard
+and is only geocoded once by that pod. The digest spreads unique addresses evenly, which balances the geocoding
+work rather than the row count, keeps no state per address and gives the same shards in every process.
+Invalid rows cost no requests and are spread over the shards to even out file sizes.
+The input is read once and every shard is written as it is read.
+
+python vista/partition_addresses.py addresses.csv --parts 50 --output_dir job_uploads
+"""
+import argparse
+import csv
+import os
+import sys
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from geocode_gcs_csv import AddressFormatter  # noqa: E402
+
+SHARD_NAME = 'addr_part_{}.csv'
+
+
+def shard_for_key(key, parts):
+    """Shard of a normalized address key. Stable across processes, unlike hash."""
+    return zlib.crc32('\x1f'.join(key).encode('utf-8')) % parts
+
+
+def address_key(address, zone):
+    """Normalized (address, zone) key or None when the address can not be geocoded."""
+    try:
+        formatted = AddressFormatter('', address, zone)
+    except UnicodeEncodeError:
+        return None
+    if not formatted.isValid():
+        return None
+
+    return (formatted.address, formatted.zone)
+
+
+class ShardStats(object):
+    """Rows written to a shard, split into geocodable addresses and invalid rows."""
+
+    def __init__(self, path):
+        """ctor."""
+        self.path = path
+        self.rows = 0
+        self.addresses = 0
+        self.invalid = 0
+
+
+def partition_csv(csv_path, parts, output_dir, address_field, zone_field, name=SHARD_NAME):
+    """
+    Split csv_path into parts shard CSVs in output_dir in one pass.
+
+    Returns a ShardStats for each shard.
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    shards = [ShardStats(os.path.join(output_dir, name.format(i))) for i in range(parts)]
+    next_invalid = 0
+    shard_files = [open(shard.path, 'w', newline='') for shard in shards]
+    try:
+        with open(csv_path, newline='') as input_csv:
+            reader = csv.reader(input_csv)
+            fields = next(reader)
+            address_column = fields.index(address_field)
+            zone_column = fields.index(zone_field)
+            writers = [csv.writer(shard_file) for shard_file in shard_files]
+            for writer in writers:
+                writer.writerow(fields)
+
+            for row in reader:
+                key = address_key(row[address_column], row[zone_column])
+                if key is None:
+                    shard_index = next_invalid
+                    next_invalid = (next_invalid + 1) % parts
+                    shards[shard_index].invalid += 1
+                else:
+                    shard_index = shard_for_key(key, parts)
+                    shards[shard_index].addresses += 1
+
+                writers[shard_index].writerow(row)
+                shards[shard_index].rows += 1
+    finally:
+        for shard_file in shard_files:
+            shard_file.close()
+
+    return shards
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Partition an address CSV into shard CSVs')
+    parser.add_argument('csv_path', help='Address CSV exported from VISTA.')
+    parser.add_argument('--parts', action='store', dest='parts', type=int, required=True)
+    parser.add_argument('--output_dir', action='store', dest='output_dir', default='job_uploads')
+    parser.add_argument('--address_field', action='store', dest='address_field', default='VISTA_ADDRESS')
+    parser.add_argument('--zone_field', action='store', dest='zone_field', default='VISTA_CITY')
+    args = parser.parse_args()
+
+    shard_stats = partition_csv(args.csv_path, args.parts, args.output_dir, args.address_field, args.zone_field)
+    for stats in shard_stats:
+        print(os.path.basename(stats.path), 'rows', stats.rows, 'addresses', stats.addresses,
+              'invalid', stats.invalid)
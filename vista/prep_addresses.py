@@ -4,6 +4,8 @@ import os
 import sys
 import csv
 
+from partition_addresses import partition_csv
+
 query = """
 SELECT
 ar.RESIDENCE_ID as UNIQUE_ID,
@@ -21,40 +23,18 @@ ON
 ar.PRECINCT_ID = p.PRECINCT_ID
 """
 
-partition_field = 'partition'
-
 
-def partition_table(path, parts, county_ids=[]):
-    """Add partition field and assign partition number."""
+def export_csv(path, csv_path, county_ids=[]):
+    """Export the address table to a CSV for partition_addresses."""
     county_where = None
     if len(county_ids) > 0:
         county_where = 'COUNTYID in ({})'.format(','.join(str(x) for x in county_ids))
-    arcpy.AddField_management(path, partition_field, 'SHORT')
-    row_count = 0
-    with arcpy.da.UpdateCursor(path, partition_field, county_where) as cursor:
+    with arcpy.da.SearchCursor(path, '*', county_where) as cursor,\
+            open(csv_path, 'w', newline='') as out_csv:
+        csv_writer = csv.writer(out_csv)
+        csv_writer.writerow(cursor.fields)
         for row in cursor:
-            row[0] = row_count % parts
-            cursor.updateRow(row)
-            row_count += 1
-
-
-def separate_partitions(parts_table_path, parts, workspace, csv_folder):
-    """Separate partions into new CSVs."""
-    tables = []
-    for i in range(parts):
-        layer_name = 'addr_part_{}'.format(i)
-        part_where = '{} = {}'.format(partition_field, i)
-        arcpy.MakeTableView_management(parts_table_path, layer_name, part_where)
-        tables.append(arcpy.CopyRows_management(layer_name, os.path.join(workspace, layer_name))[0])
-    for t in tables:
-        with arcpy.da.SearchCursor(t, '*') as cursor,\
-            open(os.path.join(csv_folder, os.path.basename(t) + '.csv'), 'w') as out_csv:
-            csv_writer = csv.writer(out_csv)
-            fields = cursor.fields
-            csv_writer.writerow(fields)
-            for row in cursor:
-                csv_writer.writerow(row)
-
+            csv_writer.writerow(row)
 
 
 if __name__ == '__main__':
@@ -86,6 +66,8 @@ if __name__ == '__main__':
     address_table = arcpy.TableToTable_conversion(vista_tableview,
                                                   output_workspace,
                                                   output_vista_data_table)[0]
-    partition_table(address_table, 3, [18])
     print('Data created:', address_table)
-    separate_partitions(address_table, 3, output_workspace, csv_folder)
+    address_csv = os.path.join(output_folder, output_vista_data_table + '.csv')
+    export_csv(address_table, address_csv, [18])
+    for shard in partition_csv(address_csv, 3, csv_folder, 'VISTA_ADDRESS', 'VISTA_CITY'):
+        print(shard.path, 'rows', shard.rows, 'addresses', shard.addresses)
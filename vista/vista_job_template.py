@@ -1,32 +1,106 @@
 """Create Kubernetes job templates for and upload files for geocoding."""
 import jinja2
 from os import listdir, mkdir
-from os.path import isfile, join, exists, basename
+from os.path import isfile, join, exists, basename, getmtime
 import sys
 import base64
+import gzip
+import hashlib
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from google.cloud import storage
 
 GCS_UPLOAD_KEY = '../.secrets/gcs-geocode-writer.json'
+UPLOAD_WORKERS = 16
+HASH_BLOCK_BYTES = 1024 * 1024
+
+_storage_client = None
+
+
+def get_bucket(bucket_name):
+    """Get a bucket from the shared storage client."""
+    global _storage_client
+    if _storage_client is None:
+        _storage_client = storage.Client.from_service_account_json(GCS_UPLOAD_KEY)
+
+    return _storage_client.bucket(bucket_name)
+
+
+def _file_checksums(file_name):
+    """Base64 CRC32C, when google-crc32c is installed, and MD5 of a file as cloud storage reports them."""
+    try:
+        import google_crc32c
+        crc32c = google_crc32c.Checksum()
+    except ImportError:
+        crc32c = None
+    md5 = hashlib.md5()
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b''):
+            md5.update(block)
+            if crc32c is not None:
+                crc32c.update(block)
+
+    return (base64.b64encode(crc32c.digest()).decode('utf-8') if crc32c is not None else None,
+            base64.b64encode(md5.digest()).decode('utf-8'))
 
 
 def upload_blob(bucket_name, source_file_name, destination_blob_name):
-    """Uploads a file to the bucket."""
-    storage_client = storage.Client.from_service_account_json(GCS_UPLOAD_KEY)
-    bucket = storage_client.get_bucket(bucket_name)
-    blob = bucket.blob(destination_blob_name)
+    """Uploads a file to the bucket unless the blob already has the same contents. Returns True if uploaded."""
+    bucket = get_bucket(bucket_name)
+    blob = bucket.get_blob(destination_blob_name)
+    if blob is not None:
+        crc32c, md5 = _file_checksums(source_file_name)
+        if (crc32c is not None and blob.crc32c == crc32c) or (blob.md5_hash is not None and blob.md5_hash == md5):
+            return False
+    bucket.blob(destination_blob_name).upload_from_filename(source_file_name)
+
+    return True
+
+
+def upload_blobs(bucket_name, uploads):
+    """Upload (source_file_name, destination_blob_name) pairs in parallel, skipping unchanged blobs."""
+    def upload(source_destination):
+        return upload_blob(bucket_name, *source_destination)
+
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+        for (_, destination_blob_name), uploaded in zip(uploads, executor.map(upload, uploads)):
+            print(destination_blob_name, 'uploaded' if uploaded else 'unchanged')
 
-    blob.upload_from_filename(source_file_name)
+
+def gzip_csv(csv_path, output_dir):
+    """
+    Gzip a csv into output_dir unless the gzip is newer than the csv. Returns the gzip path.
+
+    The gzip header has no timestamp or name so an unchanged csv compresses to the same bytes and is not uploaded again.
+    """
+    gzip_path = join(output_dir, basename(csv_path) + '.gz')
+    if not exists(gzip_path) or getmtime(gzip_path) < getmtime(csv_path):
+        with open(csv_path, 'rb') as csv_file, open(gzip_path, 'wb') as gzip_file:
+            with gzip.GzipFile(filename='', fileobj=gzip_file, mode='wb', compresslevel=6, mtime=0) as compressed:
+                shutil.copyfileobj(csv_file, compressed, HASH_BLOCK_BYTES)
+
+    return gzip_path
 
 UPLOAD_BUCKET = 'geocoder-csv-storage-95728'
 
-def get_template_args(csv_directory, id_field, address_field, zone_field, upload_bucket, results_bucket, upload=True):
-    """Get job template args from csv files in upload directory and optionally upload csvs to Cloud Storage."""
+def get_template_args(csv_directory, id_field, address_field, zone_field, upload_bucket, results_bucket, upload=True,
+                      compress=False):
+    """
+    Get job template args from csv files in upload directory and optionally upload csvs to Cloud Storage.
+
+    With compress the csvs are gzipped into a sibling directory and the jobs read the gzipped csvs.
+    """
     job_csvs = [f for f in listdir(csv_directory) if isfile(join(csv_directory, f))]
+    upload_directory = csv_directory
+    if compress:
+        upload_directory = csv_directory.rstrip('/\\') + '_gz'
+        if not exists(upload_directory):
+            mkdir(upload_directory)
+        job_csvs = [basename(gzip_csv(join(csv_directory, job_csv), upload_directory)) for job_csv in job_csvs]
+    if upload:
+        upload_blobs(UPLOAD_BUCKET, [(join(upload_directory, job_csv), job_csv) for job_csv in job_csvs])
     job_template_args = []
     for job_num, job_csv in enumerate(job_csvs):
-        if upload:
-            upload_blob(UPLOAD_BUCKET, join(csv_directory, job_csv), job_csv)
-            print(job_csv, 'uploaded')
         job_template_args.append({
             'job_number': job_num,
             'csv_name': job_csv,
@@ -38,24 +112,40 @@ def get_template_args(csv_directory, id_field, address_field, zone_field, upload
         })
     return job_template_args
 
+def get_indexed_template_args(csv_path, shard_count, id_field, address_field, zone_field, upload_bucket, results_bucket, upload=True):
+    """Get Indexed Job template args that split one csv across shard_count pods and optionally upload the csv."""
+    job_csv = basename(csv_path)
+    if upload:
+        upload_blobs(UPLOAD_BUCKET, [(csv_path, job_csv)])
+    return [{
+        'job_number': 0,
+        'csv_name': job_csv,
+        'id_field': id_field,
+        'address_field': address_field,
+        'zone_field': zone_field,
+        'upload_bucket': upload_bucket,
+        'results_bucket': results_bucket,
+        'shard_count': shard_count
+    }]
+
 def create_job_ymls(job_template_args, job_template_dir, job_template_name, output_dir, upload=True):
     """Create k8s job specs that can deployed to cluster to start geocoding."""
+    template_loader = jinja2.FileSystemLoader(searchpath=job_template_dir)
+    template_env = jinja2.Environment(loader=template_loader)
+    template = template_env.get_template(job_template_name)
+    if not exists(output_dir):
+        mkdir(output_dir)
+
+    uploads = []
     for i, template_args in enumerate(job_template_args):
-        template_loader = jinja2.FileSystemLoader(searchpath=job_template_dir)
-        template_env = jinja2.Environment(loader=template_loader)
-        template_file = job_template_name
-        template = template_env.get_template(template_file)
         output_text = template.render(template_args)
         job_yml = 'vista-job-{}.yml'.format(i)
         job_yml_path = join(output_dir, job_yml)
-        
-        if not exists(output_dir):
-            mkdir(output_dir)
         with open(job_yml_path, 'w') as output_template:
             output_template.write(output_text)
-        if upload:
-            upload_blob(UPLOAD_BUCKET, job_yml_path, job_yml)
-            print(job_yml, 'uploaded')
+        uploads.append((job_yml_path, job_yml))
+    if upload:
+        upload_blobs(UPLOAD_BUCKET, uploads)
 
 def create_secret_yml(secret_template_dir, secret_template_name, gcs_key_name, upload=True):
     base64_key = None
@@ -76,8 +166,7 @@ def create_secret_yml(secret_template_dir, secret_template_name, gcs_key_name, u
     with open(secret_yml_path, 'w') as output_template:
         output_template.write(output_text)
     if upload:
-        upload_blob(UPLOAD_BUCKET, secret_yml_path, secret_yml)
-        print(secret_yml, 'uploaded')
+        upload_blobs(UPLOAD_BUCKET, [(secret_yml_path, secret_yml)])
 
 if __name__ == '__main__':
     csv_directory = 'data/job_uploads'
@@ -86,14 +175,32 @@ if __name__ == '__main__':
     zone_field = 'VISTA_CITY'
     upload_bucket = 'geocoder-csv-storage-95728'
     results_bucket = 'geocoder-csv-results-98576'
+    # Set to split a single csv across pods with an Indexed Job instead of one job per csv
+    indexed_csv = None
+    shard_count = 50
+    # Set to upload gzipped partition csvs as <name>.csv.gz instead of <name>.csv. The jobs read the .gz blobs and
+    # the .csv blobs of an earlier upload are left in the bucket. Indexed Jobs split the csv by bytes so it is
+    # always uploaded uncompressed
+    compress_csvs = False
     # Create arguments for job template
-    job_template_args = get_template_args(
-        csv_directory,
-        id_field,
-        address_field,
-        zone_field,
-        upload_bucket,
-        results_bucket)
+    if indexed_csv:
+        job_template_args = get_indexed_template_args(
+            indexed_csv,
+            shard_count,
+            id_field,
+            address_field,
+            zone_field,
+            upload_bucket,
+            results_bucket)
+    else:
+        job_template_args = get_template_args(
+            csv_directory,
+            id_field,
+            address_field,
+            zone_field,
+            upload_bucket,
+            results_bucket,
+            compress=compress_csvs)
     # Use arguments to create and upload template
     job_template_dir = '../.kube'
     job_template_name = 'geocoder-template.yml.jinja2'